@@ -0,0 +1,27 @@
+"""Benchmarks for psqlgraph hot paths.
+
+Each module is runnable on its own from the repository root, e.g.::
+
+    python -m bench.properties
+
+Benchmarks that only exercise model code need no database.  Those that
+do read the same ``PG_*`` environment variables as the test suite.
+"""
+import os
+import timeit
+
+
+def pg_conf():
+    return {
+        "host": os.getenv("PG_HOST", "localhost"),
+        "user": os.getenv("PG_USER", "test"),
+        "password": os.getenv("PG_PASS", "test"),
+        "database": os.getenv("PG_NAME", "automated_test"),
+    }
+
+
+def report(name, func, number, unit="ops"):
+    """Time `func` called `number` times (best of 3) and print throughput"""
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    print(f"{name:<40} {number / best:>14,.0f} {unit}/s")
+    return best
@@ -0,0 +1,65 @@
+"""Update throughput with history (voided snapshots) enabled.
+
+    python -m bench.history [--nodes N]
+
+Needs a database, see ``bench.pg_conf``.  Each round updates a property
+on every node in a single flush, so every node is snapshotted into
+``_voided_nodes``.
+"""
+import argparse
+import time
+
+from bench import pg_conf
+from psqlgraph import PsqlGraphDriver, VoidedNode, ext, pg_property
+from psqlgraph.base import create_all
+
+NAMESPACE = "bench_history"
+
+HistoryNode, HistoryEdge = ext.register_base_class(package_namespace=NAMESPACE)
+
+
+class Versioned(HistoryNode):
+    @pg_property(int)
+    def version(self, value):
+        self._set_property("version", value)
+
+    @pg_property(str)
+    def name(self, value):
+        self._set_property("name", value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    g = PsqlGraphDriver(package_namespace=NAMESPACE, **pg_conf())
+    orm_base = ext.get_orm_base(NAMESPACE)
+    orm_base.metadata.drop_all(g.engine)
+    create_all(g.engine, base=orm_base)
+
+    with g.session_scope() as session:
+        session.add_all(
+            Versioned(node_id=f"v{i}", version=0, name=f"node {i}") for i in range(args.nodes)
+        )
+
+    best = None
+    for round_ in range(1, args.rounds + 1):
+        start = time.perf_counter()
+        with g.session_scope():
+            for node in g.nodes(Versioned):
+                node.version = round_
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{'update with history':<40} {args.nodes / best:>14,.0f} nodes/s")
+
+    # Leave the shared history tables as they were
+    with g.session_scope() as session:
+        session.query(VoidedNode).filter(VoidedNode.label == Versioned.get_label()).delete()
+    orm_base.metadata.drop_all(g.engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Property get/set throughput on a model with many properties.
+
+    python -m bench.properties
+"""
+from sqlalchemy.orm import configure_mappers
+
+from bench import report
+from psqlgraph import ext, pg_property
+
+PROPERTY_COUNT = 60
+
+BenchNode, BenchEdge = ext.register_base_class(package_namespace="bench_properties")
+
+
+def make_setter(name):
+    @pg_property(str, int)
+    def setter(self, value):
+        self._set_property(name, value)
+
+    setter.__name__ = name
+    return setter
+
+
+Wide = type(
+    "Wide",
+    (BenchNode,),
+    {f"prop_{i}": make_setter(f"prop_{i}") for i in range(PROPERTY_COUNT)},
+)
+
+
+def main():
+    configure_mappers()
+    values = [{f"prop_{i}": i + n for i in range(PROPERTY_COUNT)} for n in range(2)]
+    node = Wide(node_id="wide", properties=values[0], system_annotations={"state": "live"})
+    toggle = iter(int(i % 2) for i in range(10**9))
+
+    report("get attribute", lambda: node.prop_30, 100000)
+    report("get item", lambda: node["prop_30"], 100000)
+    report("set attribute", lambda: setattr(node, "prop_30", 1), 10000)
+    report("has_property", lambda: Wide.has_property("prop_30"), 10000)
+    report("properties['key']", lambda: node.properties["prop_30"], 10000)
+    report("system_annotations['key']", lambda: node.system_annotations["state"], 10000)
+    report(
+        f"properties.update ({PROPERTY_COUNT} keys)",
+        lambda: node.properties.update(values[next(toggle)]),
+        200,
+    )
+    report(
+        f"set_properties ({PROPERTY_COUNT} keys)",
+        lambda: node.set_properties(values[next(toggle)]),
+        200,
+    )
+    report("construct node", lambda: Wide(node_id="wide", properties=values[0]), 200)
+    rows = values * 500
+    report(f"validate_many ({len(rows)} nodes)", lambda: Wide.validate_many(rows), 20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Generation time of large GraphFactory.create_random_subgraph() graphs.
+
+    python -m bench.random_subgraph [--max-depth D] [--seed S]
+
+No database needed.  The synthetic model is a single node type with
+four child relations to itself, so each node has about 3.2 children and
+a depth of 10 gives a subgraph of more than 100k nodes before half of
+them are merged.
+"""
+import argparse
+import random
+import time
+
+from psqlgraph import ext
+from psqlgraph.hydrator import GraphFactory
+
+NAMESPACE = "bench_random_subgraph"
+RELATIONS = "abcd"
+
+SubgraphNode, SubgraphEdge = ext.register_base_class(package_namespace=NAMESPACE)
+
+
+class Branch(SubgraphNode):
+    _pg_edges = {}
+
+
+def edge_class(relation):
+    return type(
+        f"Branch{relation.upper()}",
+        (SubgraphEdge,),
+        {
+            "__label__": f"branch_{relation}",
+            "__src_class__": "Branch",
+            "__dst_class__": "Branch",
+            "__src_dst_assoc__": f"children_{relation}",
+            "__dst_src_assoc__": f"parents_{relation}",
+        },
+    )
+
+
+EDGES = [edge_class(relation) for relation in RELATIONS]
+
+for relation in RELATIONS:
+    Branch._pg_edges[f"children_{relation}"] = {"backref": f"parents_{relation}", "type": Branch}
+    Branch._pg_edges[f"parents_{relation}"] = {"backref": f"children_{relation}", "type": Branch}
+
+
+class Models:
+    Node = SubgraphNode
+    Edge = SubgraphEdge
+
+
+class Dictionary:
+    schema = {
+        "branch": {
+            "properties": {},
+            "links": [{"name": f"parents_{relation}"} for relation in RELATIONS],
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    factory = GraphFactory(Models, Dictionary)
+    start = time.perf_counter()
+    nodes = factory.create_random_subgraph("branch", max_depth=args.max_depth)
+    elapsed = time.perf_counter() - start
+
+    edges = sum(len(node.edges_out) for node in nodes)
+    print(f"{'random subgraph':<40} {len(nodes):>14,} nodes {edges:,} edges in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
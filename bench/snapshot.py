@@ -0,0 +1,41 @@
+"""Traversal throughput over an in-memory adjacency snapshot.
+
+    python -m bench.snapshot [--nodes N] [--edges M]
+
+Needs numpy but no database: the snapshot is built from random edges
+with ``GraphSnapshot.from_edges``.
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from psqlgraph.snapshot import GraphSnapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1000000)
+    parser.add_argument("--edges", type=int, default=5000000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    snapshot = GraphSnapshot.from_edges(
+        np.array([f"n{i}" for i in range(args.nodes)]),
+        np.zeros(args.nodes, dtype=np.int16),
+        ["node"],
+        ["a", "b"],
+        rng.integers(0, args.nodes, args.edges),
+        rng.integers(0, args.nodes, args.edges),
+        rng.integers(0, 2, args.edges).astype(np.int16),
+    )
+
+    # Every edge is walked once by a traversal reaching the whole graph
+    roots = np.arange(10)
+    for name, edge_labels in (("bfs", None), ("bfs (label mask)", ["a"])):
+        best = min(timeit.repeat(lambda: snapshot.bfs(roots, edge_labels=edge_labels), number=1))
+        print(f"{name:<40} {args.edges / best:>14,.0f} edges/s")
+
+
+if __name__ == "__main__":
+    main()
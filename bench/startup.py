@@ -0,0 +1,89 @@
+"""Model load time: declaring node/edge classes and configuring mappers.
+
+    python -m bench.startup [--nodes N] [--edges E] [--profile]
+    python -m bench.startup --models my_package.models --profile
+
+Each run measures a cold start, so it builds one model per process.  By
+default a synthetic model of ``--nodes`` node classes with ``--edges``
+edge classes between them is declared; ``--models`` imports a real model
+module instead.  ``--profile`` prints the functions that dominate the
+load under cProfile.
+"""
+import argparse
+import cProfile
+import importlib
+import pstats
+import random
+import time
+
+from sqlalchemy import orm
+
+from psqlgraph import ext, pg_property
+
+PROPERTIES_PER_NODE = 10
+
+
+def make_setter(name):
+    @pg_property(str, int)
+    def setter(self, value):
+        self._set_property(name, value)
+
+    setter.__name__ = name
+    return setter
+
+
+def declare_model(nodes, edges, seed=0):
+    """Declare a random model of `nodes` node and `edges` edge classes"""
+    node_base, edge_base = ext.register_base_class(package_namespace="bench_startup")
+    names = [f"Node{i}" for i in range(nodes)]
+    for name in names:
+        attrs = {f"prop_{i}": make_setter(f"prop_{i}") for i in range(PROPERTIES_PER_NODE)}
+        type(name, (node_base,), attrs)
+
+    rand = random.Random(seed)
+    for i in range(edges):
+        type(
+            f"Edge{i}",
+            (edge_base,),
+            {
+                "__src_class__": rand.choice(names),
+                "__dst_class__": rand.choice(names),
+                "__src_dst_assoc__": f"edge_{i}_dsts",
+                "__dst_src_assoc__": f"edge_{i}_srcs",
+            },
+        )
+
+
+def load(args):
+    if args.models:
+        importlib.import_module(args.models)
+    else:
+        declare_model(args.nodes, args.edges)
+    orm.configure_mappers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--edges", type=int, default=400)
+    parser.add_argument("--models", help="import this module instead of a synthetic model")
+    parser.add_argument("--profile", action="store_true", help="print a cProfile report")
+    parser.add_argument("--top", type=int, default=25, help="rows in the profile report")
+    args = parser.parse_args()
+
+    profile = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    if profile:
+        profile.runcall(load, args)
+    else:
+        load(args)
+    elapsed = time.perf_counter() - start
+
+    model = args.models or f"{args.nodes} nodes, {args.edges} edges"
+    print(f"{'model load (' + model + ')':<40} {elapsed:>14.3f} s")
+    if profile:
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(args.top)
+
+
+if __name__ == "__main__":
+    main()
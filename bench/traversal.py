@@ -0,0 +1,71 @@
+"""Peak memory and throughput of node.traverse() over a large tree.
+
+    python -m bench.traversal [--nodes N] [--fanout F]
+
+Needs a database, see ``bench.pg_conf``.  Peak memory is measured with
+tracemalloc while the traversal runs and the yielded nodes are dropped,
+so it covers the traversal state and the nodes the session still holds.
+"""
+import argparse
+import time
+import tracemalloc
+
+from bench import pg_conf
+from psqlgraph import PsqlGraphDriver, ext, pg_property
+from psqlgraph.base import create_all
+
+NAMESPACE = "bench_traversal"
+
+TraversalNode, TraversalEdge = ext.register_base_class(package_namespace=NAMESPACE)
+
+
+class Branch(TraversalNode):
+    @pg_property(str)
+    def name(self, value):
+        self._set_property("name", value)
+
+
+class BranchOf(TraversalEdge):
+    __src_class__ = "Branch"
+    __dst_class__ = "Branch"
+    __src_dst_assoc__ = "parents"
+    __dst_src_assoc__ = "children"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--fanout", type=int, default=4)
+    args = parser.parse_args()
+
+    g = PsqlGraphDriver(package_namespace=NAMESPACE, **pg_conf())
+    orm_base = ext.get_orm_base(NAMESPACE)
+    orm_base.metadata.drop_all(g.engine)
+    create_all(g.engine, base=orm_base)
+
+    with g.session_scope() as session:
+        session.add_all(Branch(node_id=f"b{i}", name=f"branch {i}") for i in range(args.nodes))
+        session.flush()
+        session.add_all(
+            BranchOf(src_id=f"b{i}", dst_id=f"b{(i - 1) // args.fanout}")
+            for i in range(1, args.nodes)
+        )
+
+    for mode in ("bfs", "dfs"):
+        with g.session_scope():
+            root = g.nodes(Branch).ids("b0").one()
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = sum(1 for _ in root.traverse(mode=mode))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        assert count == args.nodes
+        print(f"{mode + ' peak memory':<40} {peak / count:>14,.0f} bytes/node")
+        print(f"{mode:<40} {count / elapsed:>14,.0f} nodes/s")
+
+    orm_base.metadata.drop_all(g.engine)
+
+
+if __name__ == "__main__":
+    main()
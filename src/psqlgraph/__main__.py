@@ -1,7 +1,7 @@
 import argparse
 import getpass
 
-from psqlgraph import psql
+from psqlgraph import history, psql
 
 try:
     import IPython
@@ -56,14 +56,43 @@ if __name__ == "__main__":
         help="password for given user. If no " "password given, one will be prompted.",
     )
 
+    subparsers = parser.add_subparsers(dest="command")
+    compact = subparsers.add_parser(
+        "compact-history",
+        help="delete the voided history that retention policies no longer keep",
+    )
+    compact.add_argument(
+        "--policy",
+        action="append",
+        required=True,
+        type=history.parse_policy,
+        metavar="LABEL=DAYS[:DAYS]",
+        help="keep every version of LABEL for DAYS, then one version per month "
+        "until the second DAYS (or forever), then delete. "
+        "LABEL '*' applies to all labels without a policy of their own",
+    )
+    compact.add_argument(
+        "--batch-size", default=1000, type=int, help="rows deleted per transaction"
+    )
+
     args = parser.parse_args()
 
-    print(message.format(args.database, args.host, args.user))
+    if args.command is None:
+        print(message.format(args.database, args.host, args.user))
     if args.password is None:
         args.password = getpass.getpass()
 
     g = psql.PsqlGraphDriver(args.host, args.user, args.password, args.database)
 
+    if args.command == "compact-history":
+        rows = size = 0
+        for batch in history.iter_compaction(g.engine, dict(args.policy), args.batch_size):
+            rows += batch.rows
+            size += batch.bytes
+            print(f"{batch.table} {batch.label}: deleted {batch.rows} rows, {batch.bytes} bytes")
+        print(f"Deleted {rows} rows, {size} bytes reclaimable by VACUUM")
+        raise SystemExit(0)
+
     with g.session_scope() as s:
         rb = s.rollback
         if ipython:
@@ -7,18 +7,119 @@ class PropertiesDictError(Exception):
     pass
 
 
+# The underlying storage of a JsonProperty only ever holds this key.  C
+# code that inspects dict storage directly, like the empty-dict fast
+# path of the json encoder, then falls through to the view's methods.
+_VIEW_PLACEHOLDER = object()
+
+
 class JsonProperty(dict):
-    """Handles unicode to str conversion while retrieving properties"""
+    """Lazy dict view of a JSONB column on `source`.
 
-    def __setitem__(self, key, value):
+    Key lookups read through to the column's current value.  The full
+    dict is only built when the view is iterated, measured or compared.
+    Changes, including pop() and clear(), go through :meth:`set_item`
+    and ``__delitem__`` so they always reach the column.
 
-        self.set_item(key, value)
-        super().__setitem__(key, value)
+    """
+
+    def __init__(self, source):
+        super().__init__({_VIEW_PLACEHOLDER: None})
+        self.source = source
+
+    @abstractmethod
+    def _column(self):
+        """Returns the current value of the viewed column"""
+
+    @abstractmethod
+    def _contents(self, column):
+        """Returns the dict the view represents for a column value"""
 
     @abstractmethod
     def set_item(self, key, value):
         pass
 
+    @abstractmethod
+    def __delitem__(self, key):
+        pass
+
+    def _materialize(self):
+        return self._contents(self._column())
+
+    def __setitem__(self, key, value):
+        self.set_item(key, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __len__(self):
+        return len(self._materialize())
+
+    def __eq__(self, other):
+        return self._materialize() == other
+
+    def __ne__(self, other):
+        return self._materialize() != other
+
+    def __repr__(self):
+        return repr(self._materialize())
+
+    def __or__(self, other):
+        return self._materialize() | other
+
+    def __ror__(self, other):
+        return other | self._materialize()
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+    def keys(self):
+        return self._materialize().keys()
+
+    def values(self):
+        return self._materialize().values()
+
+    def items(self):
+        return self._materialize().items()
+
+    def copy(self):
+        return dict(self._materialize())
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        data = self._materialize()
+        if not data:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(data))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def clear(self):
+        for key in list(self._materialize()):
+            del self[key]
+
+    __hash__ = None
+
 
 class SystemAnnotationDict(JsonProperty):
     """Transparent wrapper for _sysan so you can update it as
@@ -26,9 +127,17 @@ class SystemAnnotationDict(JsonProperty):
 
     """
 
-    def __init__(self, source):
-        self.source = source
-        super().__init__(sanitize(source._sysan))
+    def _column(self):
+        return self.source._sysan or {}
+
+    def _contents(self, column):
+        return sanitize(column)
+
+    def __getitem__(self, key):
+        return self._column()[key]
+
+    def __contains__(self, key):
+        return key in self._column()
 
     def update(self, system_annotations=None, **kwargs):
 
@@ -40,7 +149,6 @@ class SystemAnnotationDict(JsonProperty):
         temp = sanitize(self.source._sysan)
         temp.update(system_annotations)
         self.source._sysan = temp
-        super().update(self.source._sysan)
 
     def set_item(self, key, val):
         temp = dict(self.source._sysan)
@@ -48,8 +156,9 @@ class SystemAnnotationDict(JsonProperty):
         self.source.system_annotations = temp
 
     def __delitem__(self, key):
-        del self.source._sysan[key]
-        self.update()
+        temp = dict(self.source._sysan)
+        del temp[key]
+        self.source.system_annotations = temp
 
 
 class PropertiesDict(JsonProperty):
@@ -58,22 +167,30 @@ class PropertiesDict(JsonProperty):
 
     """
 
-    def __init__(self, source):
-        self.source = source
-        super().__init__(source.property_template(source._props))
+    def _column(self):
+        source = self.source
+        return source._props if source._staged_props is None else source._staged_props
+
+    def _contents(self, column):
+        return self.source.property_template(column)
+
+    def __getitem__(self, key):
+        column = self._column()
+        if key in column:
+            return column[key]
+        if self.source.has_property(key):
+            return None
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._column() or self.source.has_property(key)
 
     def update(self, properties=None, **kwargs):
 
-        if properties == self:
+        if properties is self:
             return
 
-        properties = properties or {}
-        properties = sanitize(properties)
-        for key, val in properties.items():
-            if not self.source.has_property(key):
-                raise AttributeError(f"{self.source} has no property {key}")
-            setattr(self.source, key, val)
-        super().update(self.source._props)
+        self.source.set_properties(properties or {})
 
     def set_item(self, key, val):
         setattr(self.source, key, val)
@@ -1,17 +1,24 @@
-from sqlalchemy import event
+from collections import namedtuple
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from sqlalchemy import event, select, tuple_
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext import declarative
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import object_session, sessionmaker
+from sqlalchemy.orm import configure_mappers, object_session, sessionmaker
 from sqlalchemy.sql import expression, schema, sqltypes
 
 from psqlgraph import attributes
-from psqlgraph.util import sanitize, validate
+from psqlgraph.util import compile_validator, sanitize
 
 NODE_TABLENAME_SCHEME = "node_{class_name}"
 EDGE_TABLENAME_SCHEME = "edge_{class_name}"
 
+# Property metadata compiled for each model class at mapper configuration
+PropertyMeta = namedtuple("PropertyMeta", ["name", "types", "enum", "nonnull"])
+
 
 class CommonBase:
 
@@ -19,6 +26,19 @@ class CommonBase:
     _session_hooks_before_update = []
     _session_hooks_before_delete = []
 
+    # Copy of _props that property setters write to while a batch of
+    # properties is being set, see `_batched_properties`
+    _staged_props = None
+
+    # How updates are recorded in the voided history table: "full" copies
+    # the whole previous version, "diff" stores only the changed keys as
+    # a patch against the next version (see psqlgraph.history)
+    __history_mode__ = "full"
+
+    # In "diff" mode, every Nth snapshot of an entity is a full copy so
+    # that reconstructing a version never replays more than N patches
+    __history_checkpoint_every__ = 20
+
     # ======== Columns ========
     created = schema.Column(
         sqltypes.DateTime(timezone=True),
@@ -71,8 +91,63 @@ class CommonBase:
         property setter.
 
         """
-        for key, val in sanitize(properties).items():
-            setattr(self, key, val)
+        with self._batched_properties():
+            for key, val in sanitize(properties).items():
+                setattr(self, key, val)
+
+    def set_properties(self, properties):
+        """Set several properties at once.  Each value passes through the
+        model's property setter for validation, but the _props dict is
+        copied and reassigned only once for the whole batch.  If any key
+        fails validation, no property is changed.
+
+        """
+        properties = sanitize(properties)
+        for key in properties:
+            if not self.has_property(key):
+                raise AttributeError(f"{self} has no property {key}")
+        with self._batched_properties():
+            for key, val in properties.items():
+                setattr(self, key, val)
+
+    @classmethod
+    def validate_many(cls, properties_list):
+        """Validate many property dicts for this class at once, e.g.
+        before a bulk load, without constructing any nodes.  Raises
+        ValidationError for the first invalid value and AttributeError
+        for a key that is not a property of the class.
+
+        """
+        validators = cls.__dict__.get("__pg_validators__")
+        if validators is None:
+            configure_mappers()
+            validators = cls.__dict__.get("__pg_validators__", {})
+        for properties in properties_list:
+            for key, value in properties.items():
+                try:
+                    validator = validators[key]
+                except KeyError:
+                    raise AttributeError(f"{cls.__name__} has no property {key}")
+                validator(value)
+
+    @contextmanager
+    def _batched_properties(self):
+        """Stage property writes made by `_set_property` in a single copy
+        of _props that replaces it when the block exits without error.
+
+        """
+        if self._staged_props is not None:
+            # Nested batches write to the outer batch's copy
+            yield
+            return
+
+        self._staged_props = dict(self._props or {})
+        try:
+            yield
+            staged = self._staged_props
+        finally:
+            self._staged_props = None
+        self._props = staged
 
     @hybrid_property
     def props(self):
@@ -101,6 +176,9 @@ class CommonBase:
         """
         if not self.has_property(key):
             raise KeyError(f"{type(self)} has no property {key}")
+        if self._staged_props is not None:
+            self._staged_props[key] = val
+            return
         self._props = {k: v for k, v in self._props.items()}
         self._props[key] = val
 
@@ -111,9 +189,10 @@ class CommonBase:
         """
         if not self.has_property(key):
             raise KeyError(f"{type(self)} has no property {key}")
-        if key not in self._props:
+        props = self._props if self._staged_props is None else self._staged_props
+        if key not in props:
             return None
-        return self._props[key]
+        return props[key]
 
     def property_template(self, properties=None):
         """Returns a dictionary of {key: None} templating all of the
@@ -121,7 +200,7 @@ class CommonBase:
 
         """
         properties = properties or {}
-        temp = {k: None for k in self.get_property_list()}
+        temp = dict.fromkeys(self._get_property_names())
         temp.update(properties)
         return temp
 
@@ -139,18 +218,38 @@ class CommonBase:
     @classmethod
     def get_property_list(cls):
         """Returns a list of hybrid_properties defined on the subclass model"""
-        return [
-            attr
-            for attr in dir(cls)
-            if attr in cls.__dict__
-            and isinstance(cls.__dict__[attr], hybrid_property)
-            and getattr(getattr(cls, attr), "_is_pg_property", True)
-        ]
+        return list(cls._get_property_names())
 
     @classmethod
     def has_property(cls, key):
         """Returns boolean if key is a property defined on the subclass model"""
-        return key in cls.get_property_list()
+        return key in cls._get_property_set()
+
+    @classmethod
+    def _get_property_names(cls):
+        """Returns the sorted tuple of property names compiled when the
+        mapper was configured, scanning the class if it has not been.
+
+        """
+        names = cls.__dict__.get("__pg_property_names__")
+        if names is None:
+            return find_property_names(cls)
+        return names
+
+    @classmethod
+    def _get_property_set(cls):
+        names = cls.__dict__.get("__pg_property_set__")
+        if names is None:
+            return frozenset(find_property_names(cls))
+        return names
+
+    @classmethod
+    def get_property_meta(cls):
+        """Returns a read only mapping of property name to
+        :class:`PropertyMeta` (types, enum and nonnull constraint)
+
+        """
+        return cls.__dict__.get("__pg_property_meta__", MappingProxyType({}))
 
     # ======== Label ========
 
@@ -243,16 +342,20 @@ def create_hybrid_property(name, fset):
         # Note: this does not use an 'in' clause or a .get() with a
         # default because that doesn't allow you to use
         # Node.property_key in a filter on a query.
+        props = instance._props if instance._staged_props is None else instance._staged_props
         try:
-            return instance._props[name]
+            return props[name]
         except KeyError:
             return None
 
+    validator = compile_validator(fset.__name__, fset.__pg_types__, fset.__pg_enum__)
+
     @hybrid_prop.setter
     def hybrid_prop(instance, value):
-        validate(fset, value, fset.__pg_types__, fset.__pg_enum__)
+        validator(value)
         fset(instance, value)
 
+    hybrid_prop.validator = validator
     return hybrid_prop
 
 
@@ -262,18 +365,68 @@ def create_hybrid_properties(mapper, cls):
     # dictionary.  It will be populated at mapper configuration using
     # all model properties defined with @pg_property
     cls.__pg_properties__ = {}
+    validators = {}
+    enums = {}
 
-    for pg_attr in dir(cls):
+    for pg_attr, f in list(find_pg_setters(cls)):
         if pg_attr in ["properties", "props", "system_annotations", "sysan"]:
             continue
 
-        f = getattr(cls, pg_attr)
-        if not getattr(f, "__pg_setter__", False):
-            continue
-
         h_prop = create_hybrid_property(pg_attr, f)
         setattr(cls, pg_attr, h_prop)
         cls.__pg_properties__[pg_attr] = f.__pg_types__
+        validators[pg_attr] = h_prop.validator
+        enums[pg_attr] = f.__pg_enum__
+
+    cls.__pg_validators__ = MappingProxyType(validators)
+    compile_property_meta(cls, enums)
+
+
+def find_pg_setters(cls):
+    """Yield (name, setter) for the @pg_property setters visible on a
+    model class, walking the class __dict__s along the MRO instead of
+    resolving every attribute dir() would list.
+
+    """
+    seen = set()
+    for klass in cls.__mro__:
+        for attr, value in vars(klass).items():
+            if attr in seen:
+                continue
+            seen.add(attr)
+            if getattr(value, "__pg_setter__", False):
+                yield attr, value
+
+
+def find_property_names(cls):
+    """Scan a model class for the hybrid_properties defined on it"""
+    return tuple(
+        attr
+        for attr, value in sorted(vars(cls).items())
+        if isinstance(value, hybrid_property) and getattr(value, "_is_pg_property", True)
+    )
+
+
+def compile_property_meta(cls, enums):
+    """Freeze the property names and metadata of a model class so that
+    property lookups on the hot path do not rescan the class.
+
+    """
+    names = find_property_names(cls)
+    nonnull = set(getattr(cls, "__nonnull_properties__", []))
+    cls.__pg_property_names__ = names
+    cls.__pg_property_set__ = frozenset(names)
+    cls.__pg_property_meta__ = MappingProxyType(
+        {
+            name: PropertyMeta(
+                name,
+                cls.__pg_properties__.get(name),
+                frozenset(enums.get(name) or ()),
+                name in nonnull,
+            )
+            for name in names
+        }
+    )
 
 
 class VoidedBaseClass:
@@ -301,6 +454,116 @@ class VoidedBaseClass:
 VoidedBase = declarative.declarative_base(cls=VoidedBaseClass)
 ORMBase = declarative.declarative_base(cls=CommonBase)
 
+# Key in session.info of the history snapshots queued during a flush
+VOIDED_SNAPSHOTS = "psqlgraph_voided_snapshots"
+
+# Maximum number of rows written per multi-row INSERT of snapshots
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+# System annotation key marking a voided row that holds a patch
+# against the next version of its entity instead of a full copy
+PATCH_KEY = "_psqlgraph_patch"
+
+SnapshotPatch = namedtuple(
+    "SnapshotPatch",
+    [
+        "identity",
+        "checkpoint_every",
+        "properties",
+        "system_annotations",
+        "unset_properties",
+        "unset_system_annotations",
+    ],
+)
+
+
+def snapshot_patch(identity, entity, old_props, old_sysan):
+    """Returns the :class:`SnapshotPatch` that turns the version `entity`
+    is being updated to back into the old version: the old values of
+    the keys that change, and the keys that did not exist before.
+
+    :param identity: names of the voided columns identifying the entity
+    """
+    # The update is merged onto the old version, see _merge_onto_existing
+    new_props = {**old_props, **(entity._props or {})}
+    new_sysan = {**old_sysan, **(entity._sysan or {})}
+    return SnapshotPatch(
+        identity,
+        entity.__history_checkpoint_every__,
+        {k: old_props[k] for k in old_props if new_props[k] != old_props[k]},
+        {k: old_sysan[k] for k in old_sysan if new_sysan[k] != old_sysan[k]},
+        [k for k in new_props if k not in old_props],
+        [k for k in new_sysan if k not in old_sysan],
+    )
+
+
+def queue_snapshot(session, table, row, patch=None):
+    """Queue a history row for `table` (_voided_nodes or _voided_edges)
+    to be written by :func:`write_snapshots` along with the others
+    queued in the same flush.  If a `patch` is given, the patch is
+    written instead of the full row unless a checkpoint is due.
+
+    """
+    session.info.setdefault(VOIDED_SNAPSHOTS, {}).setdefault(table, []).append((row, patch))
+
+
+def write_snapshots(session):
+    """Write the queued history rows with one multi-row INSERT per table
+    (per SNAPSHOT_BATCH_SIZE rows) instead of one INSERT per row.
+
+    """
+    queued = session.info.pop(VOIDED_SNAPSHOTS, {})
+    for table, entries in queued.items():
+        depths = latest_patch_depths(session, table, entries)
+        rows = []
+        for row, patch in entries:
+            if patch is not None:
+                depth = depths.get(tuple(row[name] for name in patch.identity), 0) + 1
+                if depth < patch.checkpoint_every:
+                    row = patch_row(row, patch, depth)
+            rows.append(row)
+        for start in range(0, len(rows), SNAPSHOT_BATCH_SIZE):
+            session.execute(table.insert().values(rows[start : start + SNAPSHOT_BATCH_SIZE]))
+
+
+def patch_row(row, patch, depth):
+    """Returns `row` with its full version replaced by `patch`, the
+    `depth`th patch since the entity's last full snapshot
+
+    """
+    meta = {
+        "depth": depth,
+        "unset_properties": patch.unset_properties,
+        "unset_system_annotations": patch.unset_system_annotations,
+    }
+    return dict(
+        row,
+        properties=patch.properties,
+        system_annotations={**patch.system_annotations, PATCH_KEY: meta},
+    )
+
+
+def latest_patch_depths(session, table, entries):
+    """Returns {identity: depth} of the latest history row of each entity
+    with a queued patch, in one query; full rows have depth 0.
+
+    """
+    identity = next((patch.identity for _, patch in entries if patch is not None), None)
+    if identity is None:
+        return {}
+    columns = [table.c[name] for name in identity]
+    keys = {tuple(row[name] for name in identity) for row, patch in entries if patch is not None}
+    query = (
+        select(columns + [table.c.system_annotations[PATCH_KEY]])
+        .where(tuple_(*columns).in_(keys))
+        .distinct(*columns)
+        .order_by(*columns, table.c.voided.desc(), table.c.key.desc())
+    )
+    return {
+        tuple(found[:-1]): (found[-1] or {}).get("depth", 0) for found in session.execute(query)
+    }
+
 
 def create_all(engine, base=ORMBase):
     """Create all tables associated with the provided declarative base, defaults to
@@ -323,12 +586,58 @@ def drop_all(engine, base=ORMBase):
     VoidedBase.metadata.drop_all(engine)
 
 
+class SubclassIndex:
+    """Dict indexes over the subclasses of an abstract Node or Edge class,
+    keyed by label, class name and, for edges, endpoint class names.
+
+    """
+
+    def __init__(self, subclasses):
+        self.by_label = {}
+        self.by_name = {}
+        self.by_src = {}
+        self.by_dst = {}
+        self.by_endpoints = {}
+        for scls in subclasses:
+            label = scls.get_label()
+            self.by_name[scls.__name__] = scls
+            self.by_label.setdefault(label, []).append(scls)
+            src_class = getattr(scls, "__src_class__", None)
+            dst_class = getattr(scls, "__dst_class__", None)
+            if src_class is None and dst_class is None:
+                continue
+            self.by_src.setdefault(src_class, []).append(scls)
+            self.by_dst.setdefault(dst_class, []).append(scls)
+            self.by_endpoints.setdefault((src_class, label, dst_class), []).append(scls)
+
+
 class ExtMixin:
     """An extension mixin used for retrieving child classes when needed"""
 
+    # Bumped whenever a class extending this mixin is declared, so that
+    # cached subclass indexes know to rebuild
+    _subclass_generation = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ExtMixin._subclass_generation += 1
+
+    @classmethod
+    def get_subclass_index(cls):
+        """Returns a :class:`SubclassIndex` of :meth:`get_subclasses`,
+        built once and rebuilt after new subclasses are declared
+
+        """
+        cached = cls.__dict__.get("_subclass_index")
+        if cached is not None and cached[0] == ExtMixin._subclass_generation:
+            return cached[1]
+        index = SubclassIndex(cls.get_subclasses())
+        cls._subclass_index = (ExtMixin._subclass_generation, index)
+        return index
+
     @classmethod
     def is_subclass_loaded(cls, name):
-        return name in [c.__name__ for c in cls.get_subclasses()]
+        return name in cls.get_subclass_index().by_name
 
     @classmethod
     def add_subclass(cls, subclass):
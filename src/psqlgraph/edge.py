@@ -1,7 +1,9 @@
+from sqlalchemy import func
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.sql import schema, sqltypes
 
 from psqlgraph import base
+from psqlgraph.util import sanitize
 from psqlgraph.voided_edge import VoidedEdge
 
 
@@ -91,8 +93,10 @@ class AbstractEdge(DeclareLastEdgeMixin, base.ExtMixin):
         self._props = {}
         self.system_annotations = system_annotations or {}
         self.acl = acl or []
-        self.properties = properties or {}
-        self.properties.update(kwargs)
+        if properties:
+            self.properties = properties
+        if kwargs:
+            self.properties.update(kwargs)
 
         if src is not None:
             if src_id is not None:
@@ -193,37 +197,52 @@ class AbstractEdge(DeclareLastEdgeMixin, base.ExtMixin):
         """Determines a subclass based on the src and dst."""
         src_class = cls.get_node_class().get_subclass(src_label).__name__
         dst_class = cls.get_node_class().get_subclass(dst_label).__name__
-        scls = [
-            c
-            for c in cls.get_subclasses()
-            if c.get_label() == label
-            and c.__src_class__ == src_class
-            and c.__dst_class__ == dst_class
-        ]
+        scls = cls.get_subclass_index().by_endpoints.get((src_class, label, dst_class), [])
         if len(scls) > 1:
             raise KeyError(f"More than one Edge with label {label} found: {scls}")
         if not scls:
             return None
         return scls[0]
 
+    @classmethod
+    def get_src_label(cls):
+        """Label of the nodes at the src end, from `__src_class__`"""
+        return cls.get_node_class().get_subclass_index().by_name[cls.__src_class__].get_label()
+
+    @classmethod
+    def get_dst_label(cls):
+        """Label of the nodes at the dst end, from `__dst_class__`"""
+        return cls.get_node_class().get_subclass_index().by_name[cls.__dst_class__].get_label()
+
     @classmethod
     def _get_subclasses_labeled(cls, label):
-        return [c for c in cls.get_subclasses() if c.get_label() == label]
+        return list(cls.get_subclass_index().by_label.get(label, []))
 
     @classmethod
     def _get_edges_with_src(cls, src_class_name):
-        return [c for c in cls.get_subclasses() if c.__src_class__ == src_class_name]
+        return list(cls.get_subclass_index().by_src.get(src_class_name, []))
 
     @classmethod
     def _get_edges_with_dst(cls, dst_class_name):
-        return [c for c in cls.get_subclasses() if c.__dst_class__ == dst_class_name]
+        return list(cls.get_subclass_index().by_dst.get(dst_class_name, []))
 
     def _snapshot_existing(self, session, old_props, old_sysan):
-        temp = self.__class__(
-            self.src_id, self.dst_id, old_props, self.acl, old_sysan, self.label
-        )
-        voided = VoidedEdge(temp)
-        session.add(voided)
+        # Edge history holds the full property template, patches included
+        old_props = self.property_template(sanitize(old_props))
+        old_sysan = sanitize(old_sysan)
+        row = {
+            "src_id": self.src_id,
+            "dst_id": self.dst_id,
+            "label": self.label,
+            "acl": self.acl,
+            "created": self.created if self.created is not None else func.now(),
+            "properties": old_props,
+            "system_annotations": old_sysan,
+        }
+        patch = None
+        if self.__history_mode__ == "diff" and self not in session.deleted:
+            patch = base.snapshot_patch(("src_id", "dst_id", "label"), self, old_props, old_sysan)
+        base.queue_snapshot(session, VoidedEdge.__table__, row, patch)
 
     @classmethod
     def get_node_class(cls):
@@ -0,0 +1,774 @@
+"""
+Maintenance of the voided history tables, `_voided_nodes` and `_voided_edges`.
+
+The history tables can optionally be range partitioned by the month
+they were voided in, so that old history can be detached and archived
+(or dropped) as a whole table instead of deleted row by row::
+
+    from psqlgraph import create_all, history
+
+    history.create_partitioned_tables(engine)  # before create_all()
+    create_all(engine)
+    history.create_partitions(engine, datetime.date(2026, 1, 1), months=12)
+    ...
+    history.detach_partitions(engine, datetime.date(2026, 1, 1))
+
+Databases created before the history tables were indexed get the
+indexes with :func:`create_history_indexes`.  Edge history rows record
+the edge's creation time, as node history rows do; rows written before
+then hold the time they were voided and are updated from the live edges
+with :func:`backfill_edge_created`.
+
+Models that set ``__history_mode__ = "diff"`` record each update as a
+patch holding only the previous values of the changed keys, with a full
+copy every ``__history_checkpoint_every__`` snapshots.  The voided rows
+of such models are then patches rather than versions; use
+:func:`iter_versions` or :func:`version_at` to read past versions::
+
+    for version in history.iter_versions(session, node):
+        print(version.voided, version.properties)
+
+    history.version_at(session, node, datetime.datetime(2026, 1, 1, tzinfo=utc))
+
+Whole queries can be read as of a point in time with
+:meth:`psqlgraph.query.GraphQuery.as_of`, which selects from
+:func:`versions_as_of` instead of the live tables.
+
+Old history can be thinned out and expired per label with
+:func:`compact_history`, also available from the command line::
+
+    python -m psqlgraph -d db compact-history --policy '*=90:730' --policy case=30
+"""
+import datetime
+from collections import Counter, namedtuple
+
+from sqlalchemy import (
+    MetaData,
+    PrimaryKeyConstraint,
+    Table,
+    and_,
+    case,
+    exists,
+    func,
+    inspect,
+    literal,
+    literal_column,
+    not_,
+    or_,
+    select,
+    text,
+    union_all,
+)
+from sqlalchemy.orm import Query
+from sqlalchemy.schema import CreateIndex
+
+from psqlgraph.base import PATCH_KEY
+from psqlgraph.exc import QueryError
+from psqlgraph.voided_edge import VoidedEdge
+from psqlgraph.voided_node import VoidedNode
+
+HISTORY_TABLES = (VoidedNode.__table__, VoidedEdge.__table__)
+
+# Identity columns of the entities in each history table, along with label
+IDENTITY_COLUMNS = {
+    VoidedNode.__table__: ("node_id",),
+    VoidedEdge.__table__: ("src_id", "dst_id"),
+}
+
+# Columns of the live node and edge tables stored under another name in
+# the history tables
+VOIDED_COLUMNS = {"_props": "properties", "_sysan": "system_annotations"}
+
+# A version of an entity: its properties and system annotations until
+# `voided`, which is None for the live version
+HistoryVersion = namedtuple("HistoryVersion", ["voided", "properties", "system_annotations"])
+
+
+def partitioned_table(table, metadata):
+    """Returns a copy of history `table` in `metadata` that is range
+    partitioned by `voided`.  Postgres requires the partition key in the
+    primary key, so `voided` is appended to it.
+
+    """
+    columns = []
+    for column in table.columns:
+        column = column.copy()
+        column.primary_key = False
+        if column.name == "key":
+            column.autoincrement = True
+        columns.append(column)
+    primary_key = [column.name for column in table.primary_key] + ["voided"]
+    return Table(
+        table.name,
+        metadata,
+        *columns,
+        PrimaryKeyConstraint(*primary_key),
+        postgresql_partition_by="RANGE (voided)",
+    )
+
+
+def create_partitioned_tables(engine):
+    """Create the history tables partitioned by voided month, each with
+    a DEFAULT partition for rows outside of the created monthly
+    partitions.  Tables that already exist are left as they are, so this
+    must run before :func:`psqlgraph.create_all` on a new database.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+    Returns:
+        list[str]: names of the tables created
+    """
+    existing = set(inspect(engine).get_table_names())
+    metadata = MetaData()
+    created = []
+    with engine.begin() as conn:
+        for table in HISTORY_TABLES:
+            if table.name in existing:
+                continue
+            partitioned_table(table, metadata).create(conn)
+            for index in table.indexes:
+                index.create(conn)
+            conn.execute(
+                text(f"CREATE TABLE {table.name}_default PARTITION OF {table.name} DEFAULT")
+            )
+            created.append(table.name)
+    return created
+
+
+def create_history_indexes(engine):
+    """Create the indexes of the history tables that are missing, e.g. on
+    a database created before they were declared.  ``create_all`` only
+    creates indexes along with new tables.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+    Returns:
+        list[str]: names of the indexes, whether or not they existed
+    """
+    names = []
+    with engine.begin() as conn:
+        for table in HISTORY_TABLES:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                statement = str(CreateIndex(index).compile(dialect=conn.dialect))
+                conn.execute(
+                    text(statement.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+                )
+                names.append(index.name)
+    return names
+
+
+def backfill_edge_created(engine, edge_cls):
+    """Set the creation time of the edge history rows written before
+    they recorded it, from the live edges.
+
+    Edge history rows used to store the time they were voided as
+    ``created``, so these rows have ``created = voided``.
+    :func:`versions_as_of` reads ``created`` as the edge's creation time
+    and skips them.  The rows of edges that have since been deleted
+    cannot be recovered and are left as they are.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+        edge_cls: the abstract Edge class of the models
+    Returns:
+        int: number of history rows updated
+    """
+    voided = VoidedEdge.__table__
+    updated = 0
+    with engine.begin() as conn:
+        for sub in edge_cls.__mapper__.polymorphic_map.values():
+            if sub.class_.is_abstract_base():
+                continue
+            live = sub.local_table
+            statement = (
+                voided.update()
+                .values(created=live.c.created)
+                .where(voided.c.src_id == live.c.src_id)
+                .where(voided.c.dst_id == live.c.dst_id)
+                .where(voided.c.label == sub.class_.get_label())
+                .where(voided.c.created == voided.c.voided)
+                .where(live.c.created < voided.c.voided)
+            )
+            updated += conn.execute(statement).rowcount
+    return updated
+
+
+def month_start(day):
+    """Returns the UTC start of the month of date `day`"""
+    return datetime.datetime(day.year, day.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def next_month(start):
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(table, month):
+    """Returns the name of the partition of `table` for the month of `month`"""
+    return f"{table.name}_y{month.year}m{month.month:02d}"
+
+
+def create_partitions(engine, start, months=1):
+    """Create the monthly partitions of both history tables for `months`
+    months from the month of date `start`.  Existing partitions are
+    skipped.  A month cannot be partitioned while the DEFAULT partition
+    holds rows voided in it.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+        start (datetime.date): any day in the first month
+        months (int): number of months
+    Returns:
+        list[str]: names of the partitions
+    """
+    names = []
+    month = month_start(start)
+    with engine.begin() as conn:
+        for _ in range(months):
+            end = next_month(month)
+            for table in HISTORY_TABLES:
+                name = partition_name(table, month)
+                conn.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table.name} "
+                        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+                    )
+                )
+                names.append(name)
+            month = end
+    return names
+
+
+def detach_partitions(engine, month):
+    """Detach the partitions of both history tables for the month of date
+    `month`.  The detached tables keep their rows and can be archived or
+    dropped without touching the remaining history.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+        month (datetime.date): any day in the month
+    Returns:
+        list[str]: names of the detached tables
+    """
+    names = []
+    with engine.begin() as conn:
+        for table in HISTORY_TABLES:
+            name = partition_name(table, month)
+            conn.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {name}"))
+            names.append(name)
+    return names
+
+
+def is_patch(voided):
+    """Whether voided row `voided` holds a patch instead of a full version"""
+    return PATCH_KEY in (voided.system_annotations or {})
+
+
+def revert_patch(version, voided):
+    """Apply patch row `voided` to the version that replaced it,
+    returning the version it recorded
+
+    """
+    meta = voided.system_annotations[PATCH_KEY]
+    properties = {
+        k: v for k, v in version.properties.items() if k not in meta["unset_properties"]
+    }
+    properties.update(voided.properties or {})
+    sysan = {
+        k: v
+        for k, v in version.system_annotations.items()
+        if k not in meta["unset_system_annotations"]
+    }
+    sysan.update((k, v) for k, v in voided.system_annotations.items() if k != PATCH_KEY)
+    return HistoryVersion(voided.voided, properties, sysan)
+
+
+def full_version(voided):
+    return HistoryVersion(
+        voided.voided, dict(voided.properties or {}), dict(voided.system_annotations or {})
+    )
+
+
+def live_version(entity):
+    """Returns the current version of a node or edge, None for a voided row"""
+    if isinstance(entity, (VoidedNode, VoidedEdge)):
+        return None
+    properties = dict(entity._props or {})
+    if hasattr(entity, "src_id"):
+        # Edge history rows hold the full property template, see
+        # Edge._snapshot_existing
+        properties = entity.property_template(properties)
+    return HistoryVersion(None, properties, dict(entity._sysan or {}))
+
+
+def history_query(session, entity):
+    """Query the voided rows of a node or edge, given either the live
+    entity or one of its voided rows
+
+    """
+    if hasattr(entity, "src_id"):
+        return (
+            session.query(VoidedEdge)
+            .filter(VoidedEdge.src_id == entity.src_id)
+            .filter(VoidedEdge.dst_id == entity.dst_id)
+            .filter(VoidedEdge.label == entity.label)
+        )
+    return (
+        session.query(VoidedNode)
+        .filter(VoidedNode.node_id == entity.node_id)
+        .filter(VoidedNode.label == entity.label)
+    )
+
+
+def iter_versions(session, entity):
+    """Yield every version of a node or edge, newest first, starting with
+    the live version if `entity` is live.  Patches are replayed against
+    the newer version as they are read, so each version costs one row.
+
+    Args:
+        session: session to query history with
+        entity: the live node or edge, or one of its voided rows if it
+            no longer exists
+    Yields:
+        HistoryVersion
+    """
+    version = live_version(entity)
+    if version is not None:
+        yield version
+
+    for _, version in iter_voided_versions(session, entity):
+        yield version
+
+
+def iter_voided_versions(session, entity):
+    """Yield (voided row, the version it recorded) for every history row
+    of a node or edge, newest first, see :func:`iter_versions`
+
+    """
+    version = live_version(entity)
+    voided_cls = VoidedEdge if hasattr(entity, "src_id") else VoidedNode
+    query = history_query(session, entity).order_by(
+        voided_cls.voided.desc(), voided_cls.key.desc()
+    )
+    for voided in query.yield_per(100):
+        if not is_patch(voided):
+            version = full_version(voided)
+        elif version is None:
+            raise ValueError(f"{voided} is a patch but there is no newer version to apply it to")
+        else:
+            version = revert_patch(version, voided)
+        yield voided, version
+
+
+def version_row(voided, version):
+    """Returns a transient copy of history row `voided` holding `version`
+    in place of the patch it stores
+
+    """
+    mapper = inspect(type(voided))
+    row = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        setattr(row, attr.key, getattr(voided, attr.key))
+    row.properties = version.properties
+    row.system_annotations = version.system_annotations
+    return row
+
+
+class VersionQuery(Query):
+    """Query of the history rows of `entity` that yields transient copies
+    of patch rows holding the versions they recorded, so that the rows of
+    ``__history_mode__ = "diff"`` models read like full versions.  The
+    entity's whole history is read once if any row is a patch.
+
+    """
+
+    def __init__(self, entities, session=None, entity=None):
+        super().__init__(entities, session)
+        self.entity = entity
+
+    def __iter__(self):
+        rows = list(super().__iter__())
+        if not any(isinstance(row, (VoidedNode, VoidedEdge)) and is_patch(row) for row in rows):
+            return iter(rows)
+
+        versions = {
+            voided.key: version
+            for voided, version in iter_voided_versions(self.session, self.entity)
+        }
+        return iter(
+            version_row(row, versions[row.key])
+            if isinstance(row, (VoidedNode, VoidedEdge)) and is_patch(row)
+            else row
+            for row in rows
+        )
+
+
+def version_at(session, entity, timestamp):
+    """Returns the version of a node or edge as it was at `timestamp`, or
+    None if a live `entity` was created after it.
+
+    Only the rows from the version valid at `timestamp` up to the next
+    full copy (or the live version) are read, i.e. at most the model's
+    ``__history_checkpoint_every__`` rows in "diff" mode.
+
+    Args:
+        session: session to query history with
+        entity: the live node or edge, or one of its voided rows if it
+            no longer exists
+        timestamp (datetime.datetime): point in time
+    Returns:
+        HistoryVersion
+    """
+    live = live_version(entity)
+    if live is not None and entity.created is not None and entity.created > timestamp:
+        return None
+
+    voided_cls = VoidedEdge if hasattr(entity, "src_id") else VoidedNode
+    query = (
+        history_query(session, entity)
+        .filter(voided_cls.voided > timestamp)
+        .order_by(voided_cls.voided.asc(), voided_cls.key.asc())
+    )
+
+    # The first row voided after timestamp holds the version valid at
+    # timestamp, newer rows are only needed back to the next full copy
+    chain = []
+    for voided in query.yield_per(100):
+        chain.append(voided)
+        if not is_patch(voided):
+            break
+    if not chain:
+        return live
+
+    if is_patch(chain[-1]):
+        if live is None:
+            raise ValueError(
+                f"{chain[-1]} is a patch but there is no newer version to apply it to"
+            )
+        version = live
+    else:
+        version = full_version(chain.pop())
+    for voided in reversed(chain):
+        version = revert_patch(version, voided)
+    return version
+
+
+def versions_as_of(entity, timestamp):
+    """Returns a selectable of the versions of the nodes or edges mapped
+    by `entity` that were current at `timestamp`, with the same columns
+    as the entity's table (or polymorphic union).
+
+    It is the union of the live rows created by `timestamp` that have
+    not been voided since, and for every other entity the first history
+    row voided after `timestamp`, provided the entity was created by
+    then.  Both sides are lookups on the entity's identity, using the
+    primary keys of the live tables and the identity indexes of the
+    history tables.
+
+    History rows of ``__history_mode__ = "diff"`` models hold patches
+    that cannot be read as versions in SQL, so those models raise
+    QueryError; use :func:`version_at` for them instead.
+
+    Edge history rows written before they recorded the edge's creation
+    time are skipped until :func:`backfill_edge_created` has been run,
+    and for good if the edge has been deleted since.
+
+    History rows only record labels.  The rows of edge classes sharing a
+    label are told apart by the classes of their src and dst nodes, live
+    or voided; node classes sharing a label raise QueryError.
+
+    Args:
+        entity: a Node or Edge class, abstract or concrete
+        timestamp (datetime.datetime): point in time
+    Returns:
+        sqlalchemy.sql.expression.Alias
+    """
+    mapper = entity.__mapper__
+    mappers = [mapper] if mapper.polymorphic_on is None else mapper.polymorphic_map.values()
+    diff_classes = sorted(
+        m.class_.__name__ for m in mappers if m.class_.__history_mode__ == "diff"
+    )
+    if diff_classes:
+        raise QueryError(
+            f"Cannot query {', '.join(diff_classes)} as of a point in time: "
+            "diff history mode stores patches, use history.version_at()"
+        )
+    live = mapper.local_table
+    if hasattr(entity, "src_id"):
+        voided, identity = VoidedEdge.__table__, ("src_id", "dst_id")
+    else:
+        voided, identity = VoidedNode.__table__, ("node_id",)
+
+    polymorphic_on = mapper.polymorphic_on
+    if polymorphic_on is None:
+        classes = {None: entity}
+    else:
+        classes = {
+            discriminator: sub.class_
+            for discriminator, sub in mapper.polymorphic_map.items()
+            if sub is not mapper
+        }
+
+    # History rows only record the label, classes sharing it are told
+    # apart by the classes of their endpoints
+    shared = shared_labels(mapper)
+    if identity == ("node_id",) and any(cls.get_label() in shared for cls in classes.values()):
+        labels = sorted({cls.get_label() for cls in classes.values()} & shared)
+        raise QueryError(
+            f"Cannot query {entity.__name__} as of a point in time: "
+            f"label {', '.join(labels)} is shared by several node classes"
+        )
+
+    def is_history_of(cls):
+        criterion = voided.c.label == cls.get_label()
+        if cls.get_label() in shared:
+            criterion = and_(criterion, endpoint_criterion(voided, cls))
+        return criterion
+
+    if polymorphic_on is None:
+        is_version = is_history_of(entity)
+        is_live_version = is_version
+        discriminator = None
+    else:
+        # Abstract entity: map the discriminator of the polymorphic union
+        # to history rows and back
+        by_label = {
+            cls.get_label(): value
+            for value, cls in classes.items()
+            if cls.get_label() not in shared
+        }
+        shared_classes = {
+            value: cls for value, cls in classes.items() if cls.get_label() in shared
+        }
+        is_version = or_(
+            voided.c.label.in_(list(by_label)),
+            *(is_history_of(cls) for cls in shared_classes.values()),
+        )
+        is_live_version = voided.c.label == case(
+            {value: cls.get_label() for value, cls in classes.items()}, value=polymorphic_on
+        )
+        discriminator = case(by_label, value=voided.c.label)
+        if shared_classes:
+            is_live_version = and_(
+                is_live_version,
+                or_(
+                    polymorphic_on.notin_(list(shared_classes)),
+                    *(
+                        and_(polymorphic_on == value, endpoint_criterion(voided, cls))
+                        for value, cls in shared_classes.items()
+                    ),
+                ),
+            )
+            discriminator = case(
+                [(is_history_of(cls), value) for value, cls in shared_classes.items()],
+                else_=discriminator,
+            )
+
+    current = (
+        select([live])
+        .where(live.c.created <= timestamp)
+        .where(
+            ~exists().where(
+                and_(
+                    *(voided.c[name] == live.c[name] for name in identity),
+                    is_live_version,
+                    voided.c.voided > timestamp,
+                )
+            )
+        )
+    )
+
+    identity_columns = [voided.c[name] for name in identity]
+    identity_columns.append(voided.c.label if discriminator is None else discriminator)
+    versions = [voided]
+    if discriminator is not None:
+        versions.append(discriminator.label("discriminator"))
+    first_voided = (
+        select(versions)
+        .where(is_version)
+        .where(voided.c.voided > timestamp)
+        .where(voided.c.created <= timestamp)
+        .distinct(*identity_columns)
+        .order_by(*identity_columns, voided.c.voided, voided.c.key)
+        .alias("first_voided")
+    )
+    columns = []
+    for column in live.c:
+        if polymorphic_on is not None and column.name == polymorphic_on.name:
+            value = first_voided.c.discriminator
+        else:
+            value = first_voided.c[VOIDED_COLUMNS.get(column.name, column.name)]
+        columns.append(value.label(column.name))
+
+    return union_all(current, select(columns)).alias("as_of")
+
+
+def shared_labels(mapper):
+    """Returns the labels shared by several concrete classes of the Node or
+    Edge hierarchy of `mapper`
+
+    """
+    counts = Counter(
+        sub.class_.get_label()
+        for sub in mapper.polymorphic_map.values()
+        if not sub.class_.is_abstract_base()
+    )
+    return {label for label, count in counts.items() if count > 1}
+
+
+def endpoint_criterion(voided, edge_cls):
+    """Returns the criterion matching the rows of edge history table
+    `voided` whose src and dst are, or were, nodes of the endpoint classes
+    of `edge_cls`
+
+    """
+    voided_nodes = VoidedNode.__table__
+    criteria = []
+    for side in ("src", "dst"):
+        node_mapper = inspect(edge_cls).relationships[side].mapper
+        node_id = voided.c[f"{side}_id"]
+        criteria.append(
+            or_(
+                exists().where(node_mapper.local_table.c.node_id == node_id),
+                exists().where(
+                    and_(
+                        voided_nodes.c.node_id == node_id,
+                        voided_nodes.c.label == node_mapper.class_.get_label(),
+                    )
+                ),
+            )
+        )
+    return and_(*criteria)
+
+
+# How long history is kept: every version for `keep_all_days`, then the
+# last version of each calendar month until `keep_monthly_days` (None to
+# keep monthly versions forever), then none
+RetentionPolicy = namedtuple("RetentionPolicy", ["keep_all_days", "keep_monthly_days"])
+
+# Label of the policy applying to all labels without a policy of their own
+DEFAULT_POLICY = "*"
+
+# Outcome of one compaction transaction: the number of history rows
+# deleted from `table` under the policy of `label` and their size in
+# bytes, which VACUUM makes reusable
+CompactionBatch = namedtuple("CompactionBatch", ["table", "label", "rows", "bytes"])
+
+
+def parse_policy(spec):
+    """Parse ``LABEL=KEEP_ALL_DAYS[:KEEP_MONTHLY_DAYS]``, as given on the
+    command line, into ``(label, RetentionPolicy)``
+
+    """
+    label, _, days = spec.partition("=")
+    keep_all, _, keep_monthly = days.partition(":")
+    if not label or not keep_all:
+        raise ValueError(f"Invalid retention policy {spec!r}, expected LABEL=DAYS[:DAYS]")
+    return label, RetentionPolicy(int(keep_all), int(keep_monthly) if keep_monthly else None)
+
+
+def compaction_criterion(table, policy, now):
+    """Returns the criterion selecting the rows of history `table` that
+    `policy` no longer keeps at `now`.
+
+    A row is superseded if a newer row of the same entity was voided in
+    the same month.  Entities with patches (``__history_mode__ =
+    "diff"``) are never thinned out, as every patch and checkpoint is
+    needed to rebuild older versions, but are expired.
+
+    """
+    keep_all, keep_monthly = policy
+    if keep_monthly is not None and keep_monthly < keep_all:
+        raise ValueError(f"{policy} keeps monthly versions for less than all versions")
+
+    row, newer, patch = table.alias("candidate"), table.alias("newer"), table.alias("patch")
+
+    def same_entity(other):
+        names = IDENTITY_COLUMNS[table] + ("label",)
+        return and_(*(other.c[name] == row.c[name] for name in names))
+
+    month_end = func.date_trunc("month", row.c.voided) + text("interval '1 month'")
+    superseded = and_(
+        not_(row.c.system_annotations.has_key(PATCH_KEY)),
+        ~exists().where(and_(same_entity(patch), patch.c.system_annotations.has_key(PATCH_KEY))),
+        exists().where(
+            and_(
+                same_entity(newer),
+                newer.c.voided >= row.c.voided,
+                newer.c.voided < month_end,
+                or_(newer.c.voided > row.c.voided, newer.c.key > row.c.key),
+            )
+        ),
+    )
+
+    criterion = superseded
+    if keep_monthly is not None:
+        criterion = or_(row.c.voided < now - datetime.timedelta(days=keep_monthly), superseded)
+    return row, and_(row.c.voided < now - datetime.timedelta(days=keep_all), criterion)
+
+
+def iter_compaction(engine, policies, batch_size=1000, now=None):
+    """Delete the history rows that retention `policies` no longer keep,
+    `batch_size` rows per transaction so that locks are held briefly,
+    yielding a :class:`CompactionBatch` after each commit.
+
+    Interrupting and running it again resumes where it stopped: each
+    batch is committed on its own, and whether a row is kept only
+    depends on rows that are kept too.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+        policies (dict): label to :class:`RetentionPolicy`, with the
+            :data:`DEFAULT_POLICY` key applying to all other labels
+        batch_size (int): rows deleted per transaction
+        now (datetime.datetime): the time retention is counted back
+            from, defaults to the current time
+    Yields:
+        CompactionBatch
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    explicit = sorted(label for label in policies if label != DEFAULT_POLICY)
+    for table in HISTORY_TABLES:
+        for label, policy in sorted(policies.items()):
+            row, criterion = compaction_criterion(table, policy, now)
+            if label == DEFAULT_POLICY:
+                labels = row.c.label.notin_(explicit) if explicit else literal(True)
+            else:
+                labels = row.c.label == label
+
+            # Rows below the last deleted key were all deleted or kept,
+            # so each batch continues from there
+            last_key = 0
+            while True:
+                keys = (
+                    select([row.c.key])
+                    .where(labels)
+                    .where(criterion)
+                    .where(row.c.key > last_key)
+                    .order_by(row.c.key)
+                    .limit(batch_size)
+                )
+                size = func.pg_column_size(literal_column(f"{table.name}.*"))
+                stmt = table.delete().where(table.c.key.in_(keys)).returning(table.c.key, size)
+                with engine.begin() as conn:
+                    deleted = conn.execute(stmt).fetchall()
+                if not deleted:
+                    break
+                last_key = max(key for key, _ in deleted)
+                yield CompactionBatch(
+                    table.name, label, len(deleted), sum(size for _, size in deleted)
+                )
+
+
+def compact_history(engine, policies, batch_size=1000, now=None):
+    """Run :func:`iter_compaction` to the end.
+
+    Returns:
+        tuple: (rows deleted, bytes deleted)
+    """
+    rows = size = 0
+    for batch in iter_compaction(engine, policies, batch_size, now):
+        rows += batch.rows
+        size += batch.bytes
+    return rows, size
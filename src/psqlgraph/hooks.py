@@ -2,10 +2,17 @@
 Session hooks
 """
 from sqlalchemy.inspection import inspect
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
 
-from psqlgraph.base import ExtMixin
+from psqlgraph import outbox
+from psqlgraph.base import VOIDED_SNAPSHOTS, ExtMixin, write_snapshots
 from psqlgraph.edge import AbstractEdge
 from psqlgraph.node import AbstractNode
+from psqlgraph.util import json_equal
+
+# Key in session.info of the number of updates dropped from flushes
+# because they did not change anything, see `drop_noop_changes`
+SKIPPED_UPDATES = "psqlgraph_skipped_updates"
 
 
 def history(target, column, attr):
@@ -43,6 +50,24 @@ def is_psqlgraph_entity(target):
     return isinstance(target, ExtMixin)
 
 
+def drop_noop_changes(target, props, sysan):
+    """Drop the pending _props/_sysan changes of dirty `target` if they
+    merge onto old versions `props` and `sysan` without changing any
+    value, as when identical data is submitted again.  The columns are
+    reset as unchanged so they are not written.
+
+    :returns: bool, whether the changes were dropped
+    """
+    new_props = {**props, **(target._props or {})}
+    new_sysan = {**sysan, **(target._sysan or {})}
+    if not (json_equal(props, new_props) and json_equal(sysan, new_sysan)):
+        return False
+
+    set_committed_value(target, "_props", new_props)
+    set_committed_value(target, "_sysan", new_sysan)
+    return True
+
+
 def receive_before_flush(session, flush_context, instances):
     """Provide a session hook that gets called before the session is
     flushed.
@@ -60,11 +85,38 @@ def receive_before_flush(session, flush_context, instances):
     - Start with unchanged props/sysan
     - Merge deleted props/sysan on top of that
 
+    Updates that leave every property and system annotation as it was,
+    compared as JSON, are not snapshotted or written, and are counted in
+    ``session.info[SKIPPED_UPDATES]``.  Entities with nothing else to
+    write skip the before update hooks.
+
+    The snapshots are queued by `_snapshot_existing` and written
+    together, one multi-row INSERT per history table, once all dirty
+    and deleted entities have been visited.
+
+    If the session writes to the outbox (see psqlgraph.outbox), every
+    insert, update and delete is recorded there the same way.
+
     """
+    try:
+        visit_flushed_entities(session, flush_context, instances)
+    finally:
+        # Rows queued before a hook raised must not be written by the
+        # session's next flush
+        session.info.pop(VOIDED_SNAPSHOTS, None)
+        session.info.pop(outbox.OUTBOX_ROWS, None)
 
+
+def visit_flushed_entities(session, flush_context, instances):
+    """Snapshot, validate and run the session hooks of every entity in
+    the flush, see `receive_before_flush`
+
+    """
     if session._set_flush_timestamps:
         session._flush_timestamp = list(session.execute("SELECT CURRENT_TIMESTAMP"))[0][0]
 
+    write_outbox = getattr(session, "_write_outbox", False)
+
     for target in session.dirty:
         if not is_psqlgraph_entity(target):
             continue
@@ -72,9 +124,27 @@ def receive_before_flush(session, flush_context, instances):
         target._validate()
         props, sysan = get_old_version(target, "unchanged", "deleted")
         props_diff, sysan_diff = get_old_version(target, "deleted", "added")
-        if props_diff or sysan_diff:
+        changed = bool(props_diff or sysan_diff)
+        if changed and drop_noop_changes(target, props, sysan):
+            session.info[SKIPPED_UPDATES] = session.info.get(SKIPPED_UPDATES, 0) + 1
+            if not session.is_modified(target, include_collections=False):
+                # Identical data submitted again, nothing left to write
+                continue
+            changed = False
+        if changed:
             target._snapshot_existing(session, props, sysan)
         target._merge_onto_existing(props, sysan)
+        if changed:
+            # SQLAlchemy compares the columns with ==, under which a JSON
+            # change like true -> 1 is no change
+            flag_modified(target, "_props")
+            flag_modified(target, "_sysan")
+
+        if write_outbox and changed:
+            changed_props = outbox.changed_keys(props, target._props)
+            changed_sysan = outbox.changed_keys(sysan, target._sysan)
+            if changed_props or changed_sysan:
+                outbox.queue_change(session, "update", target, changed_props, changed_sysan)
 
         # Call custom session hook
         for f in target._session_hooks_before_update:
@@ -87,10 +157,15 @@ def receive_before_flush(session, flush_context, instances):
         props, sysan = get_old_version(target, "unchanged", "deleted", "added")
         target._snapshot_existing(session, props, sysan)
 
+        if write_outbox:
+            outbox.queue_change(session, "delete", target, sorted(props), sorted(sysan))
+
         # Call custom session hook
         for f in target._session_hooks_before_delete:
             f(target, session, flush_context, instances)
 
+    write_snapshots(session)
+
     for target in session.new:
         if not is_psqlgraph_entity(target):
             continue
@@ -98,6 +173,13 @@ def receive_before_flush(session, flush_context, instances):
         if isinstance(target, (AbstractNode, AbstractEdge)):
             target._validate()
 
+        if write_outbox:
+            props, sysan = target._props or {}, target._sysan or {}
+            outbox.queue_change(session, "insert", target, sorted(props), sorted(sysan))
+
         # Call custom session hook
         for f in target._session_hooks_before_insert:
             f(target, session, flush_context, instances)
+
+    if write_outbox:
+        outbox.write_changes(session)
@@ -1,12 +1,15 @@
 import abc
 import copy
+import gc
 import logging
 import random
 import uuid
 from collections import defaultdict, deque
+from contextlib import contextmanager
 from typing import Dict, Iterable, List, Optional
 
 import rstr
+from sqlalchemy.orm.attributes import instance_dict, set_committed_value
 
 from psqlgraph import Node
 
@@ -194,6 +197,34 @@ class PropertyFactory:
         return name, self.type_factories[name].random_value(override)
 
 
+class UnionFind:
+    """Disjoint sets of keys, each represented by the key the others were
+    merged into
+
+    """
+
+    def __init__(self):
+        self.parents = {}
+
+    def find(self, key):
+        """Returns the key that `key` was merged into, `key` if none"""
+        root = key
+        while root in self.parents:
+            root = self.parents[root]
+        # Point every key on the way at the root to keep later finds short
+        while key != root:
+            parent = self.parents[key]
+            self.parents[key] = root
+            key = parent
+        return root
+
+    def union(self, key1, key2):
+        """Merge the set of `key2` into the set of `key1`"""
+        root1, root2 = self.find(key1), self.find(key2)
+        if root1 != root2:
+            self.parents[root2] = root1
+
+
 class NodeFactory:
     def __init__(self, models, schema, graph_globals=None):
         self.models = models
@@ -226,7 +257,7 @@ class NodeFactory:
             override = {}
 
         node_json = {
-            "node_id": override.pop("node_id", str(uuid.uuid4())),
+            "node_id": override.pop("node_id") if "node_id" in override else str(uuid.uuid4()),
             "acl": override.pop("acl", []),
             "properties": {},
             "system_annotations": override.pop("system_annotations", {}),
@@ -274,12 +305,43 @@ class NodeFactory:
             return False
 
 
+@contextmanager
+def gc_paused():
+    """Disable the cyclic garbage collector for the duration of the block,
+    restoring its previous state on exit.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def new_edge(edge_cls, edge_ids, endpoints):
+    """Returns a new `edge_cls` edge with no properties between the nodes
+    `endpoints` ({"src": node, "dst": node}) with ids `edge_ids`
+    ({"src_id": ..., "dst_id": ...}).
+
+    The attributes are written to the instance state directly, as
+    ``set_committed_value`` does, instead of through ``Edge.__init__``
+    and the instrumented attributes: no events fire and no history is
+    recorded, which is several times faster.  The edge is still inserted
+    by a flush of its nodes, with all its columns set.
+    """
+    edge = edge_cls.__mapper__.class_manager.new_instance()
+    instance_dict(edge).update(edge_ids, _props={}, _sysan={}, acl=[], **endpoints)
+    return edge
+
+
 class GraphFactory:
     def __init__(self, models, dictionary, graph_globals=None):
         self.models = models
         self.dictionary = dictionary
         self.node_factory = NodeFactory(models, dictionary.schema, graph_globals)
         self.relation_cache = {}
+        self.association_cache = {}
 
     @staticmethod
     def validate_nodes_metadata(nodes, unique_key):
@@ -386,98 +448,173 @@ class GraphFactory:
 
         skip_relations = set(skip_relations) if skip_relations else set()
 
-        unique_key = "submitter_id"
+        if label not in self.node_factory.schema:
+            raise ValueError(f"Node with label '{label}' does not exist")
 
-        # node adjacency map
-        adj_set = defaultdict(set)
-        # label to node objects map
+        # The walk and the merges only need node ids and labels; nodes are
+        # created once the merges are done, only for the ids that are left.
+        node_cls_map = {}
+        # links between nodes, as pairs of node ids
+        links = []
+        # label to node ids map
         label_node_map = defaultdict(set)
-        # submitter_id to node object map
-        nodes_map = {}
-
-        root = self.node_factory.create(label, all_props=all_props)
-
-        if not hasattr(root, unique_key):
-            unique_key = "node_id"
+        # node id to label map
+        node_labels = {}
 
-        label_node_map[root.label].add(root[unique_key])
-        nodes_map[root[unique_key]] = root
+        root_id = str(uuid.uuid4())
+        label_node_map[label].add(root_id)
+        node_labels[root_id] = label
 
-        queue = deque([(root, 0)])
+        queue = deque([(root_id, label, 0)])
 
         while queue:
-            curr_node, depth = queue.popleft()
+            curr_id, curr_label, depth = queue.popleft()
 
             if depth + 1 > max_depth:
                 continue
 
-            if curr_node.label in leaf_labels:
+            if curr_label in leaf_labels:
                 continue
 
-            for relation, edge_info in curr_node._pg_edges.items():
+            if curr_label not in node_cls_map:
+                node_cls_map[curr_label] = self.models.Node.get_subclass(curr_label)
+
+            for relation, edge_info in node_cls_map[curr_label]._pg_edges.items():
                 if relation in skip_relations:
                     continue
 
                 # NOTE: Skipping edges going to the parents to avoid infinite
                 # cycles
-                if self.is_parent_relation(curr_node.label, relation):
+                if self.is_parent_relation(curr_label, relation):
                     continue
 
                 # 80% of the time we will walk to children
                 if random.randrange(5) == 0:
                     continue
 
-                child_cls = edge_info["type"]
-
-                child_node = self.node_factory.create(child_cls.get_label(), all_props=all_props)
+                child_label = edge_info["type"].get_label()
+                child_id = str(uuid.uuid4())
 
-                label_node_map[child_node.get_label()].add(child_node[unique_key])
-                nodes_map[child_node[unique_key]] = child_node
+                label_node_map[child_label].add(child_id)
+                node_labels[child_id] = child_label
 
-                adj_set[curr_node[unique_key]].add(child_node[unique_key])
-                adj_set[child_node[unique_key]].add(curr_node[unique_key])
+                links.append((curr_id, child_id))
 
-                queue.append((child_node, depth + 1))
+                queue.append((child_id, child_label, depth + 1))
 
-        for node_label, unique_key_set in label_node_map.items():
+        merged = UnionFind()
+        for node_label, node_id_set in label_node_map.items():
             # randomly merge half of the nodes of same type
-            for _ in range(len(unique_key_set) // 2):
-                unique_key1 = unique_key_set.pop()
-                unique_key2 = unique_key_set.pop()
-
-                # sub_id2 will be merged into sub_id1
-                unique_key_set.add(unique_key1)
-
-                # remove node with sub_id2
-                nodes_map.pop(unique_key2)
-
-                # remove adjacency set for sub_id2
-                sub_id2_edges = adj_set.pop(unique_key2)
-
-                # remove all references of sub_id2 from other adjacency sets
-                for _, adj in adj_set.items():
-                    if unique_key2 in adj:
-                        adj.remove(unique_key2)
-
-                # link sub_id2's neighbours to sub_id1
-                for sub_id in sub_id2_edges:
-                    adj_set[unique_key1].add(sub_id)
-                    adj_set[sub_id].add(unique_key1)
-
-        for src_id, dst_node_ids in adj_set.items():
-            src_node = nodes_map.get(src_id)
-            if not src_node:
-                continue
-
-            for dst_id in dst_node_ids:
-                dst_node = nodes_map.get(dst_id)
-                if not dst_node:
+            for _ in range(len(node_id_set) // 2):
+                node_id1 = node_id_set.pop()
+                node_id2 = node_id_set.pop()
+
+                # node_id2 will be merged into node_id1
+                node_id_set.add(node_id1)
+                merged.union(node_id1, node_id2)
+
+                # drop node_id2
+                node_labels.pop(node_id2)
+
+        # Building this many ORM objects at once sets off the cyclic garbage
+        # collector over and over, which would take about as long as the
+        # construction itself.
+        with gc_paused():
+            nodes_map = {
+                node_id: self.node_factory.create(
+                    node_label, override={"node_id": node_id}, all_props=all_props
+                )
+                for node_id, node_label in node_labels.items()
+            }
+
+            # resolve every link to the nodes its ends were merged into
+            adj_set = defaultdict(set)
+            for node_id1, node_id2 in links:
+                node_id1, node_id2 = merged.find(node_id1), merged.find(node_id2)
+                adj_set[node_id1].add(node_id2)
+                adj_set[node_id2].add(node_id1)
+
+            # Edges are built directly, with the same association
+            # make_association() would pick, rather than appended through the
+            # association proxies: the events fired on each append dominate
+            # the generation time of large subgraphs.
+            node_edges = defaultdict(list)
+            edge_keys = set()
+            for src_id, dst_node_ids in adj_set.items():
+                src_node = nodes_map.get(src_id)
+                if not src_node:
                     continue
 
-                self.make_association(src_node, dst_node)
+                for dst_id in dst_node_ids:
+                    dst_node = nodes_map.get(dst_id)
+                    if not dst_node:
+                        continue
+
+                    association = self.find_association(type(src_node), type(dst_node))
+                    if not association:
+                        logging.debug(
+                            "Could not find a direct relation between '{}'<->'{}'".format(
+                                src_node.label, dst_node.label
+                            )
+                        )
+                        continue
+
+                    edge_cls, src_side, src_edges, dst_side, dst_edges = association
+                    edge_ids = {
+                        f"{src_side}_id": src_node.node_id,
+                        f"{dst_side}_id": dst_node.node_id,
+                    }
+                    # both directions of a link can resolve to the same edge
+                    edge_key = (edge_cls, edge_ids["src_id"], edge_ids["dst_id"])
+                    if edge_key in edge_keys:
+                        continue
+                    edge_keys.add(edge_key)
+
+                    edge = new_edge(edge_cls, edge_ids, {src_side: src_node, dst_side: dst_node})
+                    node_edges[src_id, src_edges].append(edge)
+                    node_edges[dst_id, dst_edges].append(edge)
+
+            for (node_id, edges_name), edges in node_edges.items():
+                set_committed_value(nodes_map[node_id], edges_name, edges)
 
         return list(nodes_map.values())
 
+    def find_association(self, src_cls, dst_cls):
+        """
+        Find the edge make_association() would create from a `src_cls` node
+        to a `dst_cls` node: the first _pg_edges association of `src_cls`
+        whose type `dst_cls` is.
+
+        :param src_cls: Node class the association is read from
+        :param dst_cls: Node class the association points to
+        :return: None if the classes are not related, otherwise a tuple of
+            the edge class, the edge side ("src" or "dst") the `src_cls`
+            node is on and the name of its edge collection, then the same
+            two for the `dst_cls` node
+        """
+        key = (src_cls, dst_cls)
+        if key in self.association_cache:
+            return self.association_cache[key]
+
+        association = None
+        for assoc_name, assoc_meta in src_cls._pg_edges.items():
+            if issubclass(dst_cls, assoc_meta["type"]):
+                proxy = getattr(src_cls, assoc_name)
+                src_edges = src_cls.__mapper__.relationships[proxy.target_collection]
+                dst_side = proxy.value_attr
+                dst_edges = src_edges.mapper.relationships[dst_side].back_populates
+                association = (
+                    src_edges.mapper.class_,
+                    src_edges.back_populates,
+                    src_edges.key,
+                    dst_side,
+                    dst_edges,
+                )
+                break
+
+        self.association_cache[key] = association
+        return association
+
     def is_parent_relation(self, label, relation):
         """
         Given a relation name (e.g. `cases`), determine whether this relation
@@ -1,16 +1,25 @@
-from sqlalchemy import Column, Index, Text, UniqueConstraint
+from sqlalchemy import Column, Index, Text, UniqueConstraint, event, func
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Mapper, object_session, relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
-from psqlgraph import base, traversals
+from psqlgraph import base, history, subgraph, traversals
 from psqlgraph.edge import Edge
 from psqlgraph.voided_node import VoidedNode
 
 DST_SRC_ASSOC = "__dst_src_assoc__"
 SRC_DST_ASSOC = "__src_dst_assoc__"
 
+# Mapped node classes, in mapping order, whose edges are wired before
+# the mappers are configured
+NODE_CLASSES = []
+
+# Edge direction => the edge endpoints (src/dst) that point at the node
+EDGE_DIRECTIONS = {"in": ("dst",), "out": ("src",), "both": ("dst", "src")}
+
 
 def reverse_lookup(dictionary, search_val):
     for key, val in dictionary.items():
@@ -28,10 +37,18 @@ class NodeAssociationProxyMixin:
         return list()
 
     @classmethod
-    def __declare_last__(cls):
+    def wire_edges(cls):
         """
-        Execute once after all mappings has been configured by sqlalchemy
-        Maps edges to nodes based on definitions.
+        Execute before sqlalchemy configures the mappers, each time new
+        mappings are configured (see :func:`wire_node_edges`). Maps
+        edges to nodes based on definitions.
+
+        The edges touching this class are looked up by class name in the
+        abstract edge's subclass index rather than by scanning every
+        edge. Both sides of each relationship are declared explicitly
+        while the mappers are still unconfigured, so sqlalchemy sets them
+        all up in one pass instead of re-deriving the polymorphic base
+        mappers as each backref is added.
 
         NOTE: Had to be moved outside of Node class, because of:
         https://github.com/zzzeek/sqlalchemy/blob/master/lib/sqlalchemy/ext/declarative/base.py#L87-L97
@@ -39,40 +56,25 @@ class NodeAssociationProxyMixin:
         https://github.com/zzzeek/sqlalchemy/commit/4c931b2ec7e0f09ac8c3ebe28c794f5858d54efb
         """
 
-        edge_cls = cls.get_edge_class()
-        for scls in edge_cls.get_subclasses():
+        edge_index = cls.get_edge_class().get_subclass_index()
 
+        for scls in edge_index.by_dst.get(cls.__name__, []):
             if scls.is_abstract_base():
                 continue
+            name_in = f"_{scls.__name__}_in"
+            if not hasattr(cls, name_in):
+                cls._set_edge_relationship(scls, name_in, scls.dst_id, "dst")
+                cls._edges_in.append(name_in)
+            cls._set_association_proxy(scls, getattr(scls, DST_SRC_ASSOC), name_in, "src")
 
-            name = scls.__name__
-            name_in = f"_{name}_in"
-            name_out = f"_{name}_out"
-            src_assoc = getattr(scls, SRC_DST_ASSOC)
-            dst_assoc = getattr(scls, DST_SRC_ASSOC)
-
-            if scls.__dst_class__ == cls.__name__:
-                if not hasattr(cls, name_in):
-                    edge_in = relationship(
-                        name,
-                        foreign_keys=[scls.dst_id],
-                        backref="dst",
-                        cascade="all, delete, delete-orphan",
-                    )
-                    setattr(cls, name_in, edge_in)
-                    cls._edges_in.append(name_in)
-                cls._set_association_proxy(scls, dst_assoc, name_in, "src")
-            if scls.__src_class__ == cls.__name__:
-                if not hasattr(cls, name_out):
-                    edge_out = relationship(
-                        name,
-                        foreign_keys=[scls.src_id],
-                        backref="src",
-                        cascade="all, delete, delete-orphan",
-                    )
-                    setattr(cls, name_out, edge_out)
-                    cls._edges_out.append(name_out)
-                cls._set_association_proxy(scls, src_assoc, name_out, "dst")
+        for scls in edge_index.by_src.get(cls.__name__, []):
+            if scls.is_abstract_base():
+                continue
+            name_out = f"_{scls.__name__}_out"
+            if not hasattr(cls, name_out):
+                cls._set_edge_relationship(scls, name_out, scls.src_id, "src")
+                cls._edges_out.append(name_out)
+            cls._set_association_proxy(scls, getattr(scls, SRC_DST_ASSOC), name_out, "dst")
 
     @hybrid_property
     def edges_in(self):
@@ -82,6 +84,22 @@ class NodeAssociationProxyMixin:
     def edges_out(self):
         return [e for rel in self._edges_out for e in getattr(self, rel)]
 
+    @classmethod
+    def _set_edge_relationship(cls, edge_cls, name, foreign_key, edge_side):
+        """Relates `cls` to the edges of `edge_cls` as collection `name`,
+        pointed back at by the edge's `edge_side` ("src" or "dst")
+
+        """
+        edges = relationship(
+            edge_cls.__name__,
+            foreign_keys=[foreign_key],
+            back_populates=edge_side,
+            cascade="all, delete, delete-orphan",
+        )
+        setattr(cls, name, edges)
+        node = relationship(cls.__name__, foreign_keys=[foreign_key], back_populates=name)
+        setattr(edge_cls, edge_side, node)
+
     @classmethod
     def _set_association_proxy(cls, edge_cls, attr_name, edge_name, direction):
         rel = association_proxy(
@@ -93,11 +111,36 @@ class NodeAssociationProxyMixin:
         yield from self.edges_in
         yield from self.edges_out
 
+    def load_all_edges(self, direction="both"):
+        """Load every edge of this node in `direction` ('in', 'out' or
+        'both'), and the nodes at their other ends, with at most two
+        queries per direction rather than one lazy load per edge
+        relationship and per far node. See :func:`load_all_edges`.
+
+        """
+        load_all_edges([self], direction)
+
     @classmethod
     def get_edge_class(cls):
         return Edge
 
 
+@event.listens_for(NodeAssociationProxyMixin, "instrument_class", propagate=True)
+def register_edge_wiring(mapper, cls):
+    """Track the mapped node classes whose edges :func:`wire_node_edges`
+    wires.  This is not a ``__declare_first__`` hook, as the one of the
+    sqlalchemy concrete bases earlier in the MRO would shadow it.
+
+    """
+    NODE_CLASSES.append(cls)
+
+
+@event.listens_for(Mapper, "before_configured")
+def wire_node_edges():
+    for cls in list(NODE_CLASSES):
+        cls.wire_edges()
+
+
 class AbstractNode(NodeAssociationProxyMixin, base.ExtMixin):
 
     node_id = Column(
@@ -133,7 +176,9 @@ class AbstractNode(NodeAssociationProxyMixin, base.ExtMixin):
             Index(f"{cls.__tablename__}_node_id_idx", "node_id"),
         )
 
-    def traverse(self, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate=None):
+    def traverse(
+        self, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate=None, state=None
+    ):
         """
         Performs a traversal starting at the current node
         Args:
@@ -143,11 +188,35 @@ class AbstractNode(NodeAssociationProxyMixin, base.ExtMixin):
                             `in`: use node.edges_in, default behavior
             edge_predicate (func): a predicate performed on an `edge` object in
             order to decided whether to walk that edge or not
+            state (TraversalState): kept up to date as the traversal goes, or
+            the checkpoint of a traversal to resume, see
+            :class:`psqlgraph.traversals.TraversalState`
 
         Returns:
             generator: nodes found in the sub tree
         """
-        return traversals.traverse(self, mode, max_depth, edge_pointer, edge_predicate)
+        return traversals.traverse(self, mode, max_depth, edge_pointer, edge_predicate, state)
+
+    def shortest_path(self, dst, max_depth=None, edge_predicate=None, edge_pointer="both"):
+        """
+        Finds a shortest chain of edges from this node to node `dst`, see
+        :func:`psqlgraph.traversals.shortest_path`
+
+        Returns:
+            list: edges of the path, or None if there is none within max_depth
+        """
+        return traversals.shortest_path(self, dst, max_depth, edge_predicate, edge_pointer)
+
+    def extract_subgraph(self, max_depth=None, edge_pointer="in", edge_predicate=None):
+        """
+        Extracts the nodes reached from this node, and the edges walked to
+        reach them, as a detached subgraph, see
+        :func:`psqlgraph.subgraph.extract_subgraph`
+
+        Returns:
+            Subgraph: node and edge records
+        """
+        return subgraph.extract_subgraph(self, max_depth, edge_pointer, edge_predicate)
 
     def bfs_children(self, edge_predicate=None, max_depth=None):
         return self.traverse(edge_predicate=edge_predicate, max_depth=max_depth)
@@ -167,9 +236,7 @@ class AbstractNode(NodeAssociationProxyMixin, base.ExtMixin):
         self._props = {}
         self.system_annotations = system_annotations or {}
         self.acl = acl or []
-        self.properties = self._defaults
-        self.properties.update(properties)
-        self.properties.update(kwargs)
+        self.set_properties({**self._defaults, **(properties or {}), **kwargs})
         self.node_id = node_id
 
     @property
@@ -229,17 +296,17 @@ class AbstractNode(NodeAssociationProxyMixin, base.ExtMixin):
 
     @classmethod
     def get_subclass(cls, label):
-        for c in cls.get_subclasses():
-            if c.get_label() == label:
-                return c
-        return None
+        scls = cls.get_subclass_index().by_label.get(label)
+        if not scls:
+            return None
+        return scls[0]
 
     @classmethod
     def get_subclass_named(cls, name):
-        for c in cls.get_subclasses():
-            if c.__name__ == name:
-                return c
-        raise KeyError(f"Node has no subclass named {name}")
+        try:
+            return cls.get_subclass_index().by_name[name]
+        except KeyError:
+            raise KeyError(f"Node has no subclass named {name}")
 
     @property
     def _history(self):
@@ -249,18 +316,32 @@ class AbstractNode(NodeAssociationProxyMixin, base.ExtMixin):
         return self.get_history(session)
 
     def get_history(self, session):
+        """Query the voided versions of this node, newest first.  Patches
+        written in "diff" history mode are returned as the versions they
+        recorded, see :class:`psqlgraph.history.VersionQuery`.
+
+        """
         assert self.label, "Specify label for node history"
         return (
-            session.query(VoidedNode)
+            history.VersionQuery(VoidedNode, session, entity=self)
             .filter(VoidedNode.node_id == self.node_id)
             .filter(VoidedNode.label == self.label)
             .order_by(VoidedNode.voided.desc())
         )
 
     def _snapshot_existing(self, session, old_props, old_sysan):
-        temp = TmpNode(self.node_id, old_props, self.acl, old_sysan, self.label, self.created)
-        voided = VoidedNode(temp)
-        session.add(voided)
+        row = {
+            "node_id": self.node_id,
+            "label": self.label,
+            "acl": self.acl,
+            "created": func.now() if self.created is None else self.created,
+            "properties": old_props,
+            "system_annotations": old_sysan,
+        }
+        patch = None
+        if self.__history_mode__ == "diff" and self not in session.deleted:
+            patch = base.snapshot_patch(("node_id", "label"), self, old_props, old_sysan)
+        base.queue_snapshot(session, VoidedNode.__table__, row, patch)
 
 
 class Node(base.LocalConcreteBase, AbstractNode, base.ORMBase):
@@ -291,3 +372,109 @@ def PolyNode(node_id=None, label=None, acl=None, system_annotations=None, proper
         system_annotations=system_annotations or {},
         label=label,
     )
+
+
+def load_all_edges(nodes, direction="both", session=None):
+    """Load every incident edge of a batch of nodes and populate their
+    `_<Edge>_in`/`_<Edge>_out` relationship collections, so that
+    `edges_in`, `edges_out`, `get_edges()` and the association proxies
+    cost no further queries.
+
+    Each direction is a single query on the abstract edge, i.e. a
+    UNION ALL of the edge tables, pruned to the edge classes that can
+    touch the given node classes, and a single query on the abstract
+    node for the far endpoints missing from the session. Relationships
+    that are already loaded are left as they are so pending changes are
+    not overwritten.
+
+    :param nodes: the nodes to load edges for
+    :param str direction: 'in', 'out' or 'both'
+    :param session: defaults to the session of the first node
+
+    """
+    if direction not in EDGE_DIRECTIONS:
+        raise ValueError(f"direction must be one of {sorted(EDGE_DIRECTIONS)}, not {direction}")
+
+    nodes = list(nodes)
+    if not nodes:
+        return
+    session = session or object_session(nodes[0])
+    for side in EDGE_DIRECTIONS[direction]:
+        _load_incident_edges(session, nodes, side)
+
+
+def _load_incident_edges(session, nodes, side):
+    edge_cls = nodes[0].get_edge_class()
+    index = edge_cls.get_subclass_index()
+    edges_by_node_class = index.by_dst if side == "dst" else index.by_src
+    suffix = "in" if side == "dst" else "out"
+
+    by_key = {(type(node).__name__, node.node_id): node for node in nodes}
+    loaded = {key: {} for key in by_key}
+    edge_classes = [
+        scls
+        for class_name in {class_name for class_name, _ in by_key}
+        for scls in edges_by_node_class.get(class_name, [])
+        if not scls.is_abstract_base()
+    ]
+
+    if edge_classes:
+        node_id = getattr(edge_cls, f"{side}_id")
+        identities = [scls.__mapper__.polymorphic_identity for scls in edge_classes]
+        query = (
+            session.query(edge_cls)
+            .filter(edge_cls.__mapper__.polymorphic_on.in_(identities))
+            .filter(node_id.in_({node_id for _, node_id in by_key}))
+        )
+        edges = []
+        for edge in query:
+            key = (getattr(edge, f"__{side}_class__"), getattr(edge, f"{side}_id"))
+            node = by_key.get(key)
+            if node is None:
+                continue
+            name = f"_{type(edge).__name__}_{suffix}"
+            loaded[key].setdefault(name, []).append(edge)
+            if side not in edge.__dict__:
+                set_committed_value(edge, side, node)
+            edges.append(edge)
+        _load_far_endpoints(session, edge_cls, edges, "src" if side == "dst" else "dst")
+
+    for key, node in by_key.items():
+        names = node._edges_in if side == "dst" else node._edges_out
+        for name in names:
+            if name not in node.__dict__:
+                set_committed_value(node, name, loaded[key].get(name, []))
+
+
+def _load_far_endpoints(session, edge_cls, edges, side):
+    """Set the `side` endpoint of `edges` from the session's identity map
+    or else one query for all of them, so that association proxies over
+    the edges do not lazy load one node per edge
+
+    """
+    node_cls = edge_cls.get_node_class()
+    index = node_cls.get_subclass_index()
+    missing = {}
+    for edge in edges:
+        if side in edge.__dict__:
+            continue
+        key = (getattr(edge, f"__{side}_class__"), getattr(edge, f"{side}_id"))
+        node = session.identity_map.get(identity_key(index.by_name[key[0]], key[1]))
+        if node is None:
+            missing.setdefault(key, []).append(edge)
+        else:
+            set_committed_value(edge, side, node)
+    if not missing:
+        return
+
+    identities = {
+        index.by_name[class_name].__mapper__.polymorphic_identity for class_name, _ in missing
+    }
+    query = (
+        session.query(node_cls)
+        .filter(node_cls.__mapper__.polymorphic_on.in_(identities))
+        .filter(node_cls.node_id.in_({node_id for _, node_id in missing}))
+    )
+    for node in query:
+        for edge in missing.get((type(node).__name__, node.node_id), []):
+            set_committed_value(edge, side, node)
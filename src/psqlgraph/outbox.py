@@ -0,0 +1,297 @@
+"""
+Change data capture outbox.
+
+When a driver is created with ``outbox=True``, every flush records one
+row per inserted, updated and deleted node or edge in the `_outbox`
+table, in the same transaction as the change itself.  A row holds the
+transaction id, the operation, the label, the node id (or the src and
+dst ids of an edge) and the names of the properties and system
+annotations that changed.  The flush also sends a ``NOTIFY`` on
+:data:`CHANNEL`, which Postgres delivers when the transaction commits.
+
+Consumers read the outbox in batches and acknowledge what they have
+processed, each under its own name, so several indexers can follow the
+same outbox::
+
+    from psqlgraph import outbox
+
+    outbox.create_outbox(engine)
+    g = PsqlGraphDriver(..., outbox=True)
+
+    consumer = outbox.OutboxConsumer(engine, "es-indexer")
+    for batch in consumer.stream(timeout=30):
+        reindex(batch)
+        consumer.ack(batch)
+
+Rows are ordered by (txid, key) and a batch only ever contains rows of
+transactions older than every transaction still in progress, so rows
+never appear behind a consumer's acknowledged position.  A long running
+transaction therefore holds back all consumers until it ends.
+"""
+import select
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, Text, and_, func, or_, text, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.declarative import declarative_base
+
+from psqlgraph.edge import AbstractEdge
+from psqlgraph.util import json_equal
+
+# Channel notified by every flush that writes to the outbox
+CHANNEL = "psqlgraph_outbox"
+
+# Key in session.info of the outbox rows queued during a flush
+OUTBOX_ROWS = "psqlgraph_outbox_rows"
+
+OutboxBase = declarative_base()
+
+
+class OutboxEntry(OutboxBase):
+
+    __tablename__ = "_outbox"
+
+    key = Column(BigInteger, primary_key=True, nullable=False)
+
+    txid = Column(
+        BigInteger,
+        nullable=False,
+        server_default=text("txid_current()"),
+    )
+
+    created = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=text("now()"),
+    )
+
+    # insert, update or delete
+    op = Column(Text, nullable=False)
+
+    label = Column(Text, nullable=False)
+
+    # node_id for nodes, src_id and dst_id for edges
+    node_id = Column(Text)
+    src_id = Column(Text)
+    dst_id = Column(Text)
+
+    # Names of the properties and system annotations that changed
+    properties = Column(ARRAY(Text), nullable=False)
+    system_annotations = Column(ARRAY(Text), nullable=False)
+
+    # Consumers read in (txid, key) order from their last position
+    __table_args__ = (Index("_outbox_txid_key_idx", txid, key),)
+
+
+class OutboxPosition(OutboxBase):
+    """Position of the last row acknowledged by each consumer"""
+
+    __tablename__ = "_outbox_positions"
+
+    consumer = Column(Text, primary_key=True, nullable=False)
+    txid = Column(BigInteger, nullable=False)
+    key = Column(BigInteger, nullable=False)
+
+
+def create_outbox(engine):
+    """Create the outbox tables
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+    """
+    OutboxBase.metadata.create_all(engine)
+
+
+def drop_outbox(engine):
+    """Drop the outbox tables
+
+    Args:
+        engine (sqlalchemy.engine.Engine): active engine instance
+    """
+    OutboxBase.metadata.drop_all(engine)
+
+
+def changed_keys(old, new):
+    """Returns the sorted keys whose values differ between dicts `old` and `new`"""
+    return sorted(k for k in old.keys() | new.keys() if not json_equal(old.get(k), new.get(k)))
+
+
+def queue_change(session, op, target, properties, system_annotations):
+    """Queue an outbox row recording `op` on node or edge `target`, to be
+    written by :func:`write_changes` with the others of the same flush
+
+    """
+    row = {
+        "op": op,
+        "label": target.label,
+        "properties": properties,
+        "system_annotations": system_annotations,
+    }
+    # Every row of a multi-row INSERT needs the same columns
+    if isinstance(target, AbstractEdge):
+        row.update(node_id=None, src_id=target.src_id, dst_id=target.dst_id)
+    else:
+        row.update(node_id=target.node_id, src_id=None, dst_id=None)
+    session.info.setdefault(OUTBOX_ROWS, []).append(row)
+
+
+def write_changes(session):
+    """Write the queued outbox rows in one multi-row INSERT and notify
+    :data:`CHANNEL`.  The notification is delivered on commit.
+
+    """
+    rows = session.info.pop(OUTBOX_ROWS, None)
+    if not rows:
+        return
+    session.execute(OutboxEntry.__table__.insert().values(rows))
+    session.execute(func.pg_notify(CHANNEL, "").select())
+
+
+class OutboxConsumer:
+    """Reads the outbox in batches from the position last acknowledged
+    under `name`.
+
+    :param engine: active engine instance
+    :param str name: consumer name, the key of its position
+    :param int batch_size: maximum number of rows per batch
+    """
+
+    def __init__(self, engine, name, batch_size=500):
+        self.engine = engine
+        self.name = name
+        self.batch_size = batch_size
+        self._listener = None
+
+    def position(self):
+        """Returns the (txid, key) of the last acknowledged row, (0, 0) if
+        nothing was acknowledged yet
+
+        """
+        table = OutboxPosition.__table__
+        query = table.select().where(table.c.consumer == self.name)
+        with self.engine.connect() as conn:
+            found = conn.execute(query).first()
+        return (found.txid, found.key) if found else (0, 0)
+
+    def fetch(self, position=None):
+        """Returns the next batch of rows after `position` (default: the
+        acknowledged position), oldest first
+
+        """
+        table = OutboxEntry.__table__
+        position = self.position() if position is None else position
+        # Transactions below the snapshot's xmin have all ended, so no
+        # row can appear before the ones returned here
+        xmin = func.txid_snapshot_xmin(func.txid_current_snapshot())
+        query = (
+            table.select()
+            .where(tuple_(table.c.txid, table.c.key) > tuple_(*position))
+            .where(table.c.txid < xmin)
+            .order_by(table.c.txid, table.c.key)
+            .limit(self.batch_size)
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(query).fetchall()
+
+    def batches(self):
+        """Yield batches until the outbox has been read to its end.  Each
+        batch follows the previous one whether or not it was
+        acknowledged.
+
+        """
+        position = None
+        while True:
+            batch = self.fetch(position)
+            if not batch:
+                return
+            yield batch
+            position = (batch[-1].txid, batch[-1].key)
+
+    def ack(self, batch):
+        """Acknowledge every row up to the last one of `batch`"""
+        if not batch:
+            return
+        last = batch[-1]
+        stmt = insert(OutboxPosition.__table__).values(
+            consumer=self.name, txid=last.txid, key=last.key
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["consumer"], set_={"txid": last.txid, "key": last.key}
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def listen(self):
+        """Start listening to :data:`CHANNEL` on a dedicated connection, so
+        that :meth:`wait` does not miss notifications sent in between
+
+        """
+        if self._listener is None:
+            conn = self.engine.raw_connection()
+            conn.detach()
+            conn.connection.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            self._listener = conn
+        return self._listener
+
+    def wait(self, timeout=None):
+        """Block until a flush writes to the outbox or `timeout` seconds
+        pass.
+
+        :returns: bool, whether a notification arrived
+        """
+        dbapi_conn = self.listen().connection
+        if not dbapi_conn.notifies:
+            if select.select([dbapi_conn], [], [], timeout) == ([], [], []):
+                return False
+            dbapi_conn.poll()
+        received = bool(dbapi_conn.notifies)
+        dbapi_conn.notifies.clear()
+        return received
+
+    def stream(self, timeout=None):
+        """Yield batches as they become available, waiting for
+        notifications in between.  Stops once the outbox has been read
+        to its end and no notification arrived for `timeout` seconds, or
+        never if `timeout` is None.  Batches must be acknowledged with
+        :meth:`ack`; unacknowledged batches are read again.
+
+        """
+        self.listen()
+        while True:
+            caught_up = False
+            while not caught_up:
+                batch = self.fetch()
+                caught_up = len(batch) < self.batch_size
+                if batch:
+                    yield batch
+            if not self.wait(timeout):
+                return
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+
+def prune(engine):
+    """Delete the outbox rows acknowledged by every consumer that has
+    acknowledged any
+
+    :returns: int, the number of rows deleted
+    """
+    entries, positions = OutboxEntry.__table__, OutboxPosition.__table__
+    oldest = (
+        positions.select()
+        .with_only_columns([positions.c.txid, positions.c.key])
+        .order_by(positions.c.txid, positions.c.key)
+        .limit(1)
+    )
+    with engine.begin() as conn:
+        found = conn.execute(oldest).first()
+        if found is None:
+            return 0
+        stale = or_(
+            entries.c.txid < found.txid,
+            and_(entries.c.txid == found.txid, entries.c.key <= found.key),
+        )
+        return conn.execute(entries.delete().where(stale)).rowcount
@@ -5,6 +5,7 @@ import logging
 import socket
 
 # External modules
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 
 from sqlalchemy import create_engine, event
@@ -13,7 +14,7 @@ from sqlalchemy.orm.attributes import flag_modified
 from xlocal import xlocal
 
 # Custom modules
-from psqlgraph import ext
+from psqlgraph import ext, traversals
 from psqlgraph.edge import AbstractEdge
 from psqlgraph.exc import QueryError
 from psqlgraph.hooks import receive_before_flush
@@ -47,6 +48,9 @@ class PsqlGraphDriver:
             defaults to `False`, Controls whether new sessions are set to only allow read only queries or not.
             This value is used while creating new sessions and can be replaced by passing a different value while
             creating the session.
+        :param bool outbox:
+            defaults to `False`.  Setting this to `True` records every node and edge insert, update and
+            delete in the outbox table, see :mod:`psqlgraph.outbox`.
         """
 
         # Parse kwargs
@@ -57,6 +61,7 @@ class PsqlGraphDriver:
         kwargs.pop("node_validator", None)
         kwargs.pop("edge_validator", None)
         self.set_flush_timestamps = kwargs.pop("set_flush_timestamps", True)
+        self.outbox = kwargs.pop("outbox", False)
         if "isolation_level" not in kwargs:
             kwargs["isolation_level"] = "REPEATABLE_READ"
         if "application_name" in kwargs:
@@ -98,6 +103,7 @@ class PsqlGraphDriver:
         session = Session(package_namespace=self.package_namespace)
         session._flush_timestamp = None
         session._set_flush_timestamps = self.set_flush_timestamps
+        session._write_outbox = self.outbox
         event.listen(session, "before_flush", receive_before_flush)
 
         if read_only:
@@ -275,6 +281,43 @@ class PsqlGraphDriver:
     def voided_edges(self, query=VoidedEdge):
         return self.__expand_query(query)
 
+    def traverse_many(self, roots, workers=None, **kwargs):
+        """Breadth first traversals from every node of `roots`, see
+        :func:`psqlgraph.traversals.traverse_many`.
+
+        With `workers`, the roots are split across a pool of that many
+        threads, each traversing its share in its own session.  Results
+        are yielded per worker as they finish and the nodes they hold are
+        detached from the closed worker sessions.
+
+        :param roots: nodes to start traversals at
+        :param int workers: number of threads, or None to traverse in the
+            roots' session
+        :param kwargs: max_depth, edge_pointer and edge_predicate
+        :returns: generator of (root, node, depth)
+        """
+        if not workers:
+            return traversals.traverse_many(roots, **kwargs)
+        roots = {root.node_id: root for root in roots}
+        return self._traverse_many_threaded(roots, workers, kwargs)
+
+    def _traverse_many_threaded(self, roots, workers, kwargs):
+        def traverse(node_ids):
+            with self.session_scope(can_inherit=False):
+                return [
+                    (roots[root.node_id], node, depth)
+                    for root, node, depth in traversals.traverse_many(
+                        self.nodes().ids(node_ids).all(), **kwargs
+                    )
+                ]
+
+        node_ids = list(roots)
+        with ThreadPoolExecutor(workers) as executor:
+            chunks = [node_ids[i::workers] for i in range(workers)]
+            futures = [executor.submit(traverse, chunk) for chunk in chunks if chunk]
+            for future in as_completed(futures):
+                yield from future.result()
+
     def set_node_validator(self, node_validator):
         raise NotImplementedError("Deprecated.")
 
@@ -485,26 +528,71 @@ class PsqlGraphDriver:
             local.merge(edge)
         return edge
 
-    def edge_lookup_one(self, src_id=None, dst_id=None, label=None, voided=False, session=None):
-        return self.edge_lookup(src_id, dst_id, label, voided, session).scalar()
+    def edge_lookup_one(
+        self,
+        src_id=None,
+        dst_id=None,
+        label=None,
+        voided=False,
+        session=None,
+        src_label=None,
+        dst_label=None,
+    ):
+        return self.edge_lookup(
+            src_id, dst_id, label, voided, session, src_label, dst_label
+        ).scalar()
+
+    def edge_lookup(
+        self,
+        src_id=None,
+        dst_id=None,
+        label=None,
+        voided=False,
+        session=None,
+        src_label=None,
+        dst_label=None,
+    ):
+        """Lookup edges by endpoint ids and labels.
+
+        Any of `label`, `src_label` and `dst_label` that are given prune
+        the query to the edge tables that can hold matching edges
+        rather than searching every edge table.
 
-    def edge_lookup(self, src_id=None, dst_id=None, label=None, voided=False, session=None):
+        """
         if voided:
-            queries = [self.voided_edges()]
-        elif label is not None:
-            edge_cls = ext.get_abstract_edge(self.package_namespace)
-            queries = [self.edges(cls) for cls in edge_cls._get_subclasses_labeled(label)]
-        else:
-            queries = [self.edges()]
+            query = self.voided_edges()
+            if src_id is not None:
+                query = query.src(src_id)
+            if dst_id is not None:
+                query = query.dst(dst_id)
+            return query
 
+        edge_cls = ext.get_abstract_edge(self.package_namespace)
+        query = self.edges()
+        if label is not None:
+            query = query.labels(label)
+
+        src_class = self._get_node_class_name(src_label)
         if src_id is not None:
-            queries = [q.src(src_id) for q in queries]
+            query = query.src(src_id, src_class)
+        elif src_class is not None:
+            query = query.with_subclasses(edge_cls._get_edges_with_src(src_class))
+
+        dst_class = self._get_node_class_name(dst_label)
         if dst_id is not None:
-            queries = [q.dst(dst_id) for q in queries]
-        if len(queries) > 1:
-            return queries[0].union_all(*queries[1:])
-        else:
-            return queries[0]
+            query = query.dst(dst_id, dst_class)
+        elif dst_class is not None:
+            query = query.with_subclasses(edge_cls._get_edges_with_dst(dst_class))
+
+        return query
+
+    def _get_node_class_name(self, label):
+        if label is None:
+            return None
+        node_cls = ext.get_abstract_node(self.package_namespace).get_subclass(label)
+        if not node_cls:
+            raise KeyError(f"Node has no subclass labeled {label}")
+        return node_cls.__name__
 
     def edge_lookup_voided(self, src_id=None, dst_id=None, label=None, session=None):
         return self.edge_lookup(src_id, dst_id, label, True, session).scalar()
@@ -525,20 +613,16 @@ class PsqlGraphDriver:
                 local.delete(edge)
 
     def get_edge_by_labels(self, src_label, edge_label, dst_label):
-        node_cls = ext.get_abstract_node(self.package_namespace)
-        src_classes = [n for n in node_cls.get_subclasses() if n.get_label() == src_label]
-        dst_classes = [n for n in node_cls.get_subclasses() if n.get_label() == dst_label]
+        node_index = ext.get_abstract_node(self.package_namespace).get_subclass_index()
+        src_classes = node_index.by_label.get(src_label, [])
+        dst_classes = node_index.by_label.get(dst_label, [])
         assert len(src_classes) == 1, f"No classes found with src_label {src_label}"
         assert len(dst_classes) == 1, f"No classes found with dst_label {dst_label}"
 
-        edge_cls = ext.get_abstract_edge(self.package_namespace)
-        edges = [
-            edge
-            for edge in edge_cls.get_subclasses()
-            if edge.__src_class__ == src_classes[0].__name__
-            and edge.__dst_class__ == dst_classes[0].__name__
-            and edge.get_label() == edge_label
-        ]
+        edge_index = ext.get_abstract_edge(self.package_namespace).get_subclass_index()
+        edges = edge_index.by_endpoints.get(
+            (src_classes[0].__name__, edge_label, dst_classes[0].__name__), []
+        )
         assert len(edges) == 1, "Expected 1 edge {}-{}->{}, found {}".format(
             src_label, edge_label, dst_label, len(edges)
         )
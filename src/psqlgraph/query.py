@@ -1,10 +1,36 @@
+import base64
+import json
+from collections import namedtuple
 from copy import copy
 
-from sqlalchemy import not_, or_
+from sqlalchemy import Boolean, DateTime, Numeric, false, not_, or_, tuple_
 from sqlalchemy.dialects.postgresql import array
-from sqlalchemy.orm import Query
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
-from psqlgraph import ext
+from psqlgraph import ext, history
+from psqlgraph.exc import QueryError
+from psqlgraph.node import EDGE_DIRECTIONS, NodeAssociationProxyMixin, load_all_edges
+from psqlgraph.util import TEMPORAL_TYPES
+
+Page = namedtuple("Page", ["items", "cursor"])
+
+# Tie breaker name of the polymorphic discriminator, see keyset_tie_breakers()
+DISCRIMINATOR = "__discriminator__"
+
+
+class Explain(Executable, ClauseElement):
+    """An ``EXPLAIN (FORMAT JSON)`` of a select statement"""
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kwargs):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kwargs)
 
 
 class GraphQuery(Query):
@@ -14,10 +40,45 @@ class GraphQuery(Query):
 
     """
 
+    # Direction of the incident edges to load with the results, see
+    # with_all_edges()
+    _all_edges_direction = None
+
+    # Point in time the query reads versions at, see as_of()
+    _as_of = None
+
+    # Key the results are already keyset ordered on, see after()
+    _keyset_key = None
+
     def __init__(self, entites, session=None, package_namespace=None):
         super().__init__(entites, session)
         self.package_namespace = package_namespace
 
+    def __iter__(self):
+        if self._as_of is not None:
+            return self._iter_detached()
+        if self._all_edges_direction is None:
+            return super().__iter__()
+        results = list(super().__iter__())
+        nodes = [r for r in results if isinstance(r, NodeAssociationProxyMixin)]
+        load_all_edges(nodes, self._all_edges_direction, self.session)
+        return iter(results)
+
+    def _iter_detached(self):
+        """Load the results in a private session on the same connection,
+        so that past versions never replace the live instances in this
+        query's session, and return them detached.
+
+        """
+        session = Session(bind=self.session.connection())
+        try:
+            query = self.with_session(session)
+            query._as_of = None
+            results = list(query)
+        finally:
+            session.close()
+        return iter(results)
+
     def _iterable(self, val):
         if hasattr(val, "__iter__") and not isinstance(val, str):
             return val
@@ -34,6 +95,42 @@ class GraphQuery(Query):
 
         return self._joinpoint_zero().entity
 
+    # ======== Counting ========
+    def estimate_count(self):
+        """Return the query planner's estimate of the number of rows this
+        query returns, without executing it.
+
+        The estimate comes from ``EXPLAIN (FORMAT JSON)`` and is only as
+        good as the table statistics, so it should be used where an
+        approximate count is acceptable, e.g. facet counts.
+
+        :returns: int
+
+        """
+        plan = self.session.execute(Explain(self.statement)).scalar()
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def count(self, exact_below=None):
+        """Return a count of rows this query would return.
+
+        :param int exact_below:
+            *Optional* If given, the planner's estimate is returned
+            unless it is below `exact_below`, in which case the exact
+            count is computed.  This bounds the cost of counting large
+            result sets while keeping small counts accurate.
+        :returns: int
+
+        .. code-block:: python
+
+            g.nodes(Case).props(primary_site='Lung').count(exact_below=10000)
+
+        """
+        if exact_below is not None:
+            estimate = self.estimate_count()
+            if estimate >= exact_below:
+                return estimate
+        return super().count()
+
     # ======== Edges ========
     def with_edge_to_node(self, edge_type, target_node):
         """Filter query to nodes with edges to a given node
@@ -79,29 +176,48 @@ class GraphQuery(Query):
         sq = session.query(edge_type).filter(edge_type.src_id == source_node.node_id).subquery()
         return self.filter(self.entity().node_id == sq.c.dst_id)
 
-    def src(self, ids):
+    def src(self, ids, src_class=None):
         """Filter edges by src_id
 
+        If the source node class is known, either passed as `src_class`
+        or inferred from node objects passed as `ids`, a query on the
+        abstract Edge is pruned to the edge tables whose ``__src_class__``
+        matches (see :func:`with_subclasses`).
+
         :param ids:
-            A list of ids or single id to filter on Edge.src_id == ids
+            A list of ids, nodes, or a single id or node to filter on
+            Edge.src_id == ids
+        :param src_class:
+            *Optional* Node subclass or class name of the source nodes
         :returns: |qobj|
 
         .. code-block:: python
 
             g.nodes().src(node1.node_id).filter(...
+            g.edges().src(node1).filter(...
 
         """
-        if isinstance(ids, str):
-            ids = [ids]
+        ids, src_classes = self._endpoint_ids(ids, src_class)
 
         assert hasattr(self.entity(), "src_id")
-        return self.filter(self.entity().src_id.in_(ids))
+        query = self.filter(self.entity().src_id.in_(ids))
+        if src_classes:
+            query = query.with_subclasses(
+                e for name in src_classes for e in self.entity()._get_edges_with_src(name)
+            )
+        return query
 
-    def dst(self, ids):
+    def dst(self, ids, dst_class=None):
         """Filter edges by dst_id
 
+        See :func:`src` for how `dst_class` prunes queries on the
+        abstract Edge.
+
         :param ids:
-            A list of ids or single id to filter on Edge.dst_id == ids
+            A list of ids, nodes, or a single id or node to filter on
+            Edge.dst_id == ids
+        :param dst_class:
+            *Optional* Node subclass or class name of the destination nodes
         :returns: |qobj|
 
         .. code-block:: python
@@ -109,11 +225,160 @@ class GraphQuery(Query):
             g.nodes().dst('id1').filter(...
 
         """
-        if isinstance(ids, str):
-            ids = [ids]
+        ids, dst_classes = self._endpoint_ids(ids, dst_class)
 
         assert hasattr(self.entity(), "dst_id")
-        return self.filter(self.entity().dst_id.in_(ids))
+        query = self.filter(self.entity().dst_id.in_(ids))
+        if dst_classes:
+            query = query.with_subclasses(
+                e for name in dst_classes for e in self.entity()._get_edges_with_dst(name)
+            )
+        return query
+
+    def _endpoint_ids(self, ids, node_class=None):
+        """Return the ids from a mix of ids and nodes, and the set of node
+        class names the endpoints are known to belong to (empty if
+        unknown or if the entity is not an abstract edge).
+
+        """
+        if isinstance(ids, str) or hasattr(ids, "node_id"):
+            ids = [ids]
+
+        node_ids, classes = [], set()
+        for i in ids:
+            if hasattr(i, "node_id"):
+                node_ids.append(i.node_id)
+                classes.add(type(i).__name__)
+            else:
+                node_ids.append(i)
+                classes.add(None)
+
+        if node_class is not None:
+            classes = {node_class if isinstance(node_class, str) else node_class.__name__}
+
+        if None in classes or not is_abstract_entity(self.entity()):
+            classes = set()
+        return node_ids, classes
+
+    def with_all_edges(self, direction="both"):
+        """Load every incident edge of the resulting nodes along with them:
+        one extra query per direction for the whole result set, instead
+        of a lazy load per edge relationship per node, plus one query per
+        direction for the nodes at the other ends that are not already
+        in the session. The edges are stored in the nodes' relationship
+        collections and their endpoints are set, so `edges_in`,
+        `edges_out`, `get_edges()` and association proxies issue no
+        further queries.
+
+        The results are buffered before the edges are loaded, so this
+        does not combine with `yield_per`.
+
+        :param str direction: 'in', 'out' or 'both'
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            for case in g.nodes(Case).with_all_edges('out'):
+                case.get_edges()  # no query
+
+        """
+        if direction not in EDGE_DIRECTIONS:
+            raise QueryError(
+                f"direction must be one of {sorted(EDGE_DIRECTIONS)}, not {direction}"
+            )
+        query = self._clone()
+        query._all_edges_direction = direction
+        return query
+
+    # ======== History ========
+    def as_of(self, timestamp):
+        """Query the nodes or edges as they were at `timestamp`: each entity
+        that existed then is returned with the properties, system
+        annotations and acl it had, read from the live table if it has
+        not changed since and from the voided history otherwise.  Nodes
+        and edges deleted since are included.
+
+        Filters apply to the past versions, whether they are added
+        before or after `as_of`.  The point-in-time union is computed in
+        SQL (see :func:`psqlgraph.history.versions_as_of`), as one index
+        lookup per entity when the query filters on ids.
+
+        Results are detached from the session: they can be read but not
+        modified, and relationships are not loaded.  Models with
+        ``__history_mode__ = "diff"`` raise QueryError, their versions are
+        read one at a time with :func:`psqlgraph.history.version_at`.
+
+        :param datetime.datetime timestamp: point in time
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.nodes(Case).ids(case_id).as_of(last_year).one().props
+            g.edges().src(case_id).as_of(last_year).all()
+
+        """
+        if self._as_of is not None:
+            raise QueryError("as_of() can only be applied once")
+        if self._order_by:
+            raise QueryError("as_of() must be applied before order_by()")
+        entity = self.entity()
+        criterion = self._criterion
+        query = self._clone()
+        query._criterion = None
+        query = query.select_entity_from(history.versions_as_of(entity, timestamp))
+        if criterion is not None:
+            query = query.filter(criterion)
+        query._as_of = timestamp
+        return query
+
+    # ======== Polymorphism ========
+    def with_subclasses(self, classes):
+        """Restrict a query on an abstract Node or Edge to the given concrete
+        subclasses.
+
+        This filters on the polymorphic discriminator of the union of
+        all subclass tables.  The discriminator is a constant in each
+        branch of the union so Postgres removes the branches of all
+        other tables when planning, rather than probing every table.
+
+        :param classes:
+            An iterable of concrete subclasses of the queried entity
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.edges().with_subclasses([Edge1, Edge2]).src(node_id)
+
+        """
+        entity = self.entity()
+        if not is_abstract_entity(entity):
+            return self
+
+        identities = [c.__mapper__.polymorphic_identity for c in classes]
+        if not identities:
+            # An empty IN () warns in SQLAlchemy, and matches nothing anyway
+            return self.filter(false())
+        return self.filter(entity.__mapper__.polymorphic_on.in_(identities))
+
+    def labels(self, *labels):
+        """Filter a query on an abstract Node or Edge to the subclasses with
+        the given labels, pruning all other tables from the query.
+
+        :param labels:
+            One or more labels
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.nodes().labels('case', 'sample').props(project_id='TCGA-BRCA')
+            g.edges().labels('member_of').src(node_id)
+
+        """
+        entity = self.entity()
+        if not is_abstract_entity(entity):
+            return self if entity.get_label() in labels else self.filter(false())
+        by_label = entity.get_subclass_index().by_label
+        return self.with_subclasses(c for label in labels for c in by_label.get(label, []))
 
     # ====== Nodes ========
     def ids(self, ids):
@@ -498,6 +763,219 @@ class GraphQuery(Query):
 
         return self.filter(self.entity()._props.contains({key: value}))
 
+    def prop_lt(self, key, value, cast=None):
+        """Filter on entities whose property `key` is less than `value`.
+
+        The property is cast from text to the SQL type matching its
+        declared ``pg_property`` types (see :func:`typed_prop`) so the
+        comparison is numeric, boolean or temporal rather than lexical.
+
+        :param str key:
+            Specifies which property to filter on.
+        :param value:
+            The upper (exclusive) bound
+        :param cast:
+            *Optional* SQLAlchemy type overriding the inferred cast
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.nodes(Foo).prop_lt('fobble', 25).count()
+
+        """
+        return self.filter(typed_prop(self.entity(), key, value, cast) < value)
+
+    def prop_le(self, key, value, cast=None):
+        """Filter on entities whose property `key` is less than or equal to
+        `value`. See :func:`prop_lt` for usage.
+
+        """
+        return self.filter(typed_prop(self.entity(), key, value, cast) <= value)
+
+    def prop_gt(self, key, value, cast=None):
+        """Filter on entities whose property `key` is greater than
+        `value`. See :func:`prop_lt` for usage.
+
+        """
+        return self.filter(typed_prop(self.entity(), key, value, cast) > value)
+
+    def prop_ge(self, key, value, cast=None):
+        """Filter on entities whose property `key` is greater than or equal
+        to `value`. See :func:`prop_lt` for usage.
+
+        """
+        return self.filter(typed_prop(self.entity(), key, value, cast) >= value)
+
+    def prop_between(self, key, low, high, cast=None):
+        """Filter on entities whose property `key` lies in the inclusive
+        range [`low`, `high`].
+
+        :param str key:
+            Specifies which property to filter on.
+        :param low:
+            The lower (inclusive) bound
+        :param high:
+            The upper (inclusive) bound
+        :param cast:
+            *Optional* SQLAlchemy type overriding the inferred cast
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.nodes(Case).prop_between(
+                'updated_datetime',
+                datetime(2020, 1, 1, tzinfo=timezone.utc),
+                datetime(2020, 2, 1, tzinfo=timezone.utc),
+            ).all()
+
+        """
+        return self.filter(typed_prop(self.entity(), key, low, cast).between(low, high))
+
+    def order_by_prop(self, key, descending=False, cast=None):
+        """Order query results by property `key` using the same typed cast
+        as the comparison filters.
+
+        :param str key:
+            Specifies which property to order by.
+        :param bool descending:
+            Order from largest to smallest value, defaults to False
+        :param cast:
+            *Optional* SQLAlchemy type overriding the inferred cast
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.nodes(Foo).order_by_prop('fobble', descending=True).limit(10)
+
+        """
+        expr = typed_prop(self.entity(), key, cast=cast)
+        return self.order_by(expr.desc() if descending else expr.asc())
+
+    # ======== Pagination ========
+    def _keyset_columns(self, key):
+        """Return the (is_property, sort expressions) used to page on `key`.
+        The entity's identifying columns are appended as tie breakers so
+        that every row has a unique position.
+
+        """
+        entity = self.entity()
+        is_property = not isinstance(getattr(entity, key, None), InstrumentedAttribute)
+        columns = [typed_prop(entity, key) if is_property else getattr(entity, key)]
+        for name, column in keyset_tie_breakers(entity):
+            if name != key:
+                columns.append(column)
+        return is_property, columns
+
+    def _keyset(self, key, values=None, before=False):
+        is_property, columns = self._keyset_columns(key)
+        query = self
+        if query._keyset_key is None:
+            # Replace any existing ordering, the keyset order is what the
+            # bounds below compare against
+            if is_property:
+                query = query.filter(columns[0].isnot(None))
+            query = query.order_by(None).order_by(*columns)
+            query._keyset_key = key
+        elif query._keyset_key != key:
+            raise QueryError(f"Query is already paged on '{query._keyset_key}', not '{key}'")
+        if values is not None:
+            if len(values) != len(columns):
+                raise QueryError(f"Cursor does not match the tie breakers of {self.entity()}")
+            position = tuple_(*columns)
+            bound = tuple_(*values)
+            query = query.filter(position < bound if before else position > bound)
+        return query
+
+    def cursor_for(self, item, key="node_id"):
+        """Return an opaque cursor pointing just past `item` in a keyset
+        ordering on `key`.
+
+        :param item: An entity returned by this query
+        :param str key: The column or property name being paged on
+        :returns: str
+
+        """
+        return encode_cursor(key, self._keyset_values(item, key))
+
+    def _keyset_values(self, item, key):
+        is_property, _ = self._keyset_columns(key)
+        values = [item._props.get(key) if is_property else getattr(item, key)]
+        for name, _ in keyset_tie_breakers(self.entity()):
+            if name == DISCRIMINATOR:
+                values.append(item.__mapper__.polymorphic_identity)
+            elif name != key:
+                values.append(getattr(item, name))
+        return values
+
+    def after(self, cursor):
+        """Filter and order results to those positioned after `cursor`
+        (keyset pagination).  The sort key is encoded in the cursor.
+
+        :param str cursor:
+            An opaque cursor from :func:`cursor_for` or :func:`iter_pages`
+        :returns: |qobj|
+
+        .. code-block:: python
+
+            g.nodes(Case).after(cursor).limit(100).all()
+
+        """
+        key, values = decode_cursor(cursor)
+        return self._keyset(key, values)
+
+    def before(self, cursor):
+        """Filter results to those positioned before `cursor`.  Combined
+        with :func:`after` this bounds a range of a keyset scan, e.g. to
+        split a long scan across workers.
+
+        :param str cursor:
+            An opaque cursor from :func:`cursor_for` or :func:`iter_pages`
+        :returns: |qobj|
+
+        """
+        key, values = decode_cursor(cursor)
+        return self._keyset(key, values, before=True)
+
+    def iter_pages(self, size, key="node_id", cursor=None):
+        """Iterate over query results in pages of at most `size` entities
+        using keyset pagination.
+
+        Each page is fetched with ``WHERE (key, id) > (:last) ORDER BY
+        key, id LIMIT :size`` so the cost of a page does not depend on
+        how deep into the scan it is, unlike ``offset()``.
+
+        :param int size:
+            Maximum number of entities per page
+        :param str key:
+            Column (e.g. ``node_id``) or property name to page on.
+            Entities with a null property value are not returned.
+        :param str cursor:
+            *Optional* cursor to resume a previous scan from
+        :returns: generator of :class:`Page` (``items``, ``cursor``)
+            where ``cursor`` resumes the scan after the page
+
+        .. code-block:: python
+
+            for page in g.nodes(Case).iter_pages(1000):
+                process(page.items)
+                save_checkpoint(page.cursor)
+
+        """
+        if cursor is not None and decode_cursor(cursor)[0] != key:
+            raise QueryError(f"Cursor was not created for key '{key}'")
+
+        values = decode_cursor(cursor)[1] if cursor is not None else None
+        while True:
+            items = self._keyset(key, values).limit(size).all()
+            if not items:
+                return
+
+            values = self._keyset_values(items[-1], key)
+            yield Page(items, encode_cursor(key, values))
+
+            if len(items) < size:
+                return
+
     # ======== System Annotations ========
     def sysan(self, sysans=None, **kwargs):
         """Filter query results by system_annotations.  Results in query will
@@ -559,6 +1037,15 @@ class GraphQuery(Query):
         return self
 
 
+def is_abstract_entity(entity):
+    """Determine if an entity is an abstract Node or Edge queried through
+    the polymorphic union of its subclass tables.
+
+    """
+    is_abstract_base = getattr(entity, "is_abstract_base", None)
+    return bool(is_abstract_base and is_abstract_base())
+
+
 def is_list_prop(entity, prop):
     """Determine if a property on an entity is a list type."""
     if entity.label == "node":
@@ -571,3 +1058,92 @@ def is_list_prop(entity, prop):
 
     # Default value of dict because __pg_properties__ is a dict.
     return list in entity.__pg_properties__.get(prop, {})
+
+
+def prop_types(entity, prop):
+    """Return the declared ``pg_property`` types for a property on an
+    entity, merging the types of all subclasses when querying the
+    abstract base.
+
+    """
+    if entity.is_abstract_base():
+        types = set()
+        for subclass in entity.get_subclasses():
+            types.update(getattr(subclass, "__pg_properties__", {}).get(prop) or ())
+        return tuple(types)
+
+    return tuple(getattr(entity, "__pg_properties__", {}).get(prop) or ())
+
+
+def prop_sql_type(types, value=None):
+    """Resolve the SQL type a text JSONB property should be cast to, or
+    None if the property should be compared as text.
+
+    Properties declared with a temporal type (see
+    :data:`psqlgraph.util.TEMPORAL_TYPES`) and temporal comparison values
+    cast to ``timestamptz``: dates are stored as ISO 8601 strings, which
+    sort lexically and so out of order across UTC offsets.
+
+    """
+    if isinstance(value, TEMPORAL_TYPES):
+        return DateTime(timezone=True)
+    if not types:
+        return None
+    if any(t in TEMPORAL_TYPES for t in types) and all(
+        t in TEMPORAL_TYPES or t is str for t in types
+    ):
+        return DateTime(timezone=True)
+    if all(t is bool for t in types):
+        return Boolean()
+    if all(t in (int, float) for t in types):
+        return Numeric()
+    return None
+
+
+def typed_prop(entity, key, value=None, cast=None):
+    """Return the ``_props->>'key'`` expression for `entity` cast to the
+    SQL type of the property.
+
+    :param entity: Node or Edge class being queried
+    :param str key: property name
+    :param value: comparison value used to infer temporal casts
+    :param cast: SQLAlchemy type overriding the inferred cast
+
+    """
+    expr = entity._props[key].astext
+    sql_type = cast if cast is not None else prop_sql_type(prop_types(entity, key), value)
+    if sql_type is None:
+        return expr
+    return expr.cast(sql_type)
+
+
+def keyset_tie_breakers(entity):
+    """(name, column) pairs that uniquely identify a row of `entity`.  The
+    same node_id can be used in several node tables, and the same src
+    and dst can be linked in several edge tables, so queries on the
+    abstract Node or Edge also break ties on the polymorphic
+    discriminator.
+
+    """
+    if hasattr(entity, "node_id"):
+        tie_breakers = [("node_id", entity.node_id)]
+    else:
+        tie_breakers = [("src_id", entity.src_id), ("dst_id", entity.dst_id)]
+    if entity.__mapper__.polymorphic_on is not None:
+        tie_breakers.append((DISCRIMINATOR, entity.__mapper__.polymorphic_on))
+    return tie_breakers
+
+
+def encode_cursor(key, values):
+    """Encode a keyset position into an opaque, url safe cursor"""
+    raw = json.dumps([key, list(values)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from :func:`encode_cursor` into (key, values)"""
+    try:
+        key, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise QueryError(f"Invalid pagination cursor: {e}")
+    return key, values
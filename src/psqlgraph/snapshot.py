@@ -0,0 +1,416 @@
+"""
+In-memory adjacency snapshot of a graph for analytical traversals.
+
+A :class:`GraphSnapshot` holds every node as an integer and every edge
+in CSR (compressed sparse row) arrays for both directions, read from the
+database with ``COPY``.  Traversals and reachability then run over NumPy
+arrays, a whole BFS frontier at a time, without touching the ORM::
+
+    from psqlgraph.snapshot import GraphSnapshot
+
+    snapshot = GraphSnapshot.load(g)
+    ids = snapshot.traverse(case_id, edge_pointer="in", max_depth=3)
+    count = snapshot.reachable([case_id], edge_labels=["member_of"]).sum()
+
+    snapshot.save("/shared/graph")
+    snapshot = GraphSnapshot.open("/shared/graph")  # memory mapped
+
+Requires NumPy (``pip install psqlgraph[snapshot]``).
+
+Node ``i`` is ``snapshot.node_ids[i]``; its out edges are
+``out_indices[out_indptr[i]:out_indptr[i + 1]]`` (the dst of each edge)
+with edge labels ``edge_labels[out_types[...]]``, and its in edges are
+the same in the ``in_*`` arrays (the src of each edge).
+"""
+import io
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from psqlgraph import ext
+
+# Array files of a saved snapshot, see GraphSnapshot.save()
+ARRAYS = (
+    "node_ids",
+    "node_types",
+    "out_indptr",
+    "out_indices",
+    "out_types",
+    "in_indptr",
+    "in_indices",
+    "in_types",
+)
+METADATA = "snapshot.json"
+
+# Sizes of the signature, flags and extension length header, and of the
+# trailer, of a binary COPY
+COPY_HEADER_SIZE = 19
+COPY_TRAILER_SIZE = 2
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("GraphSnapshot requires numpy: pip install psqlgraph[snapshot]")
+
+
+def copy_column(cursor, query):
+    """Returns the single text column of `query` read with COPY as an
+    array of str, split from the COPY output rather than row by row
+
+    """
+    buf = io.StringIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT", buf)
+    text = buf.getvalue()
+    values = text.split("\n")[:-1]
+    if "\\" in text:
+        # Text format escapes backslashes and control characters
+        values = [
+            value.encode("latin-1", "backslashreplace").decode("unicode_escape")
+            for value in values
+        ]
+    return np.array(values, dtype=str)
+
+
+def copy_index_pairs(cursor, query):
+    """Returns the two bigint columns of `query` read with a binary COPY
+    as two int64 arrays, decoded in place with ``np.frombuffer``
+
+    """
+    buf = io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buf)
+    data = buf.getbuffer()
+
+    # Each row is a field count followed by the (length, value) of both
+    # columns, after a header with an extension area and before a trailer
+    row = np.dtype(
+        [
+            ("fields", ">i2"),
+            ("size1", ">i4"),
+            ("value1", ">i8"),
+            ("size2", ">i4"),
+            ("value2", ">i8"),
+        ]
+    )
+    start = COPY_HEADER_SIZE + int.from_bytes(
+        data[COPY_HEADER_SIZE - 4 : COPY_HEADER_SIZE], "big"
+    )
+    count = (len(data) - start - COPY_TRAILER_SIZE) // row.itemsize
+    rows = np.frombuffer(data, dtype=row, count=count, offset=start)
+    return rows["value1"].astype(np.int64), rows["value2"].astype(np.int64)
+
+
+def endpoint_table(edge_class, column):
+    """Returns the name of the node table that `column` of `edge_class`
+    references
+
+    """
+    (foreign_key,) = edge_class.__table__.c[column].foreign_keys
+    return foreign_key.column.table.name
+
+
+def numbered_nodes(table, offset):
+    """SQL numbering the nodes of `table` in node_id order from `offset`,
+    the order in which :meth:`GraphSnapshot.load` reads their ids
+
+    """
+    return (
+        f"SELECT node_id, row_number() OVER (ORDER BY node_id) + {offset - 1} AS i FROM {table}"
+    )
+
+
+def csr(rows, cols, types, size):
+    """Returns the (indptr, indices, types) arrays of the edges from
+    `rows` to `cols`, grouped by row
+
+    """
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols[order], types[order]
+
+
+class GraphSnapshot:
+    """Integer indexed, read only adjacency of a graph.
+
+    :param node_ids: array of node ids, indexed by node
+    :param node_types: array of indexes into `node_labels`, by node
+    :param node_labels: list of node labels
+    :param edge_labels: list of edge labels
+    :param out_indptr, out_indices, out_types: CSR out adjacency
+    :param in_indptr, in_indices, in_types: CSR in adjacency
+    """
+
+    def __init__(self, node_ids, node_types, node_labels, edge_labels, **adjacency):
+        require_numpy()
+        self.node_ids = node_ids
+        self.node_types = node_types
+        self.node_labels = list(node_labels)
+        self.edge_labels = list(edge_labels)
+        self.out_indptr = adjacency["out_indptr"]
+        self.out_indices = adjacency["out_indices"]
+        self.out_types = adjacency["out_types"]
+        self.in_indptr = adjacency["in_indptr"]
+        self.in_indices = adjacency["in_indices"]
+        self.in_types = adjacency["in_types"]
+        self._index = None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.out_indices)
+
+    # ======== Loading ========
+    @classmethod
+    def load(cls, driver):
+        """Read all nodes and edges of `driver`'s models with COPY, in a
+        single repeatable read transaction
+
+        """
+        require_numpy()
+        node_classes = ext.get_abstract_node(driver.package_namespace).get_subclasses()
+        edge_classes = ext.get_abstract_edge(driver.package_namespace).get_subclasses()
+
+        connection = driver.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            node_ids, node_types, offsets = [], [], {}
+            offset = 0
+            for code, node_class in enumerate(node_classes):
+                table = node_class.__tablename__
+                ids = copy_column(cursor, f"SELECT node_id FROM {table} ORDER BY node_id")
+                node_ids.append(ids)
+                node_types.append(np.full(len(ids), code, dtype=np.int16))
+                offsets[table] = offset
+                offset += len(ids)
+
+            # Edge endpoints are numbered by Postgres, joining on the
+            # numbering of the node tables read above
+            srcs, dsts, edge_types = [], [], []
+            for code, edge_class in enumerate(edge_classes):
+                src_table = endpoint_table(edge_class, "src_id")
+                dst_table = endpoint_table(edge_class, "dst_id")
+                src, dst = copy_index_pairs(
+                    cursor,
+                    f"SELECT s.i, d.i FROM {edge_class.__tablename__} e "
+                    f"JOIN ({numbered_nodes(src_table, offsets[src_table])}) s "
+                    "ON s.node_id = e.src_id "
+                    f"JOIN ({numbered_nodes(dst_table, offsets[dst_table])}) d "
+                    "ON d.node_id = e.dst_id",
+                )
+                srcs.append(src)
+                dsts.append(dst)
+                edge_types.append(np.full(len(src), code, dtype=np.int16))
+            connection.rollback()
+        finally:
+            connection.close()
+
+        return cls.from_edges(
+            np.concatenate(node_ids) if node_ids else np.zeros(0, str),
+            np.concatenate(node_types) if node_types else np.zeros(0, np.int16),
+            [c.get_label() for c in node_classes],
+            [c.get_label() for c in edge_classes],
+            np.concatenate(srcs) if srcs else np.zeros(0, np.int64),
+            np.concatenate(dsts) if dsts else np.zeros(0, np.int64),
+            np.concatenate(edge_types) if edge_types else np.zeros(0, np.int16),
+        )
+
+    @classmethod
+    def from_edges(cls, node_ids, node_types, node_labels, edge_labels, srcs, dsts, types):
+        """Build a snapshot from parallel arrays of edge endpoints (node
+        indexes) and edge types (indexes into `edge_labels`)
+
+        """
+        require_numpy()
+        size = len(node_ids)
+        index_type = np.int32 if size < 2**31 else np.int64
+        srcs, dsts = srcs.astype(index_type), dsts.astype(index_type)
+        out_indptr, out_indices, out_types = csr(srcs, dsts, types, size)
+        in_indptr, in_indices, in_types = csr(dsts, srcs, types, size)
+        return cls(
+            node_ids,
+            node_types,
+            node_labels,
+            edge_labels,
+            out_indptr=out_indptr,
+            out_indices=out_indices,
+            out_types=out_types,
+            in_indptr=in_indptr,
+            in_indices=in_indices,
+            in_types=in_types,
+        )
+
+    def save(self, directory):
+        """Save the snapshot as one ``.npy`` file per array, which
+        :meth:`open` memory maps
+
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, METADATA), "w") as f:
+            json.dump({"node_labels": self.node_labels, "edge_labels": self.edge_labels}, f)
+
+    @classmethod
+    def open(cls, directory, mmap_mode="r"):
+        """Open a snapshot saved by :meth:`save`.  The arrays are memory
+        mapped, so processes opening the same snapshot share its pages.
+
+        """
+        require_numpy()
+        with open(os.path.join(directory, METADATA)) as f:
+            metadata = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAYS
+        }
+        return cls(
+            node_labels=metadata["node_labels"], edge_labels=metadata["edge_labels"], **arrays
+        )
+
+    # ======== Lookups ========
+    @property
+    def index(self):
+        """Dict of node id to node index, built on first use"""
+        if self._index is None:
+            self._index = {str(node_id): i for i, node_id in enumerate(self.node_ids)}
+        return self._index
+
+    def indexes(self, node_ids):
+        """Returns the array of node indexes of one or more node ids"""
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        return np.fromiter((self.index[node_id] for node_id in node_ids), np.int64)
+
+    def _adjacency(self, edge_pointer):
+        if edge_pointer == "out":
+            return self.out_indptr, self.out_indices, self.out_types
+        if edge_pointer == "in":
+            return self.in_indptr, self.in_indices, self.in_types
+        raise ValueError(f"edge_pointer must be 'in' or 'out', not {edge_pointer}")
+
+    def edge_mask(self, edge_labels, edge_pointer="out"):
+        """Returns the boolean mask of the edges with one of `edge_labels`,
+        aligned with the `edge_pointer` CSR arrays
+
+        """
+        edge_labels = set(edge_labels)
+        codes = [i for i, label in enumerate(self.edge_labels) if label in edge_labels]
+        return np.isin(self._adjacency(edge_pointer)[2], codes)
+
+    def neighbors(self, node_id, edge_pointer="in", edge_labels=None):
+        """Returns the ids of the nodes one `edge_pointer` edge away"""
+        mask = self._mask(edge_labels, edge_pointer)
+        indexes = self._expand(self.indexes(node_id), edge_pointer, mask)
+        return [str(self.node_ids[i]) for i in indexes]
+
+    # ======== Traversals ========
+    def _mask(self, edge_labels, edge_pointer):
+        return None if edge_labels is None else self.edge_mask(edge_labels, edge_pointer)
+
+    def _expand(self, frontier, edge_pointer, mask=None):
+        """Returns the nodes one edge away from the nodes of `frontier`,
+        gathered from the CSR slices of all of them at once
+
+        """
+        indptr, indices, _ = self._adjacency(edge_pointer)
+        starts, ends = indptr[frontier], indptr[frontier + 1]
+        counts = ends - starts
+        total = int(counts.sum())
+        if not total:
+            return np.zeros(0, dtype=indices.dtype)
+        # Position of each gathered edge: its slice start plus its offset
+        # within the slice
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(starts, counts) + offsets
+        if mask is not None:
+            positions = positions[mask[positions]]
+        return indices[positions]
+
+    def bfs(self, roots, edge_pointer="in", max_depth=None, edge_labels=None):
+        """Breadth first search from node indexes `roots`, one vectorized
+        step per depth.
+
+        :returns: (order, depths), the node indexes reached in BFS order
+            and the depth of each
+        """
+        mask = self._mask(edge_labels, edge_pointer)
+        visited = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(np.asarray(roots, dtype=np.int64))
+        visited[frontier] = True
+        order, depths = [frontier], [np.zeros(len(frontier), dtype=np.int32)]
+        depth = 0
+        while len(frontier) and (max_depth is None or depth < max_depth):
+            depth += 1
+            reached = self._expand(frontier, edge_pointer, mask)
+            frontier = np.unique(reached[~visited[reached]])
+            visited[frontier] = True
+            order.append(frontier)
+            depths.append(np.full(len(frontier), depth, dtype=np.int32))
+        return np.concatenate(order), np.concatenate(depths)
+
+    def dfs(self, root, edge_pointer="in", max_depth=None, edge_labels=None):
+        """Depth first preorder of the nodes reached from node index
+        `root`, like :func:`psqlgraph.traversals._dfs`: with a max_depth,
+        nodes are walked again when a shorter path to them is found but
+        only appear once
+
+        :returns: array of node indexes
+        """
+        indptr, indices, _ = self._adjacency(edge_pointer)
+        mask = self._mask(edge_labels, edge_pointer)
+        # Shortest depth found so far, -1 for unvisited nodes
+        depths = np.full(len(self), -1, dtype=np.int32)
+        depths[root] = 0
+        order = [root]
+        # (node, next edge position, depth)
+        stack = [(root, int(indptr[root]), 0)]
+        while stack:
+            node, position, depth = stack.pop()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            end = int(indptr[node + 1])
+            while position < end:
+                n = int(indices[position])
+                position += 1
+                if mask is not None and not mask[position - 1]:
+                    continue
+                if depths[n] < 0:
+                    order.append(n)
+                elif max_depth is None or depth + 1 >= depths[n]:
+                    continue
+                depths[n] = depth + 1
+                stack.append((node, position, depth))
+                stack.append((n, int(indptr[n]), depth + 1))
+                break
+        return np.array(order, dtype=np.int64)
+
+    def reachable(self, roots, edge_pointer="in", max_depth=None, edge_labels=None):
+        """Returns the boolean mask of the nodes reachable from node ids
+        `roots`, roots included
+
+        """
+        order, _ = self.bfs(self.indexes(roots), edge_pointer, max_depth, edge_labels)
+        visited = np.zeros(len(self), dtype=bool)
+        visited[order] = True
+        return visited
+
+    def traverse(self, root, mode="bfs", max_depth=None, edge_pointer="in", edge_labels=None):
+        """Like :func:`psqlgraph.traversals.traverse` from node id `root`,
+        filtering edges by label instead of a predicate
+
+        :returns: list of node ids
+        """
+        if mode == "bfs":
+            order, _ = self.bfs(self.indexes(root), edge_pointer, max_depth, edge_labels)
+        elif mode == "dfs":
+            order = self.dfs(self.index[root], edge_pointer, max_depth, edge_labels)
+        else:
+            raise NotImplementedError(f"Traversal mode {mode} is not implemented")
+        return [str(self.node_ids[i]) for i in order]
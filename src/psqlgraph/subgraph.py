@@ -0,0 +1,183 @@
+"""
+Detached subgraph extraction and serialization.
+
+:func:`extract_subgraph` walks the graph from a root node like
+:func:`psqlgraph.traversals.traverse`, one level at a time with one edge
+query and one node query per level, and returns a :class:`Subgraph` of
+plain records that no longer needs a session::
+
+    from psqlgraph.subgraph import Subgraph, extract_subgraph
+
+    with g.session_scope():
+        case = g.nodes(Case).ids(case_id).one()
+        subgraph = extract_subgraph(case, max_depth=4)
+
+    with open("case.ndjson", "w") as f:
+        subgraph.write_ndjson(f)
+
+Records serialize to the same dicts as :meth:`Node.to_json` and
+:meth:`Edge.to_json`, nodes first, so each can be loaded back with
+``from_json``.  Edge endpoint labels come from the edge class's
+``__src_class__``/``__dst_class__`` rather than from loading the
+endpoints.  msgpack output requires ``pip install psqlgraph[msgpack]``.
+"""
+import json
+from collections import namedtuple
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from sqlalchemy.orm import object_session
+
+from psqlgraph import traversals
+
+NodeRecord = namedtuple(
+    "NodeRecord", ["node_id", "label", "acl", "properties", "system_annotations"]
+)
+EdgeRecord = namedtuple(
+    "EdgeRecord",
+    [
+        "src_id",
+        "dst_id",
+        "src_label",
+        "dst_label",
+        "label",
+        "acl",
+        "properties",
+        "system_annotations",
+    ],
+)
+
+
+def node_record(node):
+    return NodeRecord(
+        node.node_id,
+        node.label,
+        list(node.acl),
+        dict(node.properties),
+        dict(node.system_annotations),
+    )
+
+
+def edge_record(edge):
+    return EdgeRecord(
+        edge.src_id,
+        edge.dst_id,
+        edge.get_src_label(),
+        edge.get_dst_label(),
+        edge.label,
+        list(edge.acl),
+        dict(edge.properties),
+        dict(edge.system_annotations),
+    )
+
+
+def require_msgpack():
+    if msgpack is None:
+        raise ImportError("msgpack is required: pip install psqlgraph[msgpack]")
+
+
+class Subgraph:
+    """Node and edge records of part of a graph, detached from any session
+
+    :param nodes: list of :class:`NodeRecord`
+    :param edges: list of :class:`EdgeRecord`
+    """
+
+    def __init__(self, nodes=None, edges=None):
+        self.nodes = list(nodes or [])
+        self.edges = list(edges or [])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def records(self):
+        """Yield the nodes then the edges as ``to_json()`` dicts"""
+        for record in self.nodes:
+            yield record._asdict()
+        for record in self.edges:
+            yield record._asdict()
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a subgraph from ``to_json()`` dicts, edges told apart from
+        nodes by their ``src_id``
+
+        """
+        subgraph = cls()
+        for record in records:
+            if "src_id" in record:
+                subgraph.edges.append(EdgeRecord(**record))
+            else:
+                subgraph.nodes.append(NodeRecord(**record))
+        return subgraph
+
+    def write_ndjson(self, fp):
+        """Write one JSON record per line to text file `fp`"""
+        for record in self.records():
+            fp.write(json.dumps(record, separators=(",", ":")))
+            fp.write("\n")
+
+    @classmethod
+    def read_ndjson(cls, fp):
+        return cls.from_records(json.loads(line) for line in fp if line.strip())
+
+    def write_msgpack(self, fp):
+        """Write the records as a stream of msgpack maps to binary file `fp`"""
+        require_msgpack()
+        packer = msgpack.Packer()
+        for record in self.records():
+            fp.write(packer.pack(record))
+
+    @classmethod
+    def read_msgpack(cls, fp):
+        require_msgpack()
+        return cls.from_records(msgpack.Unpacker(fp, raw=False))
+
+
+def extract_subgraph(root, max_depth=None, edge_pointer="in", edge_predicate=None):
+    """
+    Extracts the nodes reached from `root`, and the edges walked to reach
+    them, as a detached :class:`Subgraph`
+    Args:
+        root (Node): root node to start traverse
+        max_depth (int): maximum distance to traverse
+        edge_pointer (str): Determines what edge direction to use, possible values are `in`, `out`
+                        `in`: use node.edges_in, default behavior
+        edge_predicate (func): a predicate performed on an `edge` object in
+        order to decided whether to walk that edge or not
+
+    Returns:
+        Subgraph: records of the nodes in BFS order and of the walked edges
+    """
+    if edge_pointer not in ("in", "out"):
+        raise ValueError(f"edge_pointer must be 'in' or 'out', not {edge_pointer}")
+    edge_predicate = edge_predicate if callable(edge_predicate) else lambda _: True
+    max_depth = float("inf") if max_depth is None else max_depth
+
+    session = object_session(root)
+    edge_cls = root.get_edge_class()
+    reached = "src_id" if edge_pointer == "in" else "dst_id"
+
+    nodes = {root.node_id: root}
+    subgraph = Subgraph([node_record(root)])
+    visited = {root.node_id}
+    frontier = [root.node_id]
+    depth = 0
+    while frontier and depth < max_depth:
+        depth += 1
+        edges = traversals.expand_level(
+            session, edge_cls, frontier, edge_pointer, edge_predicate, nodes
+        )
+        frontier = []
+        for edge in edges:
+            subgraph.edges.append(edge_record(edge))
+            n = getattr(edge, reached)
+            if n not in visited:
+                visited.add(n)
+                frontier.append(n)
+                subgraph.nodes.append(node_record(nodes[n]))
+
+    return subgraph
@@ -1,7 +1,22 @@
-from collections import deque, namedtuple
+import base64
+from array import array
 
+from sqlalchemy import bindparam, or_
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import object_session
 
-def traverse(root, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate=None):
+# Edge direction => (endpoint matched against the frontier, endpoint reached)
+# for each side of the edges walked
+PATH_DIRECTIONS = {
+    "out": (("src_id", "dst_id"),),
+    "in": (("dst_id", "src_id"),),
+    "both": (("src_id", "dst_id"), ("dst_id", "src_id")),
+}
+
+
+def traverse(
+    root, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate=None, state=None
+):
     """
     Performs a traversal starting at the current node
     Args:
@@ -12,6 +27,8 @@ def traverse(root, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate
                         `in`: use node.edges_in, default behavior
         edge_predicate (func): a predicate performed on an `edge` object in
         order to decided whether to walk that edge or not
+        state (TraversalState): kept up to date as the traversal goes, or
+        the checkpoint of a traversal from the same root to resume
 
     Returns:
         generator: nodes found in the sub tree
@@ -22,6 +39,7 @@ def traverse(root, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate
             edge_predicate=edge_predicate,
             edge_pointer=edge_pointer,
             max_depth=max_depth,
+            state=state,
         )
 
     if mode == "dfs":
@@ -30,15 +48,203 @@ def traverse(root, mode="bfs", max_depth=None, edge_pointer="in", edge_predicate
             edge_predicate=edge_predicate,
             edge_pointer=edge_pointer,
             max_depth=max_depth,
+            state=state,
         )
 
     raise NotImplementedError(f"Traversal mode {mode} is not implemented")
 
 
-def _bfs(root, edge_predicate=None, max_depth=None, edge_pointer="in"):
+# Number of queued nodes loaded per query by a BFS
+HYDRATE_BATCH_SIZE = 500
+
+# Caches the compiled query loading a single node by id
+bakery = baked.bakery()
+
+
+class NodeIndex:
+    """Interns the node ids met by a traversal as ints, so that its state
+    holds ints rather than id strings or ORM objects. Nodes are loaded
+    back by int when the traversal needs them, from the session's
+    identity map when they are still in it.
+
+    """
+
+    def __init__(self, root, node_ids=None, class_names=None):
+        self.session = object_session(root)
+        self.classes = root.get_edge_class().get_node_class().get_subclass_index().by_name
+        self.node_ids = [] if node_ids is None else node_ids
+        self.class_names = [] if class_names is None else class_names
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def intern(self, node_id, class_name):
+        i = self.index.get(node_id)
+        if i is None:
+            i = self.index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self.class_names.append(class_name)
+        return i
+
+    def neighbor(self, edge, edge_pointer):
+        """Interns the node at the far end of `edge` without loading it"""
+        if edge_pointer == "out":
+            return self.intern(edge.dst_id, edge.__dst_class__)
+        return self.intern(edge.src_id, edge.__src_class__)
+
+    def _cached(self, i):
+        node_cls = self.classes[self.class_names[i]]
+        key = node_cls.__mapper__.identity_key_from_primary_key([self.node_ids[i]])
+        return self.session.identity_map.get(key)
+
+    def node(self, i):
+        """Returns the node of interned id `i`, None if it no longer exists"""
+        node = self._cached(i)
+        if node is None:
+            node_cls = self.classes[self.class_names[i]]
+            query = bakery(lambda session: session.query(node_cls), node_cls)
+            query += lambda q: q.filter(node_cls.node_id == bindparam("node_id"))
+            node = query(self.session).params(node_id=self.node_ids[i]).one_or_none()
+        return node
+
+    def nodes(self, indexes, batch_size=HYDRATE_BATCH_SIZE):
+        """Yields the nodes of interned `indexes` in order, loaded with one
+        query per class for each batch of `batch_size`, and None for nodes
+        that no longer exist
+
+        """
+        for start in range(0, len(indexes), batch_size):
+            batch = indexes[start : start + batch_size]
+            loaded = {}
+            by_class = {}
+            for i in batch:
+                node = self._cached(i)
+                if node is not None:
+                    loaded[node.node_id] = node
+                else:
+                    by_class.setdefault(self.class_names[i], []).append(self.node_ids[i])
+            for class_name, node_ids in by_class.items():
+                node_cls = self.classes[class_name]
+                query = self.session.query(node_cls).filter(node_cls.node_id.in_(node_ids))
+                loaded.update((node.node_id, node) for node in query)
+            for i in batch:
+                yield loaded.get(self.node_ids[i])
+
+
+class Bitmap:
+    """Growable set of small ints, one bit each"""
+
+    def __init__(self, bits=None):
+        self.bits = bytearray() if bits is None else bytearray(bits)
+
+    def __contains__(self, i):
+        return i >> 3 < len(self.bits) and bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def add(self, i):
+        if i >> 3 >= len(self.bits):
+            self.bits.extend(bytes(max((i >> 3) + 1 - len(self.bits), len(self.bits))))
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+
+class TraversalState:
+    """Position of a BFS or DFS traversal, updated as it yields nodes.
+
+    Passing the same state to another traversal from the same root, in any
+    session, resumes it after the last node yielded.  :meth:`to_json` and
+    :meth:`from_json` checkpoint it as a JSON serializable dict::
+
+        state = TraversalState()
+        for node in root.traverse(state=state):
+            ...
+        json.dump(state.to_json(), f)
+
+        state = TraversalState.from_json(json.load(f))
+        for node in root.traverse(state=state):
+            ...
+
+    Nodes are held as ints interned in `node_ids`.  A BFS keeps the
+    current `level`, the number of its nodes already yielded (`position`),
+    the `next_level` found so far and a `visited` bitmap.  A DFS keeps its
+    stack as parallel arrays and the shortest level of each node reached
+    as `visited`.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.depth = 0
+        self.node_ids = []
+        self.class_names = []
+        self.visited = None
+        # BFS
+        self.level = array("q")
+        self.position = 0
+        self.next_level = array("q")
+        # DFS
+        self.stack_ids = array("q")
+        self.stack_next_child = array("q")
+        self.stack_levels = array("l")
+
+    def start(self, mode, root):
+        """Returns the interned ids of `root`'s traversal, and whether it
+        resumes from this state
+
+        """
+        if self.mode is not None and self.mode != mode:
+            raise ValueError(f"Cannot resume a {self.mode} traversal as {mode}")
+        if self.node_ids and self.node_ids[0] != root.node_id:
+            raise ValueError(f"Traversal state is not from root {root.node_id}")
+        resuming = self.mode is not None
+        self.mode = mode
+        return NodeIndex(root, self.node_ids, self.class_names), resuming
+
+    def to_json(self):
+        visited = None
+        if self.mode == "bfs":
+            visited = base64.b64encode(self.visited.bits).decode()
+        elif self.mode == "dfs":
+            visited = self.visited.tolist()
+        return {
+            "mode": self.mode,
+            "depth": self.depth,
+            "node_ids": self.node_ids,
+            "class_names": self.class_names,
+            "visited": visited,
+            "level": self.level.tolist(),
+            "position": self.position,
+            "next_level": self.next_level.tolist(),
+            "stack_ids": self.stack_ids.tolist(),
+            "stack_next_child": self.stack_next_child.tolist(),
+            "stack_levels": self.stack_levels.tolist(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        state = cls()
+        state.mode = data["mode"]
+        state.depth = data["depth"]
+        state.node_ids = list(data["node_ids"])
+        state.class_names = list(data["class_names"])
+        if state.mode == "bfs":
+            state.visited = Bitmap(base64.b64decode(data["visited"]))
+        elif state.mode == "dfs":
+            state.visited = array("l", data["visited"])
+        state.level = array("q", data["level"])
+        state.position = data["position"]
+        state.next_level = array("q", data["next_level"])
+        state.stack_ids = array("q", data["stack_ids"])
+        state.stack_next_child = array("q", data["stack_next_child"])
+        state.stack_levels = array("l", data["stack_levels"])
+        return state
+
+
+def _bfs(root, edge_predicate=None, max_depth=None, edge_pointer="in", state=None):
     """
     Perform a BFS, with `self` being the root node
 
+    The queue only holds interned node ids, one level at a time, and the
+    nodes are loaded again in batches as they are yielded.
+
     root (Node): root node to start traverse
     :param edge_predicate: a predicate performed on an `edge` object in
         order to decided whether to walk that edge or not
@@ -49,6 +255,8 @@ def _bfs(root, edge_predicate=None, max_depth=None, edge_pointer="in"):
                         `in`: use node.edges_in, default behavior
                         `out`: use edges_out
     :type edge_pointer: str
+    :param state: see :class:`TraversalState`
+    :type state: TraversalState
 
     :return: generator
     """
@@ -61,38 +269,61 @@ def _bfs(root, edge_predicate=None, max_depth=None, edge_pointer="in"):
     if max_depth is None:
         max_depth = float("inf")
 
-    marked = set()
-    queue = deque([(root, 0)])
-
-    marked.add(root.node_id)
-
-    while queue:
-        current, depth = queue.popleft()
+    state = TraversalState() if state is None else state
+    nodes, resuming = state.start("bfs", root)
+    if not resuming:
+        state.visited = Bitmap()
+        state.level.append(nodes.intern(root.node_id, type(root).__name__))
+        state.visited.add(state.level[0])
+    marked = state.visited
 
-        yield current
-
-        if depth + 1 > max_depth:
-            continue
+    def expand(current):
+        if state.depth + 1 > max_depth:
+            return
 
         edges = current.edges_out if edge_pointer == "out" else current.edges_in
         for edge in edges:
             if not edge_predicate(edge):
                 continue
 
-            n = edge.dst if edge_pointer == "out" else edge.src
+            n = nodes.neighbor(edge, edge_pointer)
+
+            if n not in marked:
+                state.next_level.append(n)
+                marked.add(n)
+
+    # The last node yielded before the state was saved was not expanded
+    if resuming and state.position:
+        current = nodes.node(state.level[state.position - 1])
+        if current is not None:
+            expand(current)
+
+    while state.level:
+        for current in nodes.nodes(state.level[state.position :]):
+            state.position += 1
+            if current is None:
+                continue
+
+            yield current
+
+            expand(current)
 
-            if n.node_id not in marked:
-                queue.append((n, depth + 1))
-                marked.add(n.node_id)
+        state.level, state.next_level = state.next_level, array("q")
+        state.position = 0
+        state.depth += 1
 
 
-def _dfs(root, edge_predicate=None, max_depth=None, edge_pointer="in"):
+def _dfs(root, edge_predicate=None, max_depth=None, edge_pointer="in", state=None):
     """
     Perform a DFS, with `self` being the root node
 
     To implement max depth, some node are visited more than once to update shortest
     path. But those node should only be yield once.
 
+    Visited levels are kept in an array indexed by interned node id, and
+    the stack as parallel arrays of node ids, edge positions and levels.
+    The stack only holds the current path, so its nodes are kept loaded.
+
     root (Node): root node to start traverse
     :param edge_predicate: a predicate performed on an `edge` object in
         order to decided whether to walk that edge or not
@@ -103,20 +334,37 @@ def _dfs(root, edge_predicate=None, max_depth=None, edge_pointer="in"):
                         `in`: use node.edges_in, default behavior
                         `out`: use edges_out
     :type edge_pointer: str
+    :param state: see :class:`TraversalState`
+    :type state: TraversalState
 
     :return: generator
     """
-    StackItem = namedtuple("StackItem", ["node", "next_child", "level"])
     edge_predicate = edge_predicate if callable(edge_predicate) else lambda _: True
     max_depth = float("inf") if max_depth is None else max_depth
 
-    visited = {root.node_id: 0}
-    yield root
-    stack = [StackItem(root, 0, 0)]
+    state = TraversalState() if state is None else state
+    nodes, resuming = state.start("dfs", root)
+    # Shortest level found for each interned node
+    visited = state.visited
+    if resuming:
+        # Edges may load in another order in a new session, so resumed
+        # nodes walk their edges again, skipping the visited nodes
+        state.stack_next_child = array("q", bytes(len(state.stack_next_child) * 8))
+        stack_nodes = [None] * len(state.stack_ids)
+    else:
+        visited = state.visited = array("l", [0])
+        state.stack_ids.append(nodes.intern(root.node_id, type(root).__name__))
+        state.stack_next_child.append(0)
+        state.stack_levels.append(0)
+        stack_nodes = [root]
+        yield root
 
-    while stack:
-        node, next_child, level = stack.pop()
-        if level >= max_depth:
+    while state.stack_ids:
+        i, next_child = state.stack_ids.pop(), state.stack_next_child.pop()
+        level = state.stack_levels.pop()
+        node = stack_nodes.pop()
+        node = nodes.node(i) if node is None else node
+        if level >= max_depth or node is None:
             continue
         edges = node.edges_out if edge_pointer == "out" else node.edges_in
 
@@ -127,15 +375,201 @@ def _dfs(root, edge_predicate=None, max_depth=None, edge_pointer="in"):
         )
 
         for index, edge in edges_with_index:
-            n = edge.dst if edge_pointer == "out" else edge.src
-            if n.node_id not in visited:
-                yield n
-            elif max_depth == float("inf") or level + 1 >= visited[n.node_id]:
+            n = nodes.neighbor(edge, edge_pointer)
+            new = n == len(visited)
+            if not new and (max_depth == float("inf") or level + 1 >= visited[n]):
                 continue
-            # update levels for max_depth if shorter path found
+            if new:
+                visited.append(level + 1)
+            # else update levels for max_depth if shorter path found
             # but do not yield node again
+            visited[n] = level + 1
+            # Loaded by id, as going through the edge would keep it referenced
+            # from the edge and so from the whole walked subtree
+            child = nodes.node(n)
+            if child is None:
+                continue
 
-            stack.append(StackItem(node, index + 1, level))
-            visited[n.node_id] = level + 1
-            stack.append(StackItem(n, 0, level + 1))
+            state.stack_ids.extend((i, n))
+            state.stack_next_child.extend((index + 1, 0))
+            state.stack_levels.extend((level, level + 1))
+            stack_nodes.extend((node, child))
+            if new:
+                yield child
             break
+
+
+def shortest_path(src, dst, max_depth=None, edge_predicate=None, edge_pointer="both"):
+    """
+    Finds a shortest chain of edges from node `src` to node `dst` with a
+    bidirectional BFS. Each step expands the smaller of the two frontiers
+    as a whole with a single edge query, so the number of queries is bounded
+    by the path length rather than by the number of nodes visited.
+    Args:
+        src (Node): node the path starts at
+        dst (Node): node the path ends at
+        max_depth (int): maximum number of edges in the path
+        edge_predicate (func): a predicate performed on an `edge` object in
+        order to decided whether to walk that edge or not
+        edge_pointer (str): Determines what edge direction to use, possible values are
+                        `out`: walk edges from src to dst, `in`: from dst to src,
+                        `both`: walk edges either way, default behavior
+
+    Returns:
+        list: the edges of the path in order from `src`, empty if `src` is `dst`,
+        or None if there is no path within `max_depth`
+    """
+    if edge_pointer not in PATH_DIRECTIONS:
+        raise ValueError(
+            f"edge_pointer must be one of {sorted(PATH_DIRECTIONS)}, not {edge_pointer}"
+        )
+    edge_predicate = edge_predicate if callable(edge_predicate) else lambda _: True
+    max_depth = float("inf") if max_depth is None else max_depth
+
+    session = object_session(src)
+    edge_cls = src.get_edge_class()
+    forward = PATH_DIRECTIONS[edge_pointer]
+    backward = tuple((reached, matched) for matched, reached in forward)
+
+    # node_id => (edge walked to reach it, node_id it was reached from),
+    # from src and from dst respectively
+    parents = ({src.node_id: None}, {dst.node_id: None})
+    frontiers = [[src.node_id], [dst.node_id]]
+    depths = [0, 0]
+    meeting = src.node_id if src.node_id == dst.node_id else None
+
+    while meeting is None and all(frontiers) and sum(depths) < max_depth:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        visited, other = parents[side], parents[1 - side]
+        directions = forward if side == 0 else backward
+        frontier = set(frontiers[side])
+
+        query = session.query(edge_cls).filter(
+            or_(*(getattr(edge_cls, matched).in_(frontier) for matched, _ in directions))
+        )
+        reached = []
+        for edge in query:
+            if not edge_predicate(edge):
+                continue
+            for matched, reached_id in directions:
+                node_id, n = getattr(edge, matched), getattr(edge, reached_id)
+                if node_id in frontier and n not in visited:
+                    visited[n] = (edge, node_id)
+                    reached.append(n)
+
+        frontiers[side] = reached
+        depths[side] += 1
+        # Every path through this level has the same length from this
+        # side, so the shortest is through the meeting node closest to
+        # the other side
+        met = [n for n in reached if n in other]
+        if met:
+            meeting = min(met, key=lambda n: _path_length(other, n))
+
+    if meeting is None:
+        return None
+
+    path = []
+    node_id = meeting
+    while parents[0][node_id] is not None:
+        edge, node_id = parents[0][node_id]
+        path.append(edge)
+    path.reverse()
+    node_id = meeting
+    while parents[1][node_id] is not None:
+        edge, node_id = parents[1][node_id]
+        path.append(edge)
+    return path
+
+
+def _path_length(parents, node_id):
+    length = 0
+    while parents[node_id] is not None:
+        node_id = parents[node_id][1]
+        length += 1
+    return length
+
+
+def traverse_many(roots, max_depth=None, edge_pointer="in", edge_predicate=None):
+    """
+    Performs a breadth first traversal from every node of `roots` at once.
+    Each level is expanded for all roots together with one edge query and
+    one node query, and nodes and edges fetched for one root are shared
+    with the others.
+    Args:
+        roots (list): nodes to start traversals at, all from the same session
+        max_depth (int): maximum distance to traverse
+        edge_pointer (str): Determines what edge direction to use, possible values are `in`, `out`
+                        `in`: use node.edges_in, default behavior
+        edge_predicate (func): a predicate performed on an `edge` object in
+        order to decided whether to walk that edge or not
+
+    Returns:
+        generator: (root, node, depth) of the nodes found from each root,
+        level by level
+    """
+    if edge_pointer not in ("in", "out"):
+        raise ValueError(f"edge_pointer must be 'in' or 'out', not {edge_pointer}")
+    edge_predicate = edge_predicate if callable(edge_predicate) else lambda _: True
+    max_depth = float("inf") if max_depth is None else max_depth
+
+    roots = list(roots)
+    if not roots:
+        return
+    session = object_session(roots[0])
+    edge_cls = roots[0].get_edge_class()
+    matched, reached = ("dst_id", "src_id") if edge_pointer == "in" else ("src_id", "dst_id")
+
+    nodes = {root.node_id: root for root in roots}
+    # node_id => node_ids of its neighbors, once its edges were fetched
+    neighbors = {}
+    visited = [{root.node_id} for root in roots]
+    frontiers = [[root.node_id] for root in roots]
+    for root in roots:
+        yield root, root, 0
+
+    depth = 0
+    while depth < max_depth and any(frontiers):
+        depth += 1
+        pending = {node_id for frontier in frontiers for node_id in frontier} - neighbors.keys()
+        if pending:
+            for node_id in pending:
+                neighbors[node_id] = []
+            edges = expand_level(session, edge_cls, pending, edge_pointer, edge_predicate, nodes)
+            for edge in edges:
+                neighbors[getattr(edge, matched)].append(getattr(edge, reached))
+
+        for i, root in enumerate(roots):
+            found = []
+            for node_id in frontiers[i]:
+                for n in neighbors[node_id]:
+                    if n not in visited[i]:
+                        visited[i].add(n)
+                        found.append(n)
+                        yield root, nodes[n], depth
+            frontiers[i] = found
+
+
+def expand_level(session, edge_cls, node_ids, edge_pointer, edge_predicate, nodes):
+    """Fetches the `edge_pointer` edges of `node_ids` with one query and
+    the nodes at their other ends missing from `nodes` with another
+
+    Returns:
+        list: the edges accepted by `edge_predicate`
+    """
+    matched, reached = ("dst_id", "src_id") if edge_pointer == "in" else ("src_id", "dst_id")
+    edges = session.query(edge_cls).filter(getattr(edge_cls, matched).in_(node_ids)).all()
+    _load_endpoints(session, edge_cls, edges, reached, nodes)
+    return [edge for edge in edges if edge_predicate(edge)]
+
+
+def _load_endpoints(session, edge_cls, edges, endpoint, nodes):
+    """Loads the nodes at the `endpoint` ends of `edges` missing from
+    `nodes` with one query, before any edge predicate looks at them
+
+    """
+    missing = {getattr(edge, endpoint) for edge in edges} - nodes.keys()
+    if missing:
+        node_cls = edge_cls.get_node_class()
+        for node in session.query(node_cls).filter(node_cls.node_id.in_(missing)):
+            nodes[node.node_id] = node
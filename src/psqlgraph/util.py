@@ -1,3 +1,4 @@
+import datetime
 import logging
 import random
 import time
@@ -11,6 +12,19 @@ from psqlgraph.exc import ValidationError
 #  PsqlNode modules
 DEFAULT_RETRIES = 0
 
+# Property types stored in JSONB as ISO 8601 text
+TEMPORAL_TYPES = (datetime.datetime, datetime.date)
+
+
+def storage_types(types):
+    """Return the Python types a property declared with `types` may hold
+    once stored: temporal types are kept as ISO 8601 strings.
+
+    """
+    if any(t in TEMPORAL_TYPES for t in types):
+        types = tuple(t for t in types if t not in TEMPORAL_TYPES) + (str,)
+    return types
+
 
 def validate(f, value, types, enum=None):
     """Validation decorator types for hybrid_properties"""
@@ -24,6 +38,7 @@ def validate(f, value, types, enum=None):
     if not types:
         return
 
+    types = storage_types(types)
     _types = types + (type(None),)
     if str in types:
         _types = _types + (str,)
@@ -37,6 +52,52 @@ def validate(f, value, types, enum=None):
         )
 
 
+def compile_validator(name, types, enum=None):
+    """Build the validator of a single property: a closure that raises
+    ValidationError for values `validate` would reject.  The allowed
+    types are concatenated and the enum frozen into a set once, here,
+    rather than on every call as `validate` does.
+
+    """
+    allowed = None
+    if types:
+        types = storage_types(types)
+        allowed = types + (type(None),)
+        if str in types:
+            allowed = allowed + (str,)
+
+    members = values = None
+    if enum:
+        values = tuple(enum)
+        try:
+            members = frozenset(values)
+        except TypeError:
+            members = values
+
+    def validator(value):
+        if members is not None and value is not None:
+            try:
+                valid = value in members
+            except TypeError:
+                # unhashable values cannot be looked up in the frozenset
+                valid = value in values
+            if not valid:
+                raise ValidationError(
+                    ("Value '{}' not in allowed value list for {} for property {}.").format(
+                        value, enum, name
+                    )
+                )
+        if allowed is not None and not isinstance(value, allowed):
+            raise ValidationError(
+                (
+                    "Value '{}' is of type {} and is not one of the allowed types "
+                    "for property {}: {}."
+                ).format(value, type(value), name, allowed)
+            )
+
+    return validator
+
+
 def pg_property(*pg_args, **pg_kwargs):
     if len(pg_args) == 1 and isinstance(pg_args[0], FunctionType):
         fn = pg_args[0]
@@ -71,6 +132,27 @@ def sanitize(properties):
     return sanitized
 
 
+def json_equal(a, b):
+    """Whether `a` and `b` are equal as JSONB values.  Unlike ==, a
+    boolean never equals a number (True == 1 in Python but not in
+    JSONB), while numbers compare by value as they do in JSONB.
+
+    """
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, dict):
+        if not isinstance(b, dict) or a.keys() != b.keys():
+            return False
+        return all(json_equal(v, b[k]) for k, v in a.items())
+    if isinstance(a, list):
+        if not isinstance(b, list) or len(a) != len(b):
+            return False
+        return all(json_equal(x, y) for x, y in zip(a, b))
+    if isinstance(b, (dict, list)):
+        return False
+    return a == b
+
+
 def default_backoff(retries, max_retries):
     """This is the default backoff function used in the case of a retry by
     and function wrapped with the ``@retryable`` decorator.
@@ -1,4 +1,4 @@
-from sqlalchemy import BigInteger, Column, DateTime, Text, text
+from sqlalchemy import BigInteger, Column, DateTime, Index, Text, text
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 
 from psqlgraph.base import VoidedBase
@@ -22,6 +22,8 @@ class VoidedEdge(VoidedBase):
         nullable=False,
     )
 
+    # The creation time of the edge; rows written by older versions hold
+    # the time they were voided (see history.backfill_edge_created)
     created = Column(
         DateTime(timezone=True),
         nullable=False,
@@ -55,6 +57,14 @@ class VoidedEdge(VoidedBase):
         nullable=False,
     )
 
+    # History lookups filter on the edge's src, dst and label and order
+    # by voided
+    __table_args__ = (
+        Index(
+            "_voided_edges_src_id_dst_id_label_voided_idx", src_id, dst_id, label, voided.desc()
+        ),
+    )
+
     def __init__(self, edge):
         self.created = edge.created
         self.src_id = edge.src_id
@@ -1,4 +1,4 @@
-from sqlalchemy import BigInteger, Column, DateTime, Text, text
+from sqlalchemy import BigInteger, Column, DateTime, Index, Text, text
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 
 from psqlgraph.base import VoidedBase
@@ -47,6 +47,12 @@ class VoidedNode(VoidedBase):
         nullable=False,
     )
 
+    # History lookups filter on the entity's identity and order by
+    # voided, see get_history()
+    __table_args__ = (
+        Index("_voided_nodes_node_id_label_voided_idx", node_id, label, voided.desc()),
+    )
+
     def __init__(self, node):
         self.created = node.created
         self.node_id = node.node_id
@@ -1,3 +1,5 @@
+import datetime
+
 from psqlgraph import Edge, Node, pg_property
 
 
@@ -45,6 +47,7 @@ class FakeDictionary:
             "foo_bar": {
                 "properties": {
                     "bar": {"type": "string"},
+                    "observed": {"type": "string", "format": "date-time"},
                 },
                 "links": [],
             },
@@ -122,6 +125,28 @@ class Edge5(Edge):
     __dst_src_assoc__ = "circle_2b"
 
 
+# edge6 and edge7 share a label, as edges of the same relation between
+# different node types do
+class Edge6(Edge):
+
+    __label__ = "member_of"
+
+    __src_class__ = "Circle1"
+    __dst_class__ = "Circle2"
+    __src_dst_assoc__ = "member_of_circle_2s"
+    __dst_src_assoc__ = "circle_1_members"
+
+
+class Edge7(Edge):
+
+    __label__ = "member_of"
+
+    __src_class__ = "Circle2"
+    __dst_class__ = "Circle1"
+    __src_dst_assoc__ = "member_of_circle_1s"
+    __dst_src_assoc__ = "circle_2_members"
+
+
 class TestToFooBarEdge(Edge):
 
     __src_class__ = "Test"
@@ -209,6 +234,10 @@ class FooBar(Node):
     def bar(self, value):
         self._set_property("bar", value)
 
+    @pg_property(datetime.datetime)
+    def observed(self, value):
+        self._set_property("observed", value)
+
 
 class TestDefaultValue(Node):
     __label__ = "test_default_value"
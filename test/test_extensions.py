@@ -1,4 +1,7 @@
+from test import models
+
 import pytest
+from sqlalchemy.orm import configure_mappers
 
 from psqlgraph import ext
 from psqlgraph.edge import AbstractEdge, Edge
@@ -38,3 +41,77 @@ def test_abstract_defaults():
 
     edge_cls = ext.get_abstract_edge()
     assert edge_cls == Edge
+
+
+def test_subclass_index_rebuilt_on_new_subclass():
+    node_cls, edge_cls = ext.register_base_class(package_namespace="index")
+    assert node_cls.get_subclass("index_node") is None
+    assert not node_cls.is_subclass_loaded("IndexNode")
+
+    class IndexNode(node_cls):
+        __label__ = "index_node"
+
+    class IndexEdge(edge_cls):
+        __label__ = "index_edge"
+        __src_class__ = "IndexNode"
+        __dst_class__ = "IndexNode"
+        __src_dst_assoc__ = "index_dsts"
+        __dst_src_assoc__ = "index_srcs"
+
+    assert node_cls.get_subclass("index_node") is IndexNode
+    assert node_cls.get_subclass_named("IndexNode") is IndexNode
+    assert node_cls.is_subclass_loaded("IndexNode")
+    assert edge_cls.get_subclass("index_edge") is IndexEdge
+    assert edge_cls.get_unique_subclass("index_node", "index_edge", "index_node") is IndexEdge
+    assert edge_cls._get_edges_with_src("IndexNode") == [IndexEdge]
+    assert edge_cls._get_edges_with_dst("IndexNode") == [IndexEdge]
+    assert edge_cls._get_edges_with_src("Missing") == []
+
+
+def test_subclass_index_cached():
+    index = Node.get_subclass_index()
+    assert Node.get_subclass_index() is index
+    assert Node.get_subclass_named("Foo").__name__ == "Foo"
+    with pytest.raises(KeyError):
+        Node.get_subclass_named("NotAModel")
+
+
+def test_edges_wired_after_configure():
+    node_cls, edge_cls = ext.register_base_class(package_namespace="wiring")
+
+    class WireA(node_cls):
+        pass
+
+    class WireB(node_cls):
+        pass
+
+    class WireEdge(edge_cls):
+        __src_class__ = "WireA"
+        __dst_class__ = "WireB"
+        __src_dst_assoc__ = "bs"
+        __dst_src_assoc__ = "as_"
+
+    configure_mappers()
+
+    assert WireA._edges_out == ["_WireEdge_out"]
+    assert WireB._edges_in == ["_WireEdge_in"]
+    a, b = WireA(node_id="a"), WireB(node_id="b")
+    a.bs.append(b)
+    edge = a._WireEdge_out[0]
+    assert edge.src is a
+    assert edge.dst is b
+    assert b.as_ == [a]
+    assert b.edges_in == [edge]
+
+
+def test_all_edges_wired():
+    configure_mappers()
+
+    assert models.Edge6 in Edge.get_subclasses()
+    for edge_cls in Edge.get_subclasses():
+        src_cls = Node.get_subclass_named(edge_cls.__src_class__)
+        dst_cls = Node.get_subclass_named(edge_cls.__dst_class__)
+        assert f"_{edge_cls.__name__}_out" in src_cls.__mapper__.relationships
+        assert f"_{edge_cls.__name__}_in" in dst_cls.__mapper__.relationships
+        assert hasattr(src_cls, edge_cls.__src_dst_assoc__)
+        assert hasattr(dst_cls, edge_cls.__dst_src_assoc__)
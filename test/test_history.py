@@ -0,0 +1,369 @@
+import datetime
+import uuid
+from test import models
+
+import pytest
+from sqlalchemy import inspect
+
+from psqlgraph import Edge, Node, VoidedEdge, VoidedNode, history
+from psqlgraph.base import PATCH_KEY, VoidedBase
+from psqlgraph.exc import QueryError
+
+
+def test_history_indexes(pg_driver):
+    inspector = inspect(pg_driver.engine)
+    indexes = {
+        index["name"]: index["column_names"]
+        for table in ("_voided_nodes", "_voided_edges")
+        for index in inspector.get_indexes(table)
+    }
+    assert indexes["_voided_nodes_node_id_label_voided_idx"] == ["node_id", "label", "voided"]
+    assert indexes["_voided_edges_src_id_dst_id_label_voided_idx"] == [
+        "src_id",
+        "dst_id",
+        "label",
+        "voided",
+    ]
+
+
+def test_create_history_indexes(pg_driver):
+    names = [
+        "_voided_nodes_node_id_label_voided_idx",
+        "_voided_edges_src_id_dst_id_label_voided_idx",
+    ]
+    with pg_driver.engine.begin() as conn:
+        for name in names:
+            conn.execute(f"DROP INDEX {name}")
+    assert history.create_history_indexes(pg_driver.engine) == names
+    assert history.create_history_indexes(pg_driver.engine) == names
+    test_history_indexes(pg_driver)
+
+
+@pytest.fixture()
+def partitioned_history(pg_driver):
+    engine = pg_driver.engine
+    VoidedBase.metadata.drop_all(engine)
+    assert history.create_partitioned_tables(engine) == ["_voided_nodes", "_voided_edges"]
+    yield engine
+    with engine.begin() as conn:
+        for table in history.HISTORY_TABLES:
+            for partition in ("y2000m01", "y2000m02"):
+                conn.execute(f"DROP TABLE IF EXISTS {table.name}_{partition}")
+    VoidedBase.metadata.drop_all(engine)
+    VoidedBase.metadata.create_all(engine)
+
+
+def test_partition_names():
+    assert history.partition_name(VoidedNode.__table__, datetime.date(2026, 3, 9)) == (
+        "_voided_nodes_y2026m03"
+    )
+    assert history.next_month(history.month_start(datetime.date(2026, 12, 31))) == (
+        datetime.datetime(2027, 1, 1, tzinfo=datetime.timezone.utc)
+    )
+
+
+def test_partitioned_history(pg_driver, partitioned_history):
+    engine = partitioned_history
+    assert history.create_partitioned_tables(engine) == []
+    names = history.create_partitions(engine, datetime.date(2000, 1, 15), months=2)
+    assert names == [
+        "_voided_nodes_y2000m01",
+        "_voided_edges_y2000m01",
+        "_voided_nodes_y2000m02",
+        "_voided_edges_y2000m02",
+    ]
+
+    node_id = str(uuid.uuid4())
+    with pg_driver.session_scope() as s:
+        s.add(models.Test(node_id, key1="a"))
+    with pg_driver.session_scope():
+        node = pg_driver.nodes(models.Test).ids(node_id).one()
+        node.key1 = "b"
+    with pg_driver.session_scope() as s:
+        s.query(VoidedNode).update({"voided": datetime.datetime(2000, 1, 20)})
+
+    with engine.begin() as conn:
+        assert conn.execute("SELECT count(*) FROM _voided_nodes_y2000m01").scalar() == 1
+
+    detached = history.detach_partitions(engine, datetime.date(2000, 1, 1))
+    assert detached == ["_voided_nodes_y2000m01", "_voided_edges_y2000m01"]
+    with pg_driver.session_scope() as s:
+        assert s.query(VoidedNode).count() == 0
+        assert s.query(VoidedEdge).count() == 0
+    with engine.begin() as conn:
+        assert conn.execute("SELECT count(*) FROM _voided_nodes_y2000m01").scalar() == 1
+
+
+@pytest.fixture()
+def diff_history(monkeypatch):
+    monkeypatch.setattr(models.Test, "__history_mode__", "diff")
+    monkeypatch.setattr(models.Test, "__history_checkpoint_every__", 3)
+
+
+def test_diff_history(pg_driver, diff_history):
+    node_id = str(uuid.uuid4())
+    with pg_driver.session_scope() as s:
+        s.add(models.Test(node_id, key1="v0", key2="fixed"))
+
+    expected = []
+    for i in range(1, 7):
+        with pg_driver.session_scope():
+            node = pg_driver.nodes(models.Test).ids(node_id).one()
+            expected.insert(0, (dict(node._props), dict(node._sysan)))
+            node.key1 = f"v{i}"
+            if i == 2:
+                node.key3 = "added"
+            node.sysan["round"] = i
+
+    with pg_driver.session_scope() as s:
+        rows = (
+            s.query(VoidedNode)
+            .filter(VoidedNode.node_id == node_id)
+            .order_by(VoidedNode.voided)
+            .all()
+        )
+        depths = [row.sysan.get(PATCH_KEY, {}).get("depth", 0) for row in rows]
+        assert depths == [1, 2, 0, 1, 2, 0]
+        assert rows[0].props == {"key1": "v0"}
+        assert rows[1].sysan[PATCH_KEY]["unset_properties"] == ["key3"]
+        assert rows[2].props == {"key1": "v2", "key2": "fixed", "key3": "added"}
+
+        node = pg_driver.nodes(models.Test).ids(node_id).one()
+        versions = list(history.iter_versions(s, node))
+        assert versions[0].properties == node._props
+        assert [(v.properties, v.system_annotations) for v in versions[1:]] == expected
+        assert [v.voided for v in versions[1:]] == [row.voided for row in reversed(rows)]
+
+        for row, (props, sysan) in zip(reversed(rows), expected):
+            version = history.version_at(s, node, row.voided - datetime.timedelta(microseconds=1))
+            assert (version.properties, version.system_annotations) == (props, sysan)
+        assert history.version_at(s, node, rows[-1].voided) == versions[0]
+        assert history.version_at(s, node, node.created - datetime.timedelta(days=1)) is None
+
+
+def test_diff_history_accessors(pg_driver, diff_history):
+    node_id = str(uuid.uuid4())
+    with pg_driver.session_scope() as s:
+        s.add(models.Test(node_id, key1="v0", key2="fixed"))
+    for i in range(1, 4):
+        with pg_driver.session_scope():
+            pg_driver.nodes(models.Test).ids(node_id).one().key1 = f"v{i}"
+
+    with pg_driver.session_scope() as s:
+        node = pg_driver.nodes(models.Test).ids(node_id).one()
+        voided = node._history.all()
+        assert [v.props for v in voided] == [
+            {"key1": f"v{i}", "key2": "fixed"} for i in reversed(range(3))
+        ]
+        assert all(PATCH_KEY not in v.sysan for v in voided)
+        assert node.get_history(s).first().props == {"key1": "v2", "key2": "fixed"}
+        assert node.get_history(s).count() == 3
+        # The stored patches are left as they are
+        stored = s.query(VoidedNode).filter(VoidedNode.node_id == node_id).all()
+        assert sum(PATCH_KEY in v.sysan for v in stored) == 2
+
+
+def test_diff_history_edges(pg_driver, monkeypatch):
+    monkeypatch.setattr(models.Edge1, "__history_mode__", "diff")
+    src_id, dst_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with pg_driver.session_scope() as s:
+        s.add_all([models.Test(src_id), models.Test(dst_id)])
+        s.flush()
+        s.add(models.Edge1(src_id=src_id, dst_id=dst_id, key1="a"))
+    with pg_driver.session_scope():
+        pg_driver.edges(models.Edge1).src(src_id).one().key2 = "b"
+    with pg_driver.session_scope():
+        pg_driver.edges(models.Edge1).src(src_id).one().key1 = "c"
+
+    with pg_driver.session_scope() as s:
+        edge = pg_driver.edges(models.Edge1).src(src_id).one()
+        versions = [v.properties for v in history.iter_versions(s, edge)]
+        assert versions == [
+            edge.property_template({"key1": "c", "key2": "b"}),
+            edge.property_template({"key1": "a", "key2": "b"}),
+            edge.property_template({"key1": "a"}),
+        ]
+
+
+def now(session):
+    return session.execute("SELECT now()").scalar()
+
+
+def test_as_of(pg_driver):
+    updated, deleted, created = (str(uuid.uuid4()) for _ in range(3))
+    ids = [updated, deleted, created]
+    with pg_driver.session_scope() as s:
+        s.add(models.Test(updated, key1="old"))
+        s.add(models.Foo(deleted, bar="gone"))
+        s.add(models.Edge2(src_id=updated, dst_id=deleted, system_annotations={"v": "old"}))
+    with pg_driver.session_scope() as s:
+        before = now(s)
+    with pg_driver.session_scope() as s:
+        node = pg_driver.nodes(models.Test).ids(updated).one()
+        node.key1 = "new"
+        node.sysan["touched"] = True
+        pg_driver.edges(models.Edge2).src(updated).one().sysan["v"] = "new"
+        s.add(models.Test(created, key1="later"))
+    with pg_driver.session_scope() as s:
+        s.delete(pg_driver.nodes(models.Foo).ids(deleted).one())
+
+    with pg_driver.session_scope():
+        live = pg_driver.nodes(models.Test).ids(updated).one()
+        past = pg_driver.nodes(models.Test).ids(ids).as_of(before).all()
+        assert [(n.node_id, n.key1, n.sysan) for n in past] == [(updated, "old", {})]
+        assert past[0] is not live
+        assert live.key1 == "new"
+
+        past = pg_driver.nodes().as_of(before).ids(ids).all()
+        assert sorted((n.label, n.node_id, n._props) for n in past) == [
+            ("foo", deleted, {"bar": "gone"}),
+            ("test", updated, {"key1": "old"}),
+        ]
+        assert pg_driver.nodes().ids(ids).as_of(before).props(bar="gone").count() == 1
+        assert pg_driver.nodes().ids(ids).props(bar="gone").count() == 0
+
+        edges = pg_driver.edges().src(updated).as_of(before).all()
+        assert [(type(e), e.dst_id, e.sysan) for e in edges] == [
+            (models.Edge2, deleted, {"v": "old"})
+        ]
+        assert pg_driver.edges().src(updated).count() == 0
+
+        latest = pg_driver.nodes().ids(ids).as_of(now(pg_driver.current_session())).all()
+        assert sorted(n.node_id for n in latest) == sorted([updated, created])
+
+
+def test_backfill_edge_created(pg_driver):
+    src_id, dst_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with pg_driver.session_scope() as s:
+        s.add(models.Test(src_id))
+        s.add(models.Foo(dst_id))
+        s.add(models.Edge2(src_id=src_id, dst_id=dst_id, system_annotations={"v": "old"}))
+    with pg_driver.session_scope() as s:
+        before = now(s)
+    with pg_driver.session_scope():
+        edge = pg_driver.edges(models.Edge2).src(src_id).one()
+        edge.sysan["v"] = "new"
+    with pg_driver.session_scope():
+        (voided,) = history.history_query(pg_driver.current_session(), edge).all()
+        assert voided.created == edge.created < voided.voided
+    # history rows written by older versions hold their void time
+    with pg_driver.engine.begin() as conn:
+        conn.execute(
+            VoidedEdge.__table__.update()
+            .values(created=VoidedEdge.__table__.c.voided)
+            .where(VoidedEdge.__table__.c.src_id == src_id)
+        )
+
+    def past_versions():
+        with pg_driver.session_scope():
+            return [e.sysan for e in pg_driver.edges().src(src_id).as_of(before).all()]
+
+    assert past_versions() == []
+    assert history.backfill_edge_created(pg_driver.engine, Edge) == 1
+    assert past_versions() == [{"v": "old"}]
+    assert history.backfill_edge_created(pg_driver.engine, Edge) == 0
+
+
+def test_as_of_shared_edge_label(pg_driver):
+    circle_1, circle_2 = str(uuid.uuid4()), str(uuid.uuid4())
+    with pg_driver.session_scope() as s:
+        s.add(models.Circle1(circle_1))
+        s.add(models.Circle2(circle_2))
+        s.add(models.Edge6(src_id=circle_1, dst_id=circle_2, system_annotations={"v": "6"}))
+        s.add(models.Edge7(src_id=circle_2, dst_id=circle_1, system_annotations={"v": "7"}))
+    with pg_driver.session_scope() as s:
+        before = now(s)
+    with pg_driver.session_scope():
+        for edge in pg_driver.edges().src([circle_1, circle_2]).all():
+            edge.sysan["v"] = "new"
+
+    def past_edges(query):
+        return sorted((type(e).__name__, e.src_id, e.sysan["v"]) for e in query.all())
+
+    with pg_driver.session_scope():
+        assert past_edges(pg_driver.edges(models.Edge6).as_of(before)) == [
+            ("Edge6", circle_1, "6")
+        ]
+        assert past_edges(pg_driver.edges(models.Edge7).as_of(before)) == [
+            ("Edge7", circle_2, "7")
+        ]
+        query = pg_driver.edges().src([circle_1, circle_2]).as_of(before)
+        assert past_edges(query) == sorted([("Edge6", circle_1, "6"), ("Edge7", circle_2, "7")])
+
+    # deleting a node deletes its edges, history rows are matched to the
+    # classes of their deleted endpoints
+    with pg_driver.session_scope():
+        pg_driver.node_delete(circle_1)
+    with pg_driver.session_scope():
+        query = pg_driver.edges().src([circle_1, circle_2]).as_of(before)
+        assert past_edges(query) == sorted([("Edge6", circle_1, "6"), ("Edge7", circle_2, "7")])
+        assert past_edges(pg_driver.edges(models.Edge7).as_of(before)) == [
+            ("Edge7", circle_2, "7")
+        ]
+
+
+def test_as_of_diff_history(pg_driver, diff_history):
+    with pg_driver.session_scope():
+        for query in (pg_driver.nodes(models.Test), pg_driver.nodes()):
+            with pytest.raises(QueryError):
+                query.as_of(datetime.datetime.now())
+        pg_driver.nodes(models.Foo).as_of(datetime.datetime.now()).all()
+
+
+def test_as_of_order_by(pg_driver):
+    with pg_driver.session_scope():
+        with pytest.raises(QueryError):
+            pg_driver.nodes().order_by(Node.node_id).as_of(datetime.datetime.now())
+
+
+def test_parse_policy():
+    assert history.parse_policy("*=90:365") == ("*", history.RetentionPolicy(90, 365))
+    assert history.parse_policy("case=30") == ("case", history.RetentionPolicy(30, None))
+    with pytest.raises(ValueError):
+        history.parse_policy("case")
+
+
+def test_compact_history(pg_driver):
+    now = datetime.datetime(2026, 6, 15, tzinfo=datetime.timezone.utc)
+    node_id, patched_id, foo_id = (str(uuid.uuid4()) for _ in range(3))
+
+    def rows(node_id, label, days, sysan=None):
+        return [
+            dict(
+                node_id=node_id,
+                label=label,
+                created=now - datetime.timedelta(days=1000),
+                voided=now - datetime.timedelta(days=day),
+                properties={"day": day},
+                system_annotations=sysan or {},
+            )
+            for day in days
+        ]
+
+    # Days 30 and 90 are kept, then 2026-03 is represented by day 90 and
+    # 2026-02 by day 120, and 2025 is expired
+    days = [30, 90, 91, 92, 120, 121, 400, 401]
+    with pg_driver.engine.begin() as conn:
+        table = VoidedNode.__table__
+        conn.execute(table.insert(), rows(node_id, "test", days))
+        conn.execute(table.insert(), rows(patched_id, "test", days, {PATCH_KEY: {"depth": 1}}))
+        conn.execute(table.insert(), rows(foo_id, "foo", days))
+
+    policies = dict([history.parse_policy("*=90:365"), history.parse_policy("foo=100")])
+    batches = list(history.iter_compaction(pg_driver.engine, policies, batch_size=2, now=now))
+    assert all(batch.rows <= 2 and batch.bytes > 0 for batch in batches)
+    assert history.compact_history(pg_driver.engine, policies, now=now) == (0, 0)
+
+    with pg_driver.session_scope() as s:
+
+        def kept(node_id):
+            query = s.query(VoidedNode).filter(VoidedNode.node_id == node_id)
+            return sorted(row.props["day"] for row in query)
+
+        assert kept(node_id) == [30, 90, 120]
+        assert kept(patched_id) == [30, 90, 91, 92, 120, 121]
+        assert kept(foo_id) == [30, 90, 91, 92, 120, 400]
+    assert sum(batch.rows for batch in batches) == 5 + 2 + 2
+
+    with pg_driver.engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.node_id.in_([node_id, patched_id, foo_id])))
@@ -7,6 +7,7 @@ from test import models
 import pytest
 
 from psqlgraph import Edge, Node
+from psqlgraph.hydrator import UnionFind
 from psqlgraph.mocks import GraphFactory, NodeFactory
 
 STRING_MATCH = "[a-zA-Z0-9]{32}"
@@ -163,6 +164,32 @@ def test_graph_factory_random_subgraph(gdcmodels, gdcdictionary, patched_randran
     assert_all_node_types_created_once(nodes)
 
 
+def test_graph_factory_random_subgraph_edges(
+    pg_driver, gdcmodels, gdcdictionary, patched_randrange
+):
+    gf = GraphFactory(gdcmodels, gdcdictionary)
+
+    # FooBar.bar is not nullable
+    nodes = gf.create_random_subgraph("foo_bar", all_props=True)
+
+    edges = {(e.label, e.src_id, e.dst_id) for n in nodes for e in n.edges_out}
+    for node in nodes:
+        for edge in node.edges_out:
+            assert edge.src is node
+            assert edge in edge.dst.edges_in
+    assert len(edges) == 2
+
+    with pg_driver.session_scope() as s:
+        s.add_all(nodes)
+
+    with pg_driver.session_scope():
+        stored = {
+            (e.label, e.src_id, e.dst_id)
+            for e in pg_driver.edges().filter(Edge.src_id.in_([n.node_id for n in nodes]))
+        }
+    assert stored == edges
+
+
 def test_graph_factory_with_globals(gdcmodels, gdcdictionary, patched_randrange):
 
     graph_globals = {
@@ -345,3 +372,14 @@ def test_graph_factory_with_ambiguous_edges(
 
     assert len(circle_1.edges_out + circle_1.edges_in) == 1
     assert len(circle_2.edges_out + circle_2.edges_in) == 1
+
+
+def test_union_find():
+    merged = UnionFind()
+    merged.union("a", "b")
+    merged.union("c", "d")
+    merged.union("b", "d")
+    assert {merged.find(key) for key in "abcd"} == {"a"}
+    assert merged.find("e") == "e"
+    merged.union("a", "c")
+    assert merged.find("d") == "a"
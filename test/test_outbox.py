@@ -0,0 +1,113 @@
+import uuid
+from test import models
+
+import pytest
+
+from psqlgraph import PsqlGraphDriver, outbox
+
+
+@pytest.fixture()
+def outbox_driver(pg_conf, pg_driver):
+    outbox.drop_outbox(pg_driver.engine)
+    outbox.create_outbox(pg_driver.engine)
+    driver = PsqlGraphDriver(outbox=True, **pg_conf)
+    yield driver
+    driver.engine.dispose()
+    outbox.drop_outbox(pg_driver.engine)
+
+
+def changes(batches):
+    return [
+        (row.op, row.label, row.node_id or (row.src_id, row.dst_id), row.properties)
+        for batch in batches
+        for row in batch
+    ]
+
+
+def test_outbox_records_changes(outbox_driver):
+    node_id, other_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with outbox_driver.session_scope() as s:
+        s.add(models.Test(node_id, key1="a"))
+        s.add(models.Test(other_id))
+        s.add(models.Edge1(src_id=node_id, dst_id=other_id))
+    with outbox_driver.session_scope():
+        node = outbox_driver.nodes(models.Test).ids(node_id).one()
+        node.key1 = "a"
+        node.key2 = "b"
+        node.sysan["indexed"] = False
+        # Unchanged values are not an update
+        outbox_driver.nodes(models.Test).ids(other_id).one().key1 = None
+    with outbox_driver.session_scope():
+        outbox_driver.node_delete(node_id)
+
+    consumer = outbox.OutboxConsumer(outbox_driver.engine, "indexer", batch_size=2)
+    batches = list(consumer.batches())
+    assert [len(batch) for batch in batches] == [2, 2, 2]
+    assert sorted(changes(batches[:2])) == sorted(
+        [
+            ("insert", "edge1", (node_id, other_id), []),
+            ("insert", "test", node_id, ["key1"]),
+            ("insert", "test", other_id, []),
+            ("update", "test", node_id, ["key2"]),
+        ]
+    )
+    assert batches[1][-1].system_annotations == ["indexed"]
+    assert sorted(changes(batches[2:])) == [
+        ("delete", "edge1", (node_id, other_id), []),
+        ("delete", "test", node_id, ["key1", "key2"]),
+    ]
+    assert len({row.txid for batch in batches for row in batch}) == 3
+
+    consumer.ack(batches[0])
+    assert consumer.fetch() == batches[1]
+    consumer.ack(batches[-1])
+    assert consumer.fetch() == []
+    assert outbox.prune(outbox_driver.engine) == 6
+
+
+def test_outbox_stream_wakeup(outbox_driver):
+    consumer = outbox.OutboxConsumer(outbox_driver.engine, "indexer")
+    consumer.listen()
+    try:
+        assert not consumer.wait(timeout=0)
+        with outbox_driver.session_scope() as s:
+            s.add(models.Test(str(uuid.uuid4())))
+        assert consumer.wait(timeout=5)
+
+        streamed = []
+        for batch in consumer.stream(timeout=0):
+            streamed.extend(batch)
+            consumer.ack(batch)
+        assert [row.op for row in streamed] == ["insert"]
+    finally:
+        consumer.close()
+
+
+def test_outbox_disabled(pg_driver):
+    with pg_driver.session_scope() as s:
+        s.add(models.Test(str(uuid.uuid4())))
+        assert outbox.OUTBOX_ROWS not in s.info
+
+
+def test_outbox_failed_flush(outbox_driver, monkeypatch):
+    node_id, other_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with outbox_driver.session_scope() as s:
+        s.add(models.Test(node_id, key1="a"))
+
+    def fail(*args):
+        raise RuntimeError("hook failed")
+
+    monkeypatch.setattr(models.Test, "_session_hooks_before_update", [fail])
+    with outbox_driver.session_scope() as s:
+        outbox_driver.nodes(models.Test).ids(node_id).one().key1 = "b"
+        with pytest.raises(RuntimeError):
+            s.flush()
+        assert outbox.OUTBOX_ROWS not in s.info
+        s.rollback()
+        s.add(models.Test(other_id))
+
+    consumer = outbox.OutboxConsumer(outbox_driver.engine, "indexer")
+    assert [(op, node) for op, _, node, _ in changes(consumer.batches())] == [
+        ("insert", node_id),
+        ("insert", other_id),
+    ]
@@ -0,0 +1,200 @@
+import copy
+import json
+import pickle
+from test import models
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import configure_mappers
+
+from psqlgraph.base import PropertyMeta
+from psqlgraph.exc import ValidationError
+from psqlgraph.util import compile_validator
+
+
+@pytest.fixture(scope="module", autouse=True)
+def configured():
+    configure_mappers()
+
+
+@pytest.mark.parametrize(
+    "model, expected",
+    [
+        (models.Test, ["key1", "key2", "key3", "new_key", "timestamp"]),
+        (models.Foo, ["ages", "bar", "baz", "fobble", "studies"]),
+        (models.Edge1, ["key1", "key2", "test"]),
+        (models.Circle1, []),
+    ],
+)
+def test_property_list(model, expected):
+    assert model.get_property_list() == expected
+    assert all(model.has_property(key) for key in expected)
+    assert not model.has_property("not_a_property")
+
+
+def test_property_list_is_a_copy():
+    models.Test.get_property_list().append("mutated")
+    assert not models.Test.has_property("mutated")
+
+
+def test_property_meta():
+    meta = models.Foo.get_property_meta()
+    assert meta["baz"] == PropertyMeta("baz", (), frozenset({"allowed_1", "allowed_2"}), False)
+    assert meta["fobble"].types == (int,)
+    assert models.FooBar.get_property_meta()["bar"].nonnull
+    with pytest.raises(TypeError):
+        meta["new"] = None
+
+
+def test_property_template():
+    assert models.Foo().property_template({"bar": "x"}) == {
+        "ages": None,
+        "bar": "x",
+        "baz": None,
+        "fobble": None,
+        "studies": None,
+    }
+
+
+def test_set_properties():
+    node = models.Foo(node_id="a", bar="old")
+    props = node._props
+    node.set_properties({"bar": "new", "fobble": 25})
+    assert node._props == {"bar": "new", "fobble": 25}
+    assert props == {"bar": "old"}, "the previous _props should not be mutated"
+
+
+def test_set_properties_is_atomic():
+    node = models.Foo(node_id="a", bar="old")
+    with pytest.raises(ValidationError):
+        node.set_properties({"bar": "new", "fobble": "not an int"})
+    with pytest.raises(AttributeError):
+        node.set_properties({"bar": "new", "not_a_property": 1})
+    assert node._props == {"bar": "old"}
+
+
+def test_set_properties_single_assignment():
+    node = models.Foo(node_id="a")
+    assignments = []
+
+    def on_set(target, value, oldvalue, initiator):
+        assignments.append(value)
+
+    event.listen(models.Foo._props, "set", on_set)
+    try:
+        node.properties.update({"bar": "x", "fobble": 21, "baz": "allowed_1"})
+    finally:
+        event.remove(models.Foo._props, "set", on_set)
+    assert assignments == [{"bar": "x", "fobble": 21, "baz": "allowed_1"}]
+
+
+def test_setters_see_staged_properties():
+    node = models.Foo(node_id="a", bar="old")
+    with node._batched_properties():
+        node.bar = "new"
+        assert node.bar == "new"
+        assert node._props == {"bar": "old"}
+    assert node._props == {"bar": "new"}
+
+
+def test_properties_view_is_lazy(monkeypatch):
+    node = models.Foo(node_id="a", bar="x")
+    view = node.properties
+    monkeypatch.setattr(node, "property_template", None)
+    assert view["bar"] == "x"
+    assert view["fobble"] is None
+    assert "fobble" in view
+    with pytest.raises(KeyError):
+        view["not_a_property"]
+
+
+def test_properties_view_follows_reassignment():
+    node = models.Foo(node_id="a", bar="x")
+    view = node.properties
+    assert dict(view) == node.property_template({"bar": "x"})
+    node.bar = "y"
+    assert view["bar"] == "y"
+    assert dict(view) == node.property_template({"bar": "y"})
+    node._props = {"fobble": 21}
+    assert view == node.property_template({"fobble": 21})
+
+
+def test_properties_view_follows_batch():
+    node = models.Foo(node_id="a", bar="x")
+    with node._batched_properties():
+        view = node.properties
+        assert dict(view)["bar"] == "x"
+        node.bar = "y"
+    assert dict(view)["bar"] == "y"
+    assert dict(node.properties)["bar"] == "y"
+
+
+def test_properties_view_cannot_delete():
+    node = models.Foo(node_id="a", bar="x")
+    for delete in (lambda p: p.pop("bar"), lambda p: p.clear(), lambda p: p.__delitem__("bar")):
+        with pytest.raises(RuntimeError):
+            delete(node.properties)
+    assert node.properties["bar"] == "x"
+
+
+def test_views_serialize():
+    node = models.Foo(node_id="a", bar="x", system_annotations={"k": "v"})
+    assert json.loads(json.dumps(node.properties)) == node.property_template({"bar": "x"})
+    assert json.loads(json.dumps(node.system_annotations)) == {"k": "v"}
+    assert pickle.loads(pickle.dumps(node.system_annotations)) == {"k": "v"}
+
+
+def test_views_of_copied_node_write_through():
+    node = models.Foo(node_id="a", bar="x", system_annotations={"k": "v"})
+    node.properties["fobble"], node.system_annotations["k"]
+    for copied in (pickle.loads(pickle.dumps(node)), copy.copy(node)):
+        copied.properties["bar"] = "y"
+        copied.system_annotations["k"] = "w"
+        assert copied._props["bar"] == "y"
+        assert copied._sysan["k"] == "w"
+
+
+def test_system_annotations_view_follows_reassignment():
+    node = models.Foo(node_id="a")
+    view = node.system_annotations
+    view["k"] = "v"
+    assert view == {"k": "v"}
+    node.system_annotations = {"other": 1}
+    assert view["other"] == 1
+    assert "k" not in view
+
+
+def test_system_annotations_view_writes_through():
+    node = models.Foo(node_id="a", system_annotations={"a": 1, "b": 2, "c": 3})
+    view = node.system_annotations
+    assert view.pop("a") == 1
+    assert view.pop("a", None) is None
+    assert view.popitem() == ("c", 3)
+    assert view.setdefault("d", 4) == 4
+    assert view.setdefault("d", 5) == 4
+    del view["d"]
+    assert node._sysan == {"b": 2}
+    view.clear()
+    assert node._sysan == {}
+    assert dict(view) == {}
+    with pytest.raises(KeyError):
+        del view["b"]
+
+
+def test_compiled_validator():
+    validator = compile_validator("key", (int,), enum=[1, 2])
+    validator(1)
+    validator(None)
+    with pytest.raises(ValidationError):
+        validator(3)
+    with pytest.raises(ValidationError):
+        compile_validator("key", (int,))("1")
+    compile_validator("key", (list,), enum=[[1], [2]])([1])
+
+
+def test_validate_many():
+    models.Foo.validate_many([{"bar": "x", "baz": "allowed_1"}, {"baz": None}, {}])
+    with pytest.raises(ValidationError):
+        models.Foo.validate_many([{"baz": "allowed_1"}, {"baz": "not allowed"}])
+    with pytest.raises(AttributeError):
+        models.Foo.validate_many([{"not_a_property": 1}])
@@ -8,7 +8,8 @@ from test import PsqlgraphBaseTest, models
 import pytest
 import sqlalchemy as sa
 
-from psqlgraph import PsqlGraphDriver
+from psqlgraph import PsqlGraphDriver, hooks
+from psqlgraph.base import VOIDED_SNAPSHOTS
 from psqlgraph.exc import SessionClosedError, ValidationError
 
 logging.basicConfig(level=logging.DEBUG)
@@ -317,6 +318,89 @@ class TestPsqlGraphDriver(PsqlgraphBaseTest):
             a.sysan["key"] = 3
             a = s.merge(a)
 
+    def test_snapshots_batched_per_flush(self):
+        nodes = [models.Test(str(uuid.uuid4()), key2=i) for i in range(5)]
+        with self.g.session_scope() as s:
+            s.add_all(nodes)
+
+        inserts = []
+
+        def capture(conn, cursor, statement, *args):
+            if statement.startswith("INSERT INTO _voided_nodes"):
+                inserts.append(statement)
+
+        sa.event.listen(self.g.engine, "before_cursor_execute", capture)
+        self.addCleanup(sa.event.remove, self.g.engine, "before_cursor_execute", capture)
+        with self.g.session_scope() as s:
+            for node in self.g.nodes(models.Test).ids([n.node_id for n in nodes]):
+                node.key2 += 10
+        self.assertEqual(len(inserts), 1)
+
+        with self.g.session_scope():
+            for node in self.g.nodes(models.Test).ids([n.node_id for n in nodes]):
+                voided = node._history.one()
+                self.assertEqual(voided.properties["key2"], node.key2 - 10)
+                self.assertEqual(voided.created, node.created)
+
+    def test_noop_updates_skipped(self):
+        node_id = str(uuid.uuid4())
+        with self.g.session_scope() as s:
+            s.add(models.Test(node_id, key1="a", system_annotations={"flag": True, "n": 1}))
+
+        writes = []
+
+        def capture(conn, cursor, statement, *args):
+            if statement.startswith(("UPDATE", "INSERT INTO _voided_nodes")):
+                writes.append(statement)
+
+        hook_calls = []
+
+        def record(target, *args):
+            hook_calls.append(target)
+
+        before_update = models.Test._session_hooks_before_update
+        models.Test._session_hooks_before_update = [record]
+        self.addCleanup(setattr, models.Test, "_session_hooks_before_update", before_update)
+        sa.event.listen(self.g.engine, "before_cursor_execute", capture)
+        self.addCleanup(sa.event.remove, self.g.engine, "before_cursor_execute", capture)
+
+        with self.g.session_scope() as s:
+            node = self.g.nodes(models.Test).ids(node_id).one()
+            # Assigned dicts merge onto the existing ones
+            node.system_annotations = {"n": 1.0}
+            node._props = {"key1": "a"}
+            s.flush()
+            self.assertEqual(s.info[hooks.SKIPPED_UPDATES], 1)
+        self.assertEqual(writes, [])
+        self.assertEqual(hook_calls, [])
+
+        with self.g.session_scope():
+            self.g.nodes(models.Test).ids(node_id).one().system_annotations = {"flag": 1}
+        self.assertEqual(len(writes), 2)
+        with self.g.session_scope():
+            node = self.g.nodes(models.Test).ids(node_id).one()
+            self.assertEqual(node._history.one().sysan, {"flag": True, "n": 1})
+            self.assertEqual(node.sysan, {"flag": 1, "n": 1})
+
+    def test_failed_flush_drops_queued_snapshots(self):
+        node_id = str(uuid.uuid4())
+        with self.g.session_scope() as s:
+            s.add(models.Test(node_id, key1="a"))
+
+        def fail(*args):
+            raise RuntimeError("hook failed")
+
+        before_update = models.Test._session_hooks_before_update
+        models.Test._session_hooks_before_update = [fail]
+        self.addCleanup(setattr, models.Test, "_session_hooks_before_update", before_update)
+
+        with self.g.session_scope() as s:
+            self.g.nodes(models.Test).ids(node_id).one().key1 = "b"
+            with self.assertRaises(RuntimeError):
+                s.flush()
+            self.assertNotIn(VOIDED_SNAPSHOTS, s.info)
+            s.rollback()
+
     def test_session_closing(self):
         with self.g.session_scope():
             nodes = self.g.nodes()
@@ -1,10 +1,14 @@
+import datetime
 import logging
 import uuid
 from test import PsqlgraphBaseTest, models
 
 import pytest
+from sqlalchemy import event
 
 from psqlgraph import PolyEdge, PolyNode
+from psqlgraph.exc import QueryError
+from psqlgraph.query import Explain
 
 logging.basicConfig(level=logging.INFO)
 
@@ -134,6 +138,111 @@ class TestPsqlGraphDriver(PsqlgraphBaseTest):
                 self.g.nodes(models.Foo).count(),
             )
 
+    def _planned_tables(self, query):
+        def relations(plan):
+            yield plan.get("Relation Name")
+            for child in plan.get("Plans", []):
+                yield from relations(child)
+
+        plan = query.session.execute(Explain(query.statement)).scalar()
+        return set(relations(plan[0]["Plan"])) - {None}
+
+    def test_src_node_prunes_edge_tables(self):
+        with self.g.session_scope():
+            parent = self.g.nodes(models.Test).ids(self.parent_id).one()
+            q = self.g.edges().src(parent)
+            self.assertEqual(q.count(), self.g.edges().src(self.parent_id).count())
+            self.assertEqual(q.count(), 8)
+            self.assertEqual(
+                self._planned_tables(q),
+                {
+                    models.Edge1.__tablename__,
+                    models.Edge2.__tablename__,
+                    models.TestToFooBarEdge.__tablename__,
+                },
+            )
+
+    def test_src_class_prunes_edge_tables(self):
+        with self.g.session_scope():
+            self.assertEqual(self.g.edges().src(self.parent_id, src_class=models.Foo).count(), 0)
+            self.assertEqual(self.g.edges().dst(self.parent_id, dst_class="Test").count(), 0)
+
+    def test_labels(self):
+        with self.g.session_scope():
+            q = self.g.edges().labels("edge1").src(self.parent_id)
+            self.assertEqual(q.count(), 4)
+            self.assertEqual(self._planned_tables(q), {models.Edge1.__tablename__})
+            self.assertEqual(
+                self.g.nodes().labels("foo").count(), self.g.nodes(models.Foo).count()
+            )
+            self.assertEqual(self.g.nodes(models.Foo).labels("test").count(), 0)
+
+    def test_with_no_subclasses(self):
+        with self.g.session_scope():
+            self.assertEqual(self.g.edges().with_subclasses([]).count(), 0)
+            self.assertEqual(self.g.nodes().labels("not_a_label").count(), 0)
+
+    def test_edge_lookup_endpoint_labels(self):
+        with self.g.session_scope():
+            edges = self.g.edge_lookup(src_id=self.parent_id, dst_label="foo").all()
+            self.assertEqual(len(edges), 4)
+            self.assertTrue(all(isinstance(e, models.Edge2) for e in edges))
+            self.assertEqual(self.g.edge_lookup(src_label="foo", dst_label="test").count(), 0)
+
+    def _capture_statements(self):
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.g.engine, "before_cursor_execute", capture)
+        self.addCleanup(event.remove, self.g.engine, "before_cursor_execute", capture)
+        return statements
+
+    def test_with_all_edges(self):
+        with self.g.session_scope():
+            statements = self._capture_statements()
+            nodes = self.g.nodes(models.Test).with_all_edges().all()
+            # the Foo ends of Edge2 are the only endpoints not in the result
+            self.assertEqual(len(statements), 4)
+
+            edges = {node.node_id: list(node.get_edges()) for node in nodes}
+            self.assertEqual(len(statements), 4)
+
+            parent = next(node for node in nodes if node.node_id == self.parent_id)
+            self.assertEqual(len(edges[self.parent_id]), 8)
+            self.assertEqual(len(parent._Edge2_out), 4)
+            self.assertEqual(parent.edges_in, [])
+            self.assertTrue(all(edge.src is parent for edge in parent.edges_out))
+            self.assertEqual(edges[self.lone_id], [])
+
+    def test_with_all_edges_direction(self):
+        with self.g.session_scope():
+            statements = self._capture_statements()
+            nodes = self.g.nodes().ids(self.parent_id).with_all_edges("out").all()
+            self.assertEqual(len(statements), 3)
+            self.assertEqual(len(nodes[0].edges_out), 8)
+            with self.assertRaises(QueryError):
+                self.g.nodes().with_all_edges("sideways")
+
+    def test_node_load_all_edges(self):
+        with self.g.session_scope():
+            parent = self.g.nodes(models.Test).ids(self.parent_id).one()
+            statements = self._capture_statements()
+            parent.load_all_edges()
+            self.assertEqual(len(list(parent.get_edges())), 8)
+            self.assertEqual(len(statements), 3)
+
+    def test_with_all_edges_association_proxies(self):
+        with self.g.session_scope():
+            parent = self.g.nodes(models.Test).ids(self.parent_id).with_all_edges().one()
+            statements = self._capture_statements()
+            self.assertEqual({foo.bar for foo in parent.foos}, {0, 1, 2, 3})
+            self.assertEqual(len(parent.tests), 4)
+            self.assertEqual(len(parent.sub_tests), 0)
+            self.assertTrue(all(foo.label == "foo" for foo in parent.foos))
+            self.assertEqual(statements, [])
+
 
 @pytest.mark.parametrize("node_type", [models.Foo, models.Node])
 @pytest.mark.parametrize(
@@ -158,3 +267,212 @@ def test__props_in__int(pg_driver, samples_with_array, node_type):
         # fobble is type int
         r = pg_driver.nodes(node_type).prop_in("fobble", [25]).count()
         assert r == 3
+
+
+@pytest.fixture()
+def ranged_nodes(pg_driver):
+    foos = [models.Foo(node_id=str(uuid.uuid4()), fobble=f) for f in (3, 21, 25, 100)]
+    tests = [
+        models.Test(node_id=str(uuid.uuid4()), timestamp=f"2020-0{m}-15T00:00:00+00:00")
+        for m in (1, 2, 3)
+    ]
+    with pg_driver.session_scope() as s:
+        s.add_all(foos + tests)
+    yield foos, tests
+
+    with pg_driver.session_scope():
+        for node in foos + tests:
+            pg_driver.node_delete(node_id=node.node_id)
+
+
+@pytest.mark.parametrize("node_type", [models.Foo, models.Node])
+@pytest.mark.parametrize(
+    "method, args, expected",
+    [
+        ("prop_lt", (25,), {3, 21}),
+        ("prop_le", (25,), {3, 21, 25}),
+        ("prop_gt", (21,), {25, 100}),
+        ("prop_ge", (21,), {21, 25, 100}),
+        ("prop_between", (4, 99), {21, 25}),
+    ],
+)
+def test__prop_comparison__numeric(pg_driver, ranged_nodes, node_type, method, args, expected):
+    with pg_driver.session_scope():
+        q = getattr(pg_driver.nodes(node_type), method)("fobble", *args)
+        assert {n["fobble"] for n in q.all()} == expected
+
+
+def test__prop_comparison__timestamp(pg_driver, ranged_nodes):
+    _, tests = ranged_nodes
+    low = datetime.datetime(2020, 1, 31, tzinfo=datetime.timezone.utc)
+    high = datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)
+    with pg_driver.session_scope():
+        nodes = pg_driver.nodes(models.Test).prop_between("timestamp", low, high).all()
+        assert [n.node_id for n in nodes] == [tests[1].node_id]
+
+
+def test__order_by_prop(pg_driver, ranged_nodes):
+    with pg_driver.session_scope():
+        q = pg_driver.nodes(models.Foo).order_by_prop("fobble")
+        assert [n["fobble"] for n in q.all()] == [3, 21, 25, 100]
+        q = pg_driver.nodes(models.Foo).order_by_prop("fobble", descending=True)
+        assert [n["fobble"] for n in q.all()] == [100, 25, 21, 3]
+
+
+@pytest.fixture()
+def observed_nodes(pg_driver):
+    # In chronological order, which differs from the lexical order of
+    # the strings because of the UTC offsets
+    observed = [
+        "2020-01-15T08:00:00+09:00",
+        "2020-01-15T00:00:00+00:00",
+        "2020-01-14T22:00:00-05:00",
+        "2020-01-15T06:00:00+02:00",
+        "2020-01-15T05:00:00Z",
+    ]
+    nodes = [
+        models.FooBar(node_id=f"observed_{i}", bar="bar", observed=value)
+        for i, value in reversed(list(enumerate(observed)))
+    ]
+    with pg_driver.session_scope() as s:
+        s.add_all(nodes)
+    yield [f"observed_{i}" for i in range(len(observed))]
+
+    with pg_driver.session_scope():
+        for node in nodes:
+            pg_driver.node_delete(node_id=node.node_id)
+
+
+@pytest.mark.parametrize("node_type", [models.FooBar, models.Node])
+def test__order_by_prop__mixed_offsets(pg_driver, observed_nodes, node_type):
+    with pg_driver.session_scope():
+        q = pg_driver.nodes(node_type).ids(observed_nodes)
+        assert [n.node_id for n in q.order_by_prop("observed").all()] == observed_nodes
+        q = q.order_by_prop("observed", descending=True)
+        assert [n.node_id for n in q.all()] == observed_nodes[::-1]
+
+
+def test__prop_comparison__mixed_offsets(pg_driver, observed_nodes):
+    bound = datetime.datetime(2020, 1, 15, 3, 30, tzinfo=datetime.timezone.utc)
+    with pg_driver.session_scope():
+        nodes = pg_driver.nodes(models.FooBar).prop_lt("observed", bound).all()
+        assert {n.node_id for n in nodes} == set(observed_nodes[:3])
+
+
+def test__iter_pages__mixed_offsets(pg_driver, observed_nodes):
+    with pg_driver.session_scope():
+        pages = list(pg_driver.nodes(models.FooBar).iter_pages(2, key="observed"))
+    assert [len(p.items) for p in pages] == [2, 2, 1]
+    assert [n.node_id for p in pages for n in p.items] == observed_nodes
+
+
+@pytest.fixture()
+def paged_nodes(pg_driver):
+    foos = [models.Foo(node_id=f"page_{i:02}", fobble=i % 4) for i in range(10)]
+    with pg_driver.session_scope() as s:
+        s.add_all(foos)
+    yield foos
+
+    with pg_driver.session_scope():
+        for node in foos:
+            pg_driver.node_delete(node_id=node.node_id)
+
+
+@pytest.mark.parametrize("node_type", [models.Foo, models.Node])
+def test__iter_pages__node_id(pg_driver, paged_nodes, node_type):
+    with pg_driver.session_scope():
+        pages = list(pg_driver.nodes(node_type).iter_pages(3))
+    assert [len(p.items) for p in pages] == [3, 3, 3, 1]
+    assert [n.node_id for p in pages for n in p.items] == [n.node_id for n in paged_nodes]
+
+
+def test__iter_pages__property_key(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        pages = list(pg_driver.nodes(models.Foo).iter_pages(4, key="fobble"))
+    actual = [(n.fobble, n.node_id) for p in pages for n in p.items]
+    assert actual == sorted((n.fobble, n.node_id) for n in paged_nodes)
+
+
+def test__iter_pages__resume(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        first = next(pg_driver.nodes(models.Foo).iter_pages(4, key="fobble"))
+        rest = list(pg_driver.nodes(models.Foo).iter_pages(4, key="fobble", cursor=first.cursor))
+        after = pg_driver.nodes(models.Foo).after(first.cursor).all()
+    resumed = [n.node_id for p in rest for n in p.items]
+    assert resumed == [n.node_id for n in after]
+    assert len(first.items) + len(resumed) == len(paged_nodes)
+
+
+def test__before_after__range(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        q = pg_driver.nodes(models.Foo)
+        start = q.cursor_for(paged_nodes[2])
+        stop = q.cursor_for(paged_nodes[6])
+        nodes = q.after(start).before(stop).all()
+    assert [n.node_id for n in nodes] == [n.node_id for n in paged_nodes[3:6]]
+
+
+def test__before_after__replaces_ordering(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        q = pg_driver.nodes(models.Foo).order_by(models.Foo.node_id.desc())
+        start = q.cursor_for(paged_nodes[2])
+        stop = q.cursor_for(paged_nodes[6])
+        nodes = q.after(start).before(stop).all()
+    assert [n.node_id for n in nodes] == [n.node_id for n in paged_nodes[3:6]]
+
+
+def test__iter_pages__shared_identities(pg_driver):
+    with pg_driver.session_scope() as s:
+        s.add_all(
+            [
+                models.Test(node_id="page_src"),
+                models.Foo(node_id="page_dst", bar="bar"),
+                models.FooBar(node_id="page_dst", bar="bar"),
+            ]
+        )
+        s.flush()
+        s.add(models.Edge2(src_id="page_src", dst_id="page_dst"))
+        s.add(models.TestToFooBarEdge(src_id="page_src", dst_id="page_dst"))
+
+    with pg_driver.session_scope():
+        pages = list(pg_driver.edges().src("page_src").iter_pages(1, key="src_id"))
+        labels = sorted(e.label for p in pages for e in p.items)
+    assert labels == sorted([models.Edge2.get_label(), models.TestToFooBarEdge.get_label()])
+
+    # page_dst is the node_id of a Foo and of a FooBar, which tie on both
+    # node_id and bar
+    expected = {"node_id": [("foo", "page_dst"), ("foo_bar", "page_dst"), ("test", "page_src")]}
+    expected["bar"] = expected["node_id"][:2]
+    for key, nodes in expected.items():
+        with pg_driver.session_scope():
+            q = pg_driver.nodes().ids(["page_src", "page_dst"])
+            pages = list(q.iter_pages(1, key=key))
+            paged = [(n.label, n.node_id) for p in pages for n in p.items]
+        assert all(len(p.items) == 1 for p in pages)
+        assert sorted(paged) == nodes
+
+    with pg_driver.session_scope():
+        for node in pg_driver.nodes().ids(["page_src", "page_dst"]):
+            pg_driver.node_delete(node=node)
+
+
+def test__iter_pages__cursor_key_mismatch(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        page = next(pg_driver.nodes(models.Foo).iter_pages(4, key="fobble"))
+        with pytest.raises(QueryError):
+            next(pg_driver.nodes(models.Foo).iter_pages(4, cursor=page.cursor))
+
+
+def test__estimate_count(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        pg_driver.engine.execute("ANALYZE")
+        q = pg_driver.nodes(models.Foo).props(bar=None)
+        assert isinstance(q.estimate_count(), int)
+        assert pg_driver.nodes().estimate_count() >= 0
+
+
+def test__count__exact_below(pg_driver, paged_nodes):
+    with pg_driver.session_scope():
+        q = pg_driver.nodes(models.Foo).prop_lt("fobble", 2)
+        assert q.count(exact_below=10**9) == q.count() == 6
+        assert q.count(exact_below=0) == q.estimate_count()
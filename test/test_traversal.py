@@ -1,9 +1,12 @@
+import json
 import uuid
 from test import models
 
 import pytest
+from sqlalchemy import event
 
-from psqlgraph import Edge, Node
+from psqlgraph import Edge, Node, traversals
+from psqlgraph.subgraph import Subgraph
 
 
 def no_allowed_2_please(edge):
@@ -231,3 +234,265 @@ def test_traversal__path_bottom_up(fake_nodes, fake_graph, mode, key, expected):
         leaf = fake_graph.nodes().props(key1=key).first()
         actual = [node.node_id for node in leaf.traverse(mode=mode, edge_pointer="out")]
         assert actual == expected
+
+
+@pytest.fixture
+def snapshot(fake_nodes, fake_graph):
+    pytest.importorskip("numpy")
+    from psqlgraph.snapshot import GraphSnapshot
+
+    return GraphSnapshot.load(fake_graph)
+
+
+@pytest.mark.parametrize("depth", [0, 1, 2, 3, None])
+@pytest.mark.parametrize("mode", ("bfs", "dfs"))
+def test_snapshot__max_depth(snapshot, fake_nodes, mode, depth):
+    traversal = snapshot.traverse("root", mode=mode, max_depth=depth)
+    expected = fake_nodes["depths_results"].get(depth, fake_nodes["depths_results"][3])
+    assert len(traversal) == len(expected)
+    assert set(traversal) == {n.node_id for n in expected}
+    assert traversal[0] == "root"
+
+
+@pytest.mark.parametrize("mode", ("bfs", "dfs"))
+def test_snapshot__path_bottom_up(snapshot, mode):
+    assert snapshot.traverse("test5", mode=mode, edge_pointer="out") == [
+        "test5",
+        "test2",
+        "foo1",
+        "root",
+    ]
+
+
+def test_snapshot__edge_labels(snapshot):
+    assert len(snapshot) == 13
+    assert snapshot.edge_count == 16
+    assert sorted(snapshot.neighbors("root")) == ["", "foo1", "foo2", "foo3", "foo4"]
+    assert sorted(snapshot.neighbors("root", edge_labels=["testtofoobaredge"])) == [""]
+    # Only Test -> Test edges
+    reachable = snapshot.reachable(["test7"], edge_labels=["edge1"])
+    assert sorted(snapshot.node_ids[reachable]) == ["test7", "test8"]
+    assert snapshot.reachable(["foo1"], max_depth=1).sum() == 3
+
+
+def test_snapshot__escaped_ids(fake_nodes, fake_graph):
+    pytest.importorskip("numpy")
+    from psqlgraph.snapshot import GraphSnapshot
+
+    node_id = "back\\slash\ttab"
+    with fake_graph.session_scope() as s:
+        s.add(models.Test(node_id))
+        s.flush()
+        s.add(models.Edge1(src_id=node_id, dst_id="test7"))
+
+    snapshot = GraphSnapshot.load(fake_graph)
+    assert node_id in snapshot.node_ids
+    assert sorted(snapshot.neighbors("test7")) == sorted([node_id, "test8"])
+
+
+def test_snapshot__save_open(snapshot, tmp_path):
+    import numpy as np
+
+    from psqlgraph.snapshot import GraphSnapshot
+
+    snapshot.save(tmp_path)
+    opened = GraphSnapshot.open(tmp_path)
+    assert isinstance(opened.out_indices, np.memmap)
+    assert opened.edge_labels == snapshot.edge_labels
+    for mode in ("bfs", "dfs"):
+        assert opened.traverse("root", mode=mode) == snapshot.traverse("root", mode=mode)
+
+
+def path_ids(path):
+    return [(edge.src_id, edge.dst_id) for edge in path]
+
+
+@pytest.mark.parametrize(
+    "src,dst,edge_pointer,max_depth,expected",
+    (
+        ("test5", "root", "out", None, [("test5", "test2"), ("test2", "foo1"), ("foo1", "root")]),
+        ("root", "test5", "in", None, [("foo1", "root"), ("test2", "foo1"), ("test5", "test2")]),
+        ("test6", "root", "out", None, [("test6", "foo3"), ("foo3", "root")]),
+        (
+            "test3",
+            "test5",
+            "both",
+            5,
+            [
+                ("test3", "foo2"),
+                ("foo2", "root"),
+                ("foo1", "root"),
+                ("test2", "foo1"),
+                ("test5", "test2"),
+            ],
+        ),
+        ("test3", "test5", "both", 4, None),
+        ("test7", "test7", "out", None, []),
+        ("root", "test5", "out", None, None),
+    ),
+)
+def test_shortest_path(fake_nodes, fake_graph, src, dst, edge_pointer, max_depth, expected):
+    with fake_graph.session_scope():
+        src, dst = (fake_graph.nodes().ids(node_id).one() for node_id in (src, dst))
+        path = src.shortest_path(dst, max_depth=max_depth, edge_pointer=edge_pointer)
+        assert (path if path is None else path_ids(path)) == expected
+
+
+def test_shortest_path__edge_predicate(fake_nodes, fake_graph):
+    with fake_graph.session_scope():
+        src, dst = (fake_graph.nodes().ids(node_id).one() for node_id in ("test6", "root"))
+        path = src.shortest_path(dst, edge_predicate=lambda e: "foo3" not in (e.src_id, e.dst_id))
+        test4 = fake_nodes["depths_results"][2][8]
+        assert path_ids(path) == [("test6", test4.node_id), (test4.node_id, ""), ("", "root")]
+
+
+@pytest.fixture
+def statements(fake_graph):
+    executed = []
+
+    def count(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(fake_graph.engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(fake_graph.engine, "before_cursor_execute", count)
+
+
+@pytest.mark.parametrize("edge_pointer", ("in", "out"))
+def test_traverse_many(fake_nodes, fake_graph, statements, edge_pointer):
+    with fake_graph.session_scope():
+        roots = fake_graph.nodes().ids(["root", "foo1", "test5", "test7"]).all()
+        del statements[:]
+        found = list(traversals.traverse_many(roots, max_depth=3, edge_pointer=edge_pointer))
+        # One edge query and at most one node query per level
+        assert len(statements) <= 2 * 3
+
+        for root in roots:
+            traversal = root.traverse(max_depth=3, edge_pointer=edge_pointer)
+            assert [n for r, n, _ in found if r is root][0] is root
+            assert {n.node_id for r, n, _ in found if r is root} == {n.node_id for n in traversal}
+
+    depths = {n.node_id: d for r, n, d in found if r.node_id == "test5"}
+    assert depths == (
+        {"test5": 0} if edge_pointer == "in" else {"test5": 0, "test2": 1, "foo1": 2, "root": 3}
+    )
+
+
+def test_traverse_many__edge_predicate(fake_nodes, fake_graph):
+    with fake_graph.session_scope():
+        roots = fake_graph.nodes().ids(["root", "foo1"]).all()
+        found = traversals.traverse_many(roots, edge_predicate=no_allowed_2_please)
+        by_root = {}
+        for root, node, _ in found:
+            by_root.setdefault(root.node_id, set()).add(node.node_id)
+        assert by_root == {
+            root.node_id: {n.node_id for n in root.traverse(edge_predicate=no_allowed_2_please)}
+            for root in roots
+        }
+        assert by_root["root"] == {n.node_id for n in fake_nodes["sysan_flag_nodes"]}
+
+
+def test_traverse_many__workers(fake_nodes, fake_graph):
+    with fake_graph.session_scope():
+        roots = fake_graph.nodes().ids(["root", "foo1", "test5"]).all()
+        found = list(fake_graph.traverse_many(roots, workers=2, max_depth=2))
+        expected = list(fake_graph.traverse_many(roots, max_depth=2))
+        assert all(any(r is root for root in roots) for r, _, _ in found)
+        assert sorted((r.node_id, n.node_id, d) for r, n, d in found) == sorted(
+            (r.node_id, n.node_id, d) for r, n, d in expected
+        )
+
+
+def test_bitmap():
+    bitmap = traversals.Bitmap()
+    for i in (0, 7, 8, 1000):
+        assert i not in bitmap
+        bitmap.add(i)
+    assert all(i in bitmap for i in (0, 7, 8, 1000))
+    assert not any(i in bitmap for i in (1, 9, 999, 1001, 10**6))
+
+
+def test_extract_subgraph(fake_nodes, fake_graph, statements):
+    with fake_graph.session_scope():
+        root = fake_graph.nodes(models.FooBar).first()
+        del statements[:]
+        subgraph = root.extract_subgraph()
+        # One edge query and one node query per level, plus the last
+        # level's edge query finding nothing new
+        assert len(statements) <= 2 * 4 + 1
+        expected = {n.node_id: n.to_json() for n in root.traverse()}
+        edges = {(e.src_id, e.dst_id): e.to_json() for e in fake_graph.edges()}
+
+    assert subgraph.nodes[0].node_id == "root"
+    assert {n.node_id: n._asdict() for n in subgraph.nodes} == expected
+    assert {(e.src_id, e.dst_id): e._asdict() for e in subgraph.edges} == edges
+    assert len(subgraph.edges) == 16
+
+
+def test_extract_subgraph__max_depth(fake_nodes, fake_graph):
+    with fake_graph.session_scope():
+        leaf = fake_graph.nodes().ids("test5").one()
+        subgraph = leaf.extract_subgraph(max_depth=2, edge_pointer="out")
+    assert [n.node_id for n in subgraph.nodes] == ["test5", "test2", "foo1"]
+    assert [(e.src_label, e.label, e.dst_label) for e in subgraph.edges] == [
+        ("test", "edge1", "test"),
+        ("test", "test_edge_2", "foo"),
+    ]
+
+
+@pytest.mark.parametrize("fmt", ("ndjson", "msgpack"))
+def test_subgraph_serialization(fake_nodes, fake_graph, tmp_path, fmt):
+    if fmt == "msgpack":
+        pytest.importorskip("msgpack")
+    with fake_graph.session_scope():
+        subgraph = fake_graph.nodes(models.FooBar).first().extract_subgraph(max_depth=1)
+
+    path = tmp_path / f"subgraph.{fmt}"
+    with open(path, "w" if fmt == "ndjson" else "wb") as f:
+        getattr(subgraph, f"write_{fmt}")(f)
+    with open(path, "r" if fmt == "ndjson" else "rb") as f:
+        loaded = getattr(Subgraph, f"read_{fmt}")(f)
+
+    assert loaded.nodes == subgraph.nodes
+    assert loaded.edges == subgraph.edges
+    nodes = [Node.from_json(record._asdict()) for record in loaded.nodes]
+    edges = [Edge.from_json(record._asdict()) for record in loaded.edges]
+    assert {type(n) for n in nodes} == {models.FooBar, models.Foo, models.Test}
+    assert {type(e) for e in edges} == {models.Edge3, models.TestToFooBarEdge}
+
+
+@pytest.mark.parametrize("max_depth", (None, 2))
+@pytest.mark.parametrize("mode", ("bfs", "dfs"))
+def test_traversal__resume(fake_nodes, fake_graph, mode, max_depth):
+    with fake_graph.session_scope():
+        root = fake_graph.nodes(models.FooBar).first()
+        expected = [n.node_id for n in root.traverse(mode=mode, max_depth=max_depth)]
+
+    for stop in range(1, len(expected) + 1):
+        state = traversals.TraversalState()
+        with fake_graph.session_scope():
+            root = fake_graph.nodes(models.FooBar).first()
+            traversal = root.traverse(mode=mode, max_depth=max_depth, state=state)
+            first = [next(traversal).node_id for _ in range(stop)]
+        checkpoint = json.loads(json.dumps(state.to_json()))
+
+        with fake_graph.session_scope():
+            root = fake_graph.nodes(models.FooBar).first()
+            state = traversals.TraversalState.from_json(checkpoint)
+            rest = [n.node_id for n in root.traverse(mode=mode, max_depth=max_depth, state=state)]
+
+        assert len(first + rest) == len(expected)
+        assert set(first + rest) == set(expected)
+        if mode == "bfs":
+            assert first + rest == expected
+
+
+def test_traversal__resume_mismatch(fake_nodes, fake_graph):
+    state = traversals.TraversalState()
+    with fake_graph.session_scope():
+        root = fake_graph.nodes(models.FooBar).first()
+        next(root.traverse(state=state))
+        with pytest.raises(ValueError):
+            next(root.traverse(mode="dfs", state=state))
+        with pytest.raises(ValueError):
+            next(fake_graph.nodes().ids("foo1").one().traverse(state=state))
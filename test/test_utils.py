@@ -1,7 +1,26 @@
+import pytest
+
 from psqlgraph import sanitize
+from psqlgraph.util import json_equal
 
 
 def test_sanitize():
     props = dict(state="PASSED", versions=["a", "b"])
     sprops = sanitize(props)
     assert props["state"] == sprops["state"]
+
+
+@pytest.mark.parametrize(
+    "a, b, equal",
+    [
+        ({"a": 1, "b": [1, "x"]}, {"b": [1.0, "x"], "a": 1.0}, True),
+        ({"a": True}, {"a": 1}, False),
+        ({"a": [0]}, {"a": [False]}, False),
+        ({"a": None}, {}, False),
+        ({"a": [1, 2]}, {"a": [2, 1]}, False),
+        ({"a": {"b": None}}, {"a": {"b": None}}, True),
+    ],
+)
+def test_json_equal(a, b, equal):
+    assert json_equal(a, b) is equal
+    assert json_equal(b, a) is equal